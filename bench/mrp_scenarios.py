@@ -0,0 +1,167 @@
+# mrp_scenarios.py
+# ---------------------------------------------------------
+# Synthetic MRP dataset and the requests that exercise every route in
+# mrp/app.py. Imported by worker.py inside the MRP process only.
+#
+# The BOM is layered: level 0 components are built from base items, and
+# every component on level k uses at least one component from level k-1,
+# so top-level SKUs explode through ``bom_depth`` levels.
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from databases import get_engine, BaseItem, Component, ComponentBOM, ProductionTask, WorkCenter
+import ledger
+
+CHUNK = 10000
+
+
+def _chunks(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= CHUNK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(params, rng):
+    """Generate the dataset; returns row counts."""
+    n_base, n_comp = params["base_items"], params["components"]
+    depth, fanout = max(params["bom_depth"], 1), max(params["bom_fanout"], 1)
+    vendors = [f"Vendor {v:02d}" for v in range(1, 21)]
+    centers = [f"WC-{c:02d}" for c in range(1, 9)]
+
+    base_names = [f"BASE-{i:06d}" for i in range(n_base)]
+    levels = [[] for _ in range(depth)]
+    for i in range(n_comp):
+        levels[i * depth // n_comp].append(f"SKU-{i:06d}")
+
+    bom_rows = []
+    for level, skus in enumerate(levels):
+        for sku in skus:
+            for name in rng.sample(base_names, min(rng.randint(1, fanout), n_base)):
+                bom_rows.append({"parent_sku": sku, "child_sku": name, "qty_per": rng.randint(1, 5),
+                                 "source_type": "base"})
+            if level:
+                below = levels[level - 1]
+                for child in rng.sample(below, min(rng.randint(1, fanout), len(below))):
+                    bom_rows.append({"parent_sku": sku, "child_sku": child, "qty_per": rng.randint(1, 3),
+                                     "source_type": "component"})
+
+    now = datetime.now()
+    top = levels[-1] + levels[max(depth - 2, 0)]
+    statuses = ["pending"] * 8 + ["completed"] * 2
+
+    base_rows = [{"name": name, "vendor": rng.choice(vendors), "unit_price": round(rng.uniform(0.1, 50), 2),
+                  "qty_in_stock": rng.randint(0, 5000)} for name in base_names]
+    comp_rows = [{"sku": sku, "name": f"Assembly {sku}", "lead_time": rng.randint(1, 8),
+                  "qty_in_stock": rng.randint(0, 50), "work_center": rng.choice(centers + [None])}
+                 for skus in levels for sku in skus]
+
+    with get_engine().begin() as conn:
+        conn.execute(insert(WorkCenter), [{"name": c, "capacity": rng.randint(1, 4)} for c in centers])
+        conn.execute(insert(BaseItem), base_rows)
+        conn.execute(insert(Component), comp_rows)
+        ledger.append_movements(conn, [("base", r["name"], ledger.OPENING, r["qty_in_stock"], "bench")
+                                       for r in base_rows] +
+                                      [("component", r["sku"], ledger.OPENING, r["qty_in_stock"], "bench")
+                                       for r in comp_rows])
+        for batch in _chunks(bom_rows):
+            conn.execute(insert(ComponentBOM), batch)
+        for batch in _chunks(
+            {"component_sku": rng.choice(top), "quantity": rng.randint(1, 20), "status": rng.choice(statuses),
+             "created_at": (now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))).strftime("%Y-%m-%d %H:%M")}
+            for _ in range(params["tasks"])
+        ):
+            conn.execute(insert(ProductionTask), batch)
+
+    return {"base_items": n_base, "components": n_comp, "bom_lines": len(bom_rows), "tasks": params["tasks"]}
+
+
+def context(rng):
+    """Keys the scenarios pick from, read back from the (possibly reused) database."""
+    with get_engine().connect() as conn:
+        base = conn.execute(BaseItem.__table__.select().with_only_columns(BaseItem.id, BaseItem.name)).all()
+        skus = [r[0] for r in conn.execute(Component.__table__.select().with_only_columns(Component.sku))]
+    return {"base": base, "skus": skus, "top": skus[-max(len(skus) // 10, 1):]}
+
+
+def _task_status(task_id):
+    with get_engine().connect() as conn:
+        return conn.execute(select(ProductionTask.status).where(ProductionTask.id == task_id)).scalar()
+
+
+def _next_pending(rng, handed_out):
+    """A task that is pending now and was not handed to an earlier request, or None."""
+    query = select(ProductionTask.id).where(ProductionTask.status == "pending",
+                                            ProductionTask.id.not_in(handed_out))
+    with get_engine().connect() as conn:
+        n = conn.execute(select(func.count()).select_from(query.subquery())).scalar()
+        if not n:
+            return None
+        task_id = conn.execute(query.order_by(ProductionTask.id).offset(rng.randrange(n)).limit(1)).scalar()
+    handed_out.add(task_id)
+    return task_id
+
+
+def scenarios(ctx, rng, tag=""):
+    """``[(name, build)]`` in run order; ``build(i)`` returns one request. Reads come before writes.
+
+    The admin, schedule and procurement forms report through their flash
+    category; ``check``, where given, confirms a write that doesn't. New
+    SKUs carry ``tag`` so two runs on one database never collide.
+    """
+    base, skus, top = ctx["base"], ctx["skus"], ctx["top"]
+    handed_out = set()
+
+    def get(path):
+        return lambda i: {"method": "GET", "path": path}
+
+    def pick(seq, i):
+        return seq[i % len(seq)]
+
+    def complete(i):
+        task_id = _next_pending(rng, handed_out)
+        return {"method": "POST", "path": "/schedule/complete", "data": {"task_ids[]": [task_id or ""]},
+                "check": lambda: _task_status(task_id) == "completed"}
+
+    return [
+        ("index", get("/")),
+        ("admin", get("/admin")),
+        ("bom_explode_sku", lambda i: {"method": "GET", "path": f"/bom/explode?sku={pick(top, i)}&qty=10"}),
+        ("bom_explode_schedule", get("/bom/explode")),
+        ("bom_where_used", lambda i: {"method": "GET", "path": f"/bom/where-used?sku={pick(base, i)[1]}"}),
+        ("where_used_view", lambda i: {"method": "GET", "path": f"/where-used?sku={pick(base, i)[1]}"}),
+        ("procurement", get("/procurement")),
+        ("schedule", get("/schedule")),
+        ("schedule_pending", get("/schedule?view=pending")),
+        ("schedule_overdue", get("/schedule?view=overdue")),
+        ("schedule_sku", lambda i: {"method": "GET", "path": f"/schedule?view=pending&sku={pick(top, i)}"}),
+        ("schedule_archived", get("/schedule?view=completed&archived=1")),
+        ("components_search", lambda i: {"method": "GET", "path": f"/components/search?q={pick(skus, i)[:-2]}"}),
+        ("stock_at", lambda i: {"method": "GET", "path": f"/stock/at?sku={pick(skus, i)}"}),
+        ("simulate_what_if", lambda i: {"method": "POST", "path": "/simulate",
+                                        "json": {"scenarios": [{"label": "base"},
+                                                               {"demand": {pick(top, i): 2}},
+                                                               {"lead_time": {"*": 1.5}}]}}),
+        ("stock_movements", lambda i: {"method": "GET", "path": f"/stock/movements?name={pick(base, i)[1]}"}),
+        ("procurement_purchase", lambda i: {"method": "POST", "path": "/procurement",
+                                            "data": {"item_id": pick(base, i)[0], "qty": 10}}),
+        ("admin_lead_time", lambda i: {"method": "POST", "path": "/admin",
+                                       "data": {"form_type": "lead_time", "sku": pick(skus, i),
+                                                "lead_time": rng.randint(1, 8)}}),
+        ("schedule_add_task", lambda i: {"method": "POST", "path": "/schedule",
+                                         "data": {"form_type": "add_task", "component_sku": pick(top, i),
+                                                  "qty": rng.randint(1, 10)}}),
+        ("schedule_complete", complete),
+        ("admin_add_component", lambda i: {"method": "POST", "path": "/admin",
+                                           "data": {"form_type": "component", "sku": f"BENCH-{tag}-{i}",
+                                                    "comp_name": f"Bench {i}", "lead_time": 2,
+                                                    "child_sku[]": [pick(top, i), pick(base, i)[1]],
+                                                    "qty_per[]": ["1", "2"],
+                                                    "source_type[]": ["component", "base"]}}),
+    ]
@@ -0,0 +1,133 @@
+# pos_scenarios.py
+# ---------------------------------------------------------
+# Synthetic POS dataset and the requests that exercise every route in
+# pos/app.py. Imported by worker.py inside the POS process only.
+#
+# Transactions are spread evenly over ``days`` of history with their
+# lines, then the report rollups are rebuilt from them.
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, func, select
+
+from databases import get_engine, Product, Transaction, TransactionLine
+import reports
+
+CHUNK = 10000
+PAYMENT_TYPES = ["Cash", "Credit Card", "Debit Card", "E-Wallet"]
+TAX_RATE = 0.1
+
+
+def seed(params, rng):
+    """Generate the dataset; returns row counts."""
+    n_products, n_trans = params["products"], params["transactions"]
+    max_lines = max(params["lines_per_transaction"], 1)
+    products = [(f"P{i:06d}", f"Product {i}", round(rng.uniform(0.5, 99), 2)) for i in range(1, n_products + 1)]
+
+    with get_engine().begin() as conn:
+        conn.execute(insert(Product), [
+            {"product_id": pid, "product_name": name, "unit_price": price} for pid, name, price in products])
+
+    start = datetime.now() - timedelta(days=params["days"])
+    step = timedelta(days=params["days"]) / max(n_trans, 1)
+    n_lines = 0
+    for first in range(1, n_trans + 1, CHUNK):
+        headers, lines = [], []
+        for tid in range(first, min(first + CHUNK, n_trans + 1)):
+            when = start + step * tid
+            subtotal = 0.0
+            for pid, name, price in rng.sample(products, min(rng.randint(1, max_lines), n_products)):
+                qty = rng.randint(1, 4)
+                subtotal += qty * price
+                lines.append({"transaction_id": tid, "transaction_date": when, "product_id": pid,
+                              "product_name": name, "quantity": qty, "unit_price": price})
+            tax = subtotal * TAX_RATE
+            headers.append({"id": tid, "transaction_date": when, "subtotal": subtotal, "tax": tax,
+                            "total": subtotal + tax, "payment_amount": subtotal + tax, "change_amount": 0.0,
+                            "payment_type": rng.choice(PAYMENT_TYPES)})
+        with get_engine().begin() as conn:
+            conn.execute(insert(Transaction), headers)
+            conn.execute(insert(TransactionLine), lines)
+        n_lines += len(lines)
+
+    reports.rebuild_rollups()
+    return {"products": n_products, "transactions": n_trans, "transaction_lines": n_lines}
+
+
+def context(rng):
+    """Keys the scenarios pick from, read back from the (possibly reused) database."""
+    with get_engine().connect() as conn:
+        products = [r[0] for r in conn.execute(select(Product.product_id))]
+        n = conn.execute(select(func.count(Transaction.id))).scalar()
+        middle = conn.execute(
+            select(Transaction.transaction_date, Transaction.id)
+            .order_by(Transaction.transaction_date, Transaction.id).offset(n // 2).limit(1)).first()
+    week_ago = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+    return {"products": products, "middle": middle, "week_ago": week_ago}
+
+
+def _product_pk(product_id):
+    with get_engine().connect() as conn:
+        return conn.execute(select(Product.id).where(Product.product_id == product_id)).scalar() or 0
+
+
+def scenarios(ctx, rng, tag=""):
+    """``[(name, build)]`` in run order; ``build(i)`` returns one request. Reads come before writes.
+
+    ``check``, where given, confirms a write that only answers with a
+    redirect. New product ids carry ``tag`` so two runs on one database
+    never collide.
+    """
+    products, middle, week_ago = ctx["products"], ctx["middle"], ctx["week_ago"]
+    deep_page = f"/transactions?before={middle[0].isoformat()}_{middle[1]}" if middle else "/transactions"
+
+    def get(path):
+        return lambda i: {"method": "GET", "path": path}
+
+    def pick(i):
+        return products[i % len(products)]
+
+    def basket(i):
+        return [{"product_id": products[(i * 7 + k) % len(products)], "quantity": k + 1} for k in range(3)]
+
+    return [
+        ("index", get("/")),
+        ("admin", get("/admin")),
+        ("customer", lambda i: {"method": "GET", "path": "/customer", "headers": {"X-Terminal-Id": f"view-{i}"}}),
+        ("transactions", get("/transactions")),
+        ("transactions_filtered", get("/transactions?payment_type=Cash&min_total=50")),
+        ("transactions_deep_page", get(deep_page)),
+        ("export_week_csv", get(f"/transactions/export?start={week_ago}")),
+        ("export_week_lines_gzip", get(f"/transactions/export?start={week_ago}&format=lines&gzip=1")),
+        ("reports", get("/reports")),
+        ("api_reports_daily", get("/api/reports/daily")),
+        ("api_reports_hourly", get("/api/reports/hourly")),
+        ("api_reports_payment_mix", get("/api/reports/payment_mix")),
+        ("api_reports_top_products", get("/api/reports/top_products")),
+        ("api_products", get("/api/products")),
+        ("api_scan", lambda i: {"method": "GET", "path": f"/api/scan/{pick(i)}"}),
+        ("api_product_sales", lambda i: {"method": "GET", "path": f"/api/products/{pick(i)}/sales"}),
+        ("api_cart_add", lambda i: {"method": "POST", "path": "/api/cart/add", "json": {"items": basket(i)},
+                                    "headers": {"X-Terminal-Id": f"lane-{i}"}}),
+        ("api_cart", lambda i: {"method": "GET", "path": "/api/cart", "headers": {"X-Terminal-Id": f"lane-{i}"}}),
+        ("api_cart_remove", lambda i: {"method": "POST", "path": "/api/cart/remove",
+                                       "json": {"items": basket(i)[:1]}, "headers": {"X-Terminal-Id": f"lane-{i}"}}),
+        ("api_checkout", lambda i: {"method": "POST", "path": "/api/checkout", "json": {"payment_type": "Cash"},
+                                    "headers": {"X-Terminal-Id": f"lane-{i}"}}),
+        ("customer_add_to_cart", lambda i: {"method": "POST", "path": "/customer/add_to_cart",
+                                            "data": {"product_id": pick(i)}, "headers": {"X-Terminal-Id": f"web-{i}"}}),
+        ("customer_checkout", lambda i: {"method": "POST", "path": "/customer/checkout",
+                                         "data": {"payment_type": "Credit Card"},
+                                         "headers": {"X-Terminal-Id": f"web-{i}"}}),
+        ("customer_remove_from_cart", lambda i: {"method": "POST", "path": f"/customer/remove_from_cart/{pick(i)}",
+                                                 "headers": {"X-Terminal-Id": f"web-{i}"}}),
+        ("api_cart_clear", lambda i: {"method": "DELETE", "path": "/api/cart",
+                                      "headers": {"X-Terminal-Id": f"lane-{i}"}}),
+        ("admin_add_product", lambda i: {"method": "POST", "path": "/admin/add_product",
+                                         "data": {"product_id": f"BENCH-{tag}-{i}", "product_name": f"Bench {i}",
+                                                  "unit_price": "1.99"},
+                                         "check": lambda: _product_pk(f"BENCH-{tag}-{i}") != 0}),
+        ("admin_delete_product", lambda i: {"method": "POST",
+                                            "path": f"/admin/delete_product/{_product_pk(f'BENCH-{tag}-{i}')}",
+                                            "check": lambda: _product_pk(f"BENCH-{tag}-{i}") == 0}),
+    ]
@@ -0,0 +1,217 @@
+# run.py
+# ---------------------------------------------------------
+# Load and benchmark suite for the MRP and POS apps.
+#
+#   python bench/run.py                          both apps, "small" scale
+#   python bench/run.py --scale large --app pos  millions of transactions
+#   python bench/run.py --mode http --concurrency 16
+#   python bench/run.py --compare bench/results/<baseline>.json
+#
+# Each app is seeded with a synthetic dataset in a fresh database (one
+# kept with --data-dir, or an in-memory one with --memory) and runs in its
+# own process via worker.py. Every
+# route is driven through the Flask test client (single client, no
+# network) and/or over HTTP by --concurrency threads against a threaded
+# server in the same process. The HTTP clients share the server's GIL,
+# so HTTP numbers are for comparing runs, not for capacity planning.
+#
+# Each mode gets a new process and the database as seeded: a copy of the
+# seeded file (which the write routes never touch, so --data-dir reruns
+# start from the same rows), or a fresh in-memory seed.
+#
+# Results (p50/p95/p99, throughput, SQL statements per request, peak
+# RSS) are written to bench/results/<timestamp>.json. The run exits 1
+# when any request failed, and with --compare when any route's p95 or
+# throughput regressed by more than --tolerance.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from contextlib import closing
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APPS = ("mrp", "pos")
+
+SCALES = {
+    "small": {"base_items": 200, "components": 400, "bom_depth": 4, "bom_fanout": 3, "tasks": 1000,
+              "products": 200, "transactions": 20000, "lines_per_transaction": 4, "days": 90},
+    "medium": {"base_items": 2000, "components": 4000, "bom_depth": 6, "bom_fanout": 4, "tasks": 10000,
+               "products": 2000, "transactions": 500000, "lines_per_transaction": 5, "days": 365},
+    "large": {"base_items": 10000, "components": 20000, "bom_depth": 8, "bom_fanout": 5, "tasks": 50000,
+              "products": 10000, "transactions": 2000000, "lines_per_transaction": 5, "days": 730},
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_app(app_name, params, data_dir, memory=False):
+    """Seed (unless reusing data) and benchmark one app, each mode in its own process; returns its results."""
+    seeded = os.path.join(data_dir, f"{app_name}.db")
+    result = None
+    if not memory and not os.path.exists(seeded):
+        result = run_worker(app_name, params, data_dir, "sqlite:///" + seeded, reseed=True)
+
+    for mode in params["modes"]:
+        if memory:
+            mode_result = run_worker(app_name, params, data_dir, "memory", reseed=True, mode=mode)
+        else:
+            working = os.path.join(data_dir, f"{app_name}-{mode}.db")
+            copy_database(seeded, working)
+            try:
+                mode_result = run_worker(app_name, params, data_dir, "sqlite:///" + working, reseed=False, mode=mode)
+            finally:
+                remove_database(working)
+        if result is None:
+            result = mode_result
+        else:
+            result["modes"].update(mode_result["modes"])
+            result["peak_rss_mb"] = max(filter(None, (result["peak_rss_mb"], mode_result["peak_rss_mb"])),
+                                        default=None)
+    return result
+
+
+def run_worker(app_name, params, data_dir, url, reseed, mode=None):
+    """One worker.py process against ``url``: seeds when ``reseed``, then benchmarks ``mode`` if given."""
+    env = dict(os.environ)
+    env[f"{app_name.upper()}_DATABASE_URL"] = url
+    env["MRP_POS_BRIDGE_SECONDS"] = "0"       # the bench MRP must not drain a real POS outbox
+
+    out = os.path.join(data_dir, f"{app_name}-result.json")
+    print(f"▶ {app_name}: {'seeding' if reseed else 'seeded data'}{f', {mode} mode' if mode else ''} ({url})",
+          file=sys.stderr)
+    subprocess.run(
+        [sys.executable, os.path.join(BENCH_DIR, "worker.py"), "--app", app_name,
+         "--params", json.dumps(dict(params, reseed=reseed)), "--out", out] + (["--mode", mode] if mode else []),
+        cwd=os.path.join(REPO_DIR, app_name), env=env, check=True,
+    )
+    with open(out) as f:
+        return json.load(f)
+
+
+def copy_database(source, target):
+    """Copy a SQLite file with the online backup API, so pages still in its WAL come along."""
+    remove_database(target)
+    with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(target)) as dst:
+        src.backup(dst)
+
+
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def failures(results):
+    """``(app, mode, route, failed, requests)`` for every route with a failed request."""
+    return [(app_name, mode, route, stats["failed"], stats["requests"])
+            for app_name, app_result in results["apps"].items()
+            for mode, routes in app_result["modes"].items()
+            for route, stats in routes.items() if stats["failed"]]
+
+
+def compare(current, baseline, tolerance):
+    """Print per-route changes against ``baseline``; returns the regressions."""
+    regressions = []
+    for app_name, app_result in current["apps"].items():
+        base_app = baseline.get("apps", {}).get(app_name)
+        if not base_app:
+            continue
+        for mode, routes in app_result["modes"].items():
+            base_routes = base_app.get("modes", {}).get(mode, {})
+            for route, stats in routes.items():
+                before = base_routes.get(route)
+                if not before or not before.get("p95_ms") or not before.get("throughput_rps"):
+                    continue
+                p95 = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+                rps = (stats["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"]
+                flag = p95 > tolerance or rps < -tolerance
+                print(f"{'✗' if flag else ' '} {app_name:3s} {mode:6s} {route:28s} "
+                      f"p95 {before['p95_ms']:9.2f} → {stats['p95_ms']:9.2f} ms ({p95:+.0%})  "
+                      f"{before['throughput_rps']:8.1f} → {stats['throughput_rps']:8.1f} req/s ({rps:+.0%})")
+                if flag:
+                    regressions.append((app_name, mode, route))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MRP and POS apps.")
+    parser.add_argument("--app", choices=APPS + ("all",), default="all")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    for key, value in SCALES["small"].items():
+        parser.add_argument("--" + key.replace("_", "-"), type=int, help=f"override the scale preset ({key})")
+    parser.add_argument("--mode", choices=["client", "http", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=50, help="measured requests per route and mode")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured requests per route first")
+    parser.add_argument("--concurrency", type=int, default=8, help="HTTP clients")
+    parser.add_argument("--only", nargs="*", help="run only these scenario names")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for the dataset and requests")
+    parser.add_argument("--data-dir", help="keep the seeded databases here and reuse them on the next run")
+    parser.add_argument("--memory", action="store_true", help="seed in-memory databases (no disk I/O)")
+    parser.add_argument("--out", help="results file (default bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression, as a fraction")
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    for key in params:
+        override = getattr(args, key)
+        if override is not None:
+            params[key] = override
+    params.update(scale=args.scale, requests=args.requests, warmup=args.warmup, concurrency=args.concurrency,
+                  seed=args.seed, only=args.only,
+                  modes=["client", "http"] if args.mode == "both" else [args.mode])
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        results = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "apps": {name: run_app(name, params, data_dir, args.memory)
+                     for name in (APPS if args.app == "all" else [args.app])},
+        }
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    out = args.out or os.path.join(BENCH_DIR, "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {out}", file=sys.stderr)
+
+    failed = failures(results)
+    for app_name, mode, route, n, requests in failed:
+        print(f"✗ {app_name:3s} {mode:6s} {route:28s} {n} of {requests} request(s) failed", file=sys.stderr)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    if failed:
+        sys.exit(f"❌ {len(failed)} route(s) had failed requests; their timings are not comparable")
+    if regressions:
+        sys.exit(f"❌ {len(regressions)} route(s) regressed by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# worker.py
+# ---------------------------------------------------------
+# Runs one app's benchmark inside that app's process (both apps have a
+# top-level ``databases`` module, so they cannot share one). Started by
+# run.py with the app directory as cwd and the database URL in the
+# environment, once to seed and once per --mode, each on a database as
+# seeded; writes its results as JSON to --out.
+#
+# Every request carries an X-Bench-Scenario header. A WSGI middleware
+# counts the SQL statements executed until the response body is closed,
+# so streamed exports are counted in full in both modes. A request fails
+# unless it answers below 400, flashes only "success" messages and
+# passes its scenario's own check; run.py reports every failed request,
+# so a write that took an error path is not mistaken for a fast one.
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+try:
+    import resource
+except ImportError:         # Windows
+    resource = None
+
+APP_DIR = os.getcwd()
+sys.path.insert(0, APP_DIR)
+
+from flask import g, message_flashed, request_finished  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+from werkzeug.wsgi import ClosingIterator  # noqa: E402
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, statuses, wall, queries, failed, flashes):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None  # noqa: E731
+    return {
+        "requests": n,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "failed": failed,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "flashes": dict(sorted(flashes.items())),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "mean_ms": ms(sum(latencies) / n) if n else None,
+        "max_ms": ms(latencies[-1]) if n else None,
+        "throughput_rps": round(n / wall, 1) if wall > 0 else None,
+        "queries_per_request": round(queries / n, 2) if n else None,
+    }
+
+
+# ---------------- SQL COUNTING ----------------
+class QueryCounter:
+    """WSGI middleware: SQL statements per X-Bench-Scenario, counted until the body is closed."""
+
+    def __init__(self, wsgi_app, engine):
+        self.wsgi_app = wsgi_app
+        self.totals = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        event.listen(engine, "after_cursor_execute", self._count)
+
+    def _count(self, *args):
+        if getattr(self._local, "count", None) is not None:
+            self._local.count += 1
+
+    def __call__(self, environ, start_response):
+        scenario = environ.get("HTTP_X_BENCH_SCENARIO")
+        if not scenario:
+            return self.wsgi_app(environ, start_response)
+        self._local.count = 0
+
+        def done():
+            with self._lock:
+                self.totals[scenario] += self._local.count
+            self._local.count = None
+
+        return ClosingIterator(self.wsgi_app(environ, start_response), [done])
+
+    def take(self, scenario):
+        with self._lock:
+            return self.totals.pop(scenario, 0)
+
+
+# ---------------- OUTCOMES ----------------
+def report_flashes(app):
+    """Have each response list the categories it flashed in an X-Bench-Flashes header."""
+    def flashed(sender, message, category, **extra):
+        g.bench_flashes = getattr(g, "bench_flashes", []) + [category]
+
+    def finished(sender, response, **extra):
+        if getattr(g, "bench_flashes", None):
+            response.headers["X-Bench-Flashes"] = ",".join(g.bench_flashes)
+
+    message_flashed.connect(flashed, app, weak=False)
+    request_finished.connect(finished, app, weak=False)
+
+
+def outcome(spec, status, flashed):
+    """``(passed, flash categories)``: the status, the flashes, then the scenario's check (untimed)."""
+    categories = flashed.split(",") if flashed else []
+    passed = status < 400 and all(c == "success" for c in categories) and spec.get("check", lambda: True)()
+    return passed, categories
+
+
+# ---------------- DRIVERS ----------------
+def run_client(client, counter, name, build, indexes):
+    """Sequential requests through the Flask test client."""
+    latencies, statuses, failed, flashes = [], Counter(), 0, Counter()
+    untimed = 0.0
+    started = time.perf_counter()
+    for i in indexes:
+        spec = build(i)
+        headers = {**spec.get("headers", {}), "X-Bench-Scenario": name}
+        t0 = time.perf_counter()
+        response = client.open(spec["path"], method=spec["method"], data=spec.get("data"),
+                               json=spec.get("json"), headers=headers)
+        response.get_data()
+        response.close()
+        latencies.append(time.perf_counter() - t0)
+        statuses[response.status_code] += 1
+        t1 = time.perf_counter()
+        passed, categories = outcome(spec, response.status_code, response.headers.get("X-Bench-Flashes"))
+        untimed += time.perf_counter() - t1
+        failed += not passed
+        flashes.update(categories)
+    wall = time.perf_counter() - started - untimed
+    return summarize(latencies, statuses, wall, counter.take(name), failed, flashes)
+
+
+def _http_request(port, name, spec):
+    headers = {**spec.get("headers", {}), "X-Bench-Scenario": name}
+    body = None
+    if spec.get("json") is not None:
+        body = json.dumps(spec["json"]).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    elif spec.get("data") is not None:
+        body = urlencode(spec["data"], doseq=True).encode("utf-8")
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    try:
+        t0 = time.perf_counter()
+        conn.request(spec["method"], spec["path"], body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - t0, response.status, response.getheader("X-Bench-Flashes")
+    finally:
+        conn.close()
+
+
+def run_http(port, counter, name, build, indexes, concurrency):
+    """``concurrency`` clients against a threaded server in this process."""
+    specs = [build(i) for i in indexes]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda spec: _http_request(port, name, spec), specs))
+    wall = time.perf_counter() - started
+    # the server closes the body just after the client has read it
+    time.sleep(0.05)
+    outcomes = [outcome(spec, status, flashed) for spec, (_, status, flashed) in zip(specs, results)]
+    stats = summarize([r[0] for r in results], Counter(r[1] for r in results), wall, counter.take(name),
+                      sum(not passed for passed, _ in outcomes),
+                      Counter(category for _, categories in outcomes for category in categories))
+    stats["concurrency"] = concurrency
+    return stats
+
+
+def run_mode(app, mode, counter, scenarios, params):
+    """Every scenario, warm-up requests first; returns ``{name: stats}``."""
+    n, warmup = params["requests"], params["warmup"]
+    results = {}
+    if mode == "client":
+        client = app.test_client()
+        for name, build in scenarios:
+            run_client(client, counter, name, build, range(-warmup, 0))     # fills caches and plans
+            results[name] = run_client(client, counter, name, build, range(n))
+            print(f"  client {name:28s} p95 {results[name]['p95_ms']} ms", file=sys.stderr)
+        return results
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)      # no per-request access log
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-http", daemon=True).start()
+    try:
+        for name, build in scenarios:
+            run_http(server.server_port, counter, name, build, range(-warmup, 0), params["concurrency"])
+            results[name] = run_http(server.server_port, counter, name, build, range(n),
+                                     params["concurrency"])
+            print(f"  http   {name:28s} p95 {results[name]['p95_ms']} ms", file=sys.stderr)
+    finally:
+        server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", choices=["mrp", "pos"], required=True)
+    parser.add_argument("--params", required=True, help="JSON dataset and run parameters")
+    parser.add_argument("--mode", choices=["client", "http"], help="benchmark this way (default: only seed)")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    params = json.loads(args.params)
+
+    if args.app == "mrp":
+        import mrp_scenarios as scenarios_module
+    else:
+        import pos_scenarios as scenarios_module
+    import databases
+    from app import create_app
+
+    app = create_app()
+    app.testing = True
+    result = {"app": args.app, "params": params, "dataset": None, "modes": {}}
+
+    started = time.perf_counter()
+    if params["reseed"]:
+        result["dataset"] = scenarios_module.seed(params, random.Random(params["seed"]))
+        result["seed_seconds"] = round(time.perf_counter() - started, 2)
+    result["peak_rss_mb_after_seed"] = peak_rss_mb()
+
+    if args.mode:
+        # Requests draw from their own stream, so a reused dataset gets the same ones as a fresh seed
+        rng = random.Random(params["seed"] + 1)
+        counter = QueryCounter(app.wsgi_app, databases.get_engine())
+        app.wsgi_app = counter
+        report_flashes(app)
+        scenarios = scenarios_module.scenarios(scenarios_module.context(rng), rng, tag=args.mode)
+        only = set(params.get("only") or ())
+        if only:
+            scenarios = [(name, build) for name, build in scenarios if name in only]
+        result["modes"][args.mode] = run_mode(app, args.mode, counter, scenarios, params)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
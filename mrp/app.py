@@ -1,13 +1,80 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, flash
-from datetime import datetime
+import math
+import os
+import sys
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from datetime import datetime, timedelta
 from databases import (
-    BaseItemSession, ComponentSession, ScheduleSession,
-    BaseItem, Component, ComponentBOM, ProductionTask
+    configure as configure_database, init_schema, Session, BaseItemSession, ComponentSession, ScheduleSession,
+    BaseItem, Component, ComponentBOM, ProductionTask, ProductionTaskArchive, WorkCenter, PlannedPurchase
 )
+from collections import defaultdict
+from itertools import groupby
+from sqlalchemy import text, or_, and_
+from bom import BomGraph, get_bom_graph, invalidate_bom_cache, cache_version
+from inventory import complete_tasks, ShortageError
+from scheduler import ensure_plan, reschedule, invalidate_scheduler
+from netting import update_purchase_plan
+from costing import update_costs
+from importer import import_catalog, upload_stream
+from demand_bridge import start_consumer
+from archive import start_archiver
+from simulation import Simulator, HORIZON_DAYS
+import cache_sync
+import ledger
+
+# shared/ sits beside mrp/ and pos/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared.metrics import init_metrics  # noqa: E402
 
 app = Flask(__name__)
-app.secret_key = "dev-key"
+
+DEFAULT_CONFIG = {
+    "SECRET_KEY": "dev-key",
+    "DATABASE_URL": None,           # None: MRP_DATABASE_URL or mrp.db beside this file; "memory": in-memory
+    "DB_POOL_SIZE": None,           # None: MRP_DB_POOL_SIZE (10)
+    "DB_MAX_OVERFLOW": None,        # None: MRP_DB_MAX_OVERFLOW (20)
+    "INIT_SCHEMA": True,            # False when `python databases.py` runs as a deploy step instead
+}
+
+# Tasks shown per page on /schedule
+SCHEDULE_PAGE_SIZE = 100
+
+# Views listing open work by due date; the rest list history newest first
+_DUE_ORDER_VIEWS = ("pending", "overdue")
+
+# Admin BOM summary, rebuilt only when cache_version() moves
+_bom_map_cache = {"version": None, "bom_map": {}}
+
+
+@app.before_request
+def sync_caches():
+    """Drop this worker's caches if another process changed their inputs."""
+    cache_sync.sync(Session())
+
+
+@app.before_request
+def start_pos_bridge():
+    """Drain POS sales into stock in the background (MRP_POS_BRIDGE_SECONDS=0 disables)."""
+    start_consumer()
+
+
+@app.before_request
+def start_stock_snapshots():
+    """Snapshot stock balances periodically (MRP_STOCK_SNAPSHOT_SECONDS=0 disables)."""
+    ledger.start_snapshotter()
+
+
+@app.before_request
+def start_task_archiver():
+    """Archive old completed tasks periodically (MRP_TASK_ARCHIVE_SECONDS=0 disables)."""
+    start_archiver()
+
+
+@app.teardown_appcontext
+def remove_session(exc=None):
+    """Return the request's session (and its connection) to the pool."""
+    Session.remove()
 
 
 # =========================================================
@@ -38,7 +105,12 @@ def admin():
         else:
             item = BaseItem(name=name, vendor=vendor, unit_price=unit_price, qty_in_stock=qty_in_stock)
             base_session.add(item)
+            ledger.append_movements(base_session, [("base", name, ledger.OPENING, qty_in_stock, None)])
+            base_session.flush()
+            update_costs(base_session, names=[name])
+            cache_sync.mark_changed(base_session)
             base_session.commit()
+            invalidate_bom_cache()
             flash(f"✅ Added base item: {name}", "success")
         return redirect(url_for("admin"))
 
@@ -47,6 +119,7 @@ def admin():
         sku = request.form["sku"].strip()
         name = request.form["comp_name"].strip()
         lead_time = int(request.form.get("lead_time", 0))
+        work_center = request.form.get("work_center") or None
 
         if not sku or not name:
             flash("❌ Component SKU and name are required.", "danger")
@@ -56,17 +129,12 @@ def admin():
             flash(f"⚠️ Component '{sku}' already exists!", "warning")
             return redirect(url_for("admin"))
 
-        # ✅ qty_in_stock = 0 by default
-        new_comp = Component(sku=sku, name=name, lead_time=lead_time, qty_in_stock=0.0)
-        comp_session.add(new_comp)
-        comp_session.commit()
-
         # Parse BOM lines
         child_skus = request.form.getlist("child_sku[]")
         qtys = request.form.getlist("qty_per[]")
         sources = request.form.getlist("source_type[]")
 
-        added = 0
+        lines = []
         for cs, q, src in zip(child_skus, qtys, sources):
             if not cs.strip():
                 continue
@@ -76,16 +144,31 @@ def admin():
                 qty = 0
             if qty <= 0:
                 continue
-            line = ComponentBOM(
+            lines.append(ComponentBOM(
                 parent_sku=sku,
                 child_sku=cs.strip(),
                 qty_per=qty,
                 source_type=src
-            )
-            comp_session.add(line)
-            added += 1
+            ))
 
+        # Reject lines that would make the component contain itself
+        cycle = get_bom_graph(comp_session).find_cycle(sku, [l.child_sku for l in lines if l.source_type == "component"])
+        if cycle:
+            flash(f"❌ BOM cycle rejected: {' → '.join(cycle)}", "danger")
+            return redirect(url_for("admin"))
+
+        # ✅ qty_in_stock = 0 by default
+        new_comp = Component(sku=sku, name=name, lead_time=lead_time, qty_in_stock=0.0,
+                             work_center=work_center)
+        comp_session.add(new_comp)
+        comp_session.add_all(lines)
+        added = len(lines)
+        comp_session.flush()
+        # Cost against a graph that already holds the new lines; the cached one reloads after the commit
+        update_costs(comp_session, skus=[sku], graph=BomGraph.load(comp_session))
+        cache_sync.mark_changed(comp_session)
         comp_session.commit()
+        invalidate_bom_cache()
 
         if added == 0:
             flash(f"⚠️ Component '{sku}' added (no valid BOM lines).", "warning")
@@ -94,40 +177,220 @@ def admin():
 
         return redirect(url_for("admin"))
 
+    # --- Bulk Catalog Import ---
+    if request.form.get("form_type") == "import":
+        report = import_catalog(
+            base_items=upload_stream(request.files.get("base_items_file")),
+            components=upload_stream(request.files.get("components_file")),
+            boms=upload_stream(request.files.get("boms_file")),
+        )
+        flash(f"📥 {report.summary()}", "warning" if report.errors else "success")
+        for label, line_no, message in report.errors[:20]:
+            flash(f"{label}:{line_no}: {message}", "danger")
+        if len(report.errors) > 20:
+            flash(f"… and {len(report.errors) - 20} more rejected row(s)", "danger")
+        return redirect(url_for("admin"))
+
+    # --- Update Base Item Price ---
+    if request.form.get("form_type") == "base_price":
+        item = base_session.query(BaseItem).filter_by(id=int(request.form["item_id"])).first()
+        if not item:
+            flash("❌ Item not found!", "danger")
+        else:
+            item.unit_price = float(request.form.get("unit_price", 0))
+            base_session.flush()
+            changed = update_costs(base_session, names=[item.name])
+            cache_sync.mark_changed(base_session)
+            base_session.commit()
+            flash(f"💲 Price of '{item.name}' set to {item.unit_price:.2f}; "
+                  f"{len(changed)} component cost(s) rolled up.", "success")
+        return redirect(url_for("admin"))
+
+    # --- Update Component Lead Time ---
+    if request.form.get("form_type") == "lead_time":
+        sku = request.form["sku"]
+        lead_time = int(request.form.get("lead_time", 0))
+        comp = comp_session.query(Component).filter_by(sku=sku).first()
+        if not comp:
+            flash(f"❌ Component '{sku}' not found.", "danger")
+        else:
+            comp.lead_time = lead_time
+            reschedule(comp_session, lambda s: s.set_lead_time(sku, lead_time))
+            cache_sync.mark_changed(comp_session)
+            comp_session.commit()
+            flash(f"⏱ Lead time for '{sku}' set to {lead_time}h; open tasks replanned.", "success")
+        return redirect(url_for("admin"))
+
+    # --- Update POS Replenishment Settings ---
+    if request.form.get("form_type") == "replenishment":
+        sku = request.form["sku"]
+        comp = comp_session.query(Component).filter_by(sku=sku).first()
+        if not comp:
+            flash(f"❌ Component '{sku}' not found.", "danger")
+        else:
+            comp.pos_product_id = request.form.get("pos_product_id", "").strip() or None
+            comp.reorder_point = max(float(request.form.get("reorder_point") or 0), 0.0)
+            comp.reorder_qty = max(float(request.form.get("reorder_qty") or 0), 0.0)
+            comp_session.commit()
+            flash(f"🔁 Replenishment for '{sku}': reorder below {comp.reorder_point:g}, "
+                  f"at least {comp.reorder_qty:g} per task.", "success")
+        return redirect(url_for("admin"))
+
+    # --- Add / Update Work Center ---
+    if request.form.get("form_type") == "work_center":
+        name = request.form["wc_name"].strip()
+        capacity = max(int(request.form.get("capacity", 1)), 1)
+        if not name:
+            flash("❌ Work center name cannot be empty!", "danger")
+            return redirect(url_for("admin"))
+
+        wc = comp_session.query(WorkCenter).filter_by(name=name).first()
+        if wc:
+            wc.capacity = capacity
+        else:
+            comp_session.add(WorkCenter(name=name, capacity=capacity))
+        cache_sync.mark_changed(comp_session)
+        comp_session.commit()
+        invalidate_scheduler()
+        flash(f"🏭 Work center '{name}' has capacity {capacity}.", "success")
+        return redirect(url_for("admin"))
+
     # --- Load data ---
+    bom_cycles = get_bom_graph(comp_session).cycles
+    version = cache_version()
     base_items = base_session.query(BaseItem).all()
+    work_centers = comp_session.query(WorkCenter).order_by(WorkCenter.name).all()
     components = comp_session.query(Component).all()
-
-    # ✅ Build a dict of component -> child items
-    bom_map = {}
-    for comp in components:
-        bom_lines = comp_session.query(ComponentBOM).filter_by(parent_sku=comp.sku).all()
-        child_names = []
-        for line in bom_lines:
-            if line.source_type == "base":
-                child = base_session.query(BaseItem).filter_by(name=line.child_sku).first()
-                if child:
-                    child_names.append(child.name)
-                else:
-                    child_names.append(line.child_sku)
-            elif line.source_type == "component":
-                child_comp = comp_session.query(Component).filter_by(sku=line.child_sku).first()
-                if child_comp:
-                    child_names.append(child_comp.name)
-                else:
-                    child_names.append(line.child_sku)
-        bom_map[comp.sku] = ", ".join(child_names) if child_names else "-"
+    if _bom_map_cache["version"] == version:
+        bom_map = _bom_map_cache["bom_map"]
+    else:
+        # One query for every line: selectinload would batch 500 parents per IN list
+        lines = comp_session.query(ComponentBOM.parent_sku, ComponentBOM.child_sku, ComponentBOM.source_type) \
+            .order_by(ComponentBOM.id).all()
+        bom_map = build_bom_map(base_items, components, lines, version)
 
     return render_template(
         "admin.html",
         base_items=base_items,
         components=components,
-        bom_map=bom_map
+        work_centers=work_centers,
+        bom_map=bom_map,
+        bom_cycles=bom_cycles
+    )
+
+
+def build_bom_map(base_items, components, lines, version):
+    """Component SKU -> comma-separated child names, from already-loaded rows.
+
+    ``lines`` are ``(parent_sku, child_sku, source_type)`` for the whole BOM,
+    so this runs no queries of its own. Cached under ``version``.
+    """
+    base_names = {b.name: b.name for b in base_items}
+    comp_names = {c.sku: c.name for c in components}
+    name_maps = {"base": base_names, "component": comp_names}
+
+    child_names = defaultdict(list)
+    for parent_sku, child_sku, source_type in lines:
+        if source_type in name_maps:
+            child_names[parent_sku].append(name_maps[source_type].get(child_sku, child_sku))
+    bom_map = {comp.sku: ", ".join(child_names[comp.sku]) or "-" for comp in components}
+
+    _bom_map_cache["version"] = version
+    _bom_map_cache["bom_map"] = bom_map
+    return bom_map
+
+
+# =========================================================
+# BOM EXPLOSION
+# =========================================================
+@app.route("/bom/explode")
+def bom_explode():
+    """Gross requirements for ?sku=&qty=, or for the whole pending schedule."""
+    sched_session = ScheduleSession()
+    graph = get_bom_graph(sched_session)
+    sku = request.args.get("sku")
+
+    if sku:
+        try:
+            qty = float(request.args.get("qty", 1))
+            if not math.isfinite(qty):
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "qty must be a finite number"}), 400
+        gross = graph.explode({sku: qty})
+    else:
+        pending = sched_session.query(ProductionTask).filter_by(status="pending").all()
+        sched_session.close()
+        gross = graph.explode_tasks(pending)
+
+    requirements = [
+        {
+            "source_type": source_type,
+            "sku": code,
+            "low_level_code": graph.low_level_codes.get((source_type, code), 0),
+            "gross_qty": qty,
+        }
+        for (source_type, code), qty in gross.items()
+    ]
+    requirements.sort(key=lambda r: (r["low_level_code"], r["sku"]))
+    return jsonify(requirements)
+
+
+# =========================================================
+# WHERE-USED
+# =========================================================
+# Walks the (child_sku, source_type) index upwards, one level per step
+_WHERE_USED_SQL = text("""
+    WITH RECURSIVE used(parent_sku, child_sku, qty_per, level) AS (
+        SELECT parent_sku, child_sku, qty_per, 1
+        FROM component_boms WHERE child_sku = :sku AND source_type = :source
+        UNION
+        SELECT b.parent_sku, b.child_sku, b.qty_per, used.level + 1
+        FROM component_boms b JOIN used ON b.child_sku = used.parent_sku AND b.source_type = 'component'
+        WHERE used.level < :max_depth
     )
+    SELECT used.parent_sku, c.name, used.child_sku, used.qty_per, MIN(used.level) AS level
+    FROM used LEFT JOIN components c ON c.sku = used.parent_sku
+    GROUP BY used.parent_sku, used.child_sku
+    ORDER BY level, used.parent_sku
+""")
+
+
+def where_used(session, sku, source="base", max_depth=50):
+    """Assemblies that use ``sku`` directly (level 1) or transitively."""
+    rows = session.execute(_WHERE_USED_SQL, {"sku": sku, "source": source, "max_depth": max_depth}).all()
+    return [
+        {"parent_sku": r.parent_sku, "parent_name": r.name, "via": r.child_sku,
+         "qty_per": r.qty_per, "level": r.level}
+        for r in rows
+    ]
+
+
+@app.route("/bom/where-used")
+def bom_where_used():
+    """JSON: ?sku=&source=base|component[&direct=1]"""
+    session = ComponentSession()
+    sku = request.args.get("sku", "")
+    source = request.args.get("source", "base")
+    max_depth = 1 if request.args.get("direct") else 50
+    return jsonify(where_used(session, sku, source, max_depth))
+
+
+@app.route("/where-used")
+def where_used_view():
+    session = ComponentSession()
+    sku = request.args.get("sku", "").strip()
+    source = request.args.get("source", "base")
+    rows = where_used(session, sku, source) if sku else []
+    return render_template("where_used.html", sku=sku, source=source, rows=rows)
+
 
 # =========================================================
 # PROCUREMENT
 # =========================================================
+_RECEIVE_SQL = text("UPDATE base_items SET qty_in_stock = qty_in_stock + :qty WHERE id = :id")
+
+
 @app.route("/procurement", methods=["GET", "POST"])
 def procurement():
     session = BaseItemSession()
@@ -141,13 +404,28 @@ def procurement():
         if not item:
             flash("❌ Item not found!", "danger")
         else:
-            item.qty_in_stock += qty
+            # Increment in SQL so concurrent receipts and backflushes are never overwritten
+            session.execute(_RECEIVE_SQL, {"id": item_id, "qty": qty})
+            ledger.append_movements(session, [("base", item.name, ledger.RECEIPT, qty, f"purchase:{item_id}")])
+            update_purchase_plan(session, names=[item.name])
+            cache_sync.mark_changed(session)
             session.commit()
+            session.refresh(item)
             flash(f"📦 Purchased {qty} units of '{item.name}'. New stock: {item.qty_in_stock}", "success")
 
         return redirect(url_for("procurement"))
 
-    return render_template("procurement.html", items=items)
+    # --- Suggested purchases from the materialized netting run ---
+    update_purchase_plan(session)       # no-op unless the BOM changed since the last run
+    session.commit()
+    planned = session.query(PlannedPurchase).order_by(PlannedPurchase.vendor, PlannedPurchase.base_item_name).all()
+    suggestions = [
+        {"vendor": vendor or "(No vendor)", "lines": lines, "total": sum(p.est_cost for p in lines)}
+        for vendor, group in groupby(planned, key=lambda p: p.vendor)
+        for lines in [list(group)]
+    ]
+
+    return render_template("procurement.html", items=items, suggestions=suggestions)
 
 
 # =========================================================
@@ -167,9 +445,17 @@ def schedule():
         if not sku:
             flash("❌ Please select a component.", "danger")
             return redirect(url_for("schedule"))
+        if not comp_session.query(Component.id).filter_by(sku=sku).first():
+            flash(f"❌ Component '{sku}' not found.", "danger")
+            return redirect(url_for("schedule"))
 
-        new_task = ProductionTask(component_sku=sku, status="pending", quantity=qty)
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M")
+        new_task = ProductionTask(component_sku=sku, status="pending", quantity=qty, created_at=created_at)
         sched_session.add(new_task)
+        sched_session.flush()
+        reschedule(sched_session, lambda s: s.add(new_task.id, sku, qty, created_at))
+        update_purchase_plan(sched_session, skus=[sku])
+        cache_sync.mark_changed(sched_session)
         sched_session.commit()
 
         flash(f"🧾 Scheduled production of {qty} unit(s) of '{sku}'", "success")
@@ -186,60 +472,310 @@ def schedule():
             return redirect(url_for("schedule"))
 
         if action == "complete":
-            task.status = "completed"
-            comp = comp_session.query(Component).filter_by(sku=task.component_sku).first()
-            if comp:
-                comp.qty_in_stock += task.quantity
-                comp_session.commit()
-            flash(f"✅ Completed {task.quantity} unit(s) of '{task.component_sku}', stock +{task.quantity}", "success")
+            sku, qty = task.component_sku, task.quantity
+            try:
+                done = complete_tasks(sched_session, [task_id], request.form.get("check_shortage") == "on")
+            except ShortageError as e:
+                sched_session.rollback()
+                flash(f"❌ Cannot complete task {task_id}: {e}", "danger")
+                return redirect(url_for("schedule"))
+            reschedule(sched_session, lambda s: s.remove(task_id))
+            update_purchase_plan(sched_session, skus=[sku])
+            if done:
+                flash(f"✅ Completed {qty} unit(s) of '{sku}', stock +{qty} (BOM children backflushed)", "success")
+            else:
+                flash(f"⚠️ Task {task_id} is no longer pending.", "warning")
         elif action == "cancel":
             # ✅ Delete the task entirely
             sched_session.delete(task)
+            sched_session.flush()
+            reschedule(sched_session, lambda s: s.remove(task_id))
+            update_purchase_plan(sched_session, skus=[task.component_sku])
             flash(f"🗑 Deleted scheduled task for '{task.component_sku}'", "warning")
 
+        cache_sync.mark_changed(sched_session)
         sched_session.commit()
         return redirect(url_for("schedule"))
 
-    # --- Load components & tasks ---
-    components = comp_session.query(Component).all()
-    tasks = sched_session.query(ProductionTask).order_by(ProductionTask.id.desc()).all()
-
-    # --- Build a quick lookup map for component info ---
-    comp_map = {c.sku: {"name": c.name, "lead_time": c.lead_time} for c in components}
-
-    # --- Compute ETA, overdue status, and name ---
+    # --- Load one page of tasks ---
+    # Filters and ordering match the production_tasks indexes; only the page is read
+    ensure_plan(sched_session)          # full replan only after BOM / work center changes
+    sched_session.commit()
     now = datetime.now()
-    enriched_tasks = []
-
-    for t in tasks:
-        comp_info = comp_map.get(t.component_sku, {"name": "(Unknown)", "lead_time": 0})
-        eta_str = t.estimated_completion
-        eta = None
-        try:
-            eta = datetime.strptime(eta_str, "%Y-%m-%d %H:%M") if eta_str != "-" else None
-        except:
-            pass
-
-        is_overdue = t.status == "pending" and eta and eta < now
+    try:
+        query = _task_query(sched_session, request.args, now)
+    except ValueError:
+        flash("❌ Invalid filter: dates are YYYY-MM-DD.", "danger")
+        return redirect(url_for("schedule"))
+    rows = query.limit(SCHEDULE_PAGE_SIZE + 1).all()
+    has_more = len(rows) > SCHEDULE_PAGE_SIZE
+    rows = rows[:SCHEDULE_PAGE_SIZE]
 
+    enriched_tasks = []
+    for t, comp_name, lead_time in rows:
         enriched_tasks.append({
             "id": t.id,
             "component_sku": t.component_sku,
-            "component_name": comp_info["name"],
-            "lead_time": comp_info["lead_time"],
+            "component_name": comp_name or "(Unknown)",
+            "lead_time": lead_time or 0,
             "status": t.status,
             "created_at": t.created_at,
-            "estimated_completion": eta_str,
+            "planned_start": t.planned_start.strftime("%Y-%m-%d %H:%M") if t.planned_start else "-",
+            "estimated_completion": t.estimated_completion,
             "quantity": getattr(t, "quantity", 1),
-            "is_overdue": is_overdue
+            "is_overdue": t.status == "pending" and t.due_at is not None and t.due_at < now,
         })
 
-    return render_template("schedule.html", components=components, tasks=enriched_tasks)
+    filters = {k: v for k, v in request.args.items() if k != "after" and v}
+    next_url = None
+    if has_more:
+        last = rows[-1][0]
+        next_url = url_for("schedule", after=_task_cursor(last, filters.get("view", "all")), **filters)
+    return render_template("schedule.html", tasks=enriched_tasks, view=filters.get("view", "all"),
+                           filters=filters, next_url=next_url,
+                           first_url=url_for("schedule", **filters) if request.args.get("after") else None)
+
+
+def _parse_day(value, end_of_day=False):
+    if not value:
+        return None
+    day = datetime.strptime(value, "%Y-%m-%d")
+    return (day + timedelta(days=1) if end_of_day else day).strftime("%Y-%m-%d %H:%M")
+
+
+def _task_cursor(task, view):
+    """Keyset cursor for continuing after ``task`` in ``view``'s ordering."""
+    if view in _DUE_ORDER_VIEWS:
+        return f"{task.due_at.isoformat() if task.due_at else 'none'}_{task.id}"
+    return str(task.id)
+
+
+def _task_query(session, args, now):
+    """Tasks (with component name and lead time) for the /schedule filters. Raises ValueError.
+
+    ?view=all|pending|overdue|completed, ?sku=, ?start=&end= (created, YYYY-MM-DD),
+    ?archived=1 for archived history, ?after=<cursor> to continue a listing.
+    Open work is listed by due date, history newest first.
+    """
+    model = ProductionTaskArchive if args.get("archived") else ProductionTask
+    view = args.get("view", "all")
+    query = session.query(model, Component.name, Component.lead_time) \
+        .outerjoin(Component, Component.sku == model.component_sku)
+
+    if view in ("pending", "overdue"):
+        query = query.filter(model.status == "pending")
+    elif view == "completed":
+        query = query.filter(model.status == "completed")
+    if view == "overdue":
+        query = query.filter(model.due_at < now)
+    if args.get("sku"):
+        query = query.filter(model.component_sku == args["sku"].strip())
+    start, end = _parse_day(args.get("start")), _parse_day(args.get("end"), end_of_day=True)
+    if start:
+        query = query.filter(model.created_at >= start)
+    if end:
+        query = query.filter(model.created_at < end)
+
+    after = args.get("after")
+    if view in _DUE_ORDER_VIEWS:
+        if after:
+            due, task_id = after.rsplit("_", 1)
+            task_id = int(task_id)
+            if due == "none":       # unplanned tasks (NULL due_at) sort first
+                query = query.filter(or_(model.due_at.isnot(None), model.id > task_id))
+            else:
+                due = datetime.fromisoformat(due)
+                query = query.filter(or_(model.due_at > due, and_(model.due_at == due, model.id > task_id)))
+        return query.order_by(model.due_at, model.id)
+    if after:
+        query = query.filter(model.id < int(after))
+    return query.order_by(model.id.desc())
+
+
+@app.route("/components/search")
+def component_search():
+    """Type-ahead for the schedule form: SKU prefix matches first, then name matches."""
+    q = request.args.get("q", "").strip()
+    limit = min(request.args.get("limit", 20, type=int), 50)
+    if not q:
+        return jsonify([])
+    session = ComponentSession()
+    # A range on the unique sku index instead of LIKE, which SQLite cannot index case-sensitively
+    rows = session.query(Component.sku, Component.name) \
+        .filter(Component.sku >= q, Component.sku < q + "\U0010ffff") \
+        .order_by(Component.sku).limit(limit).all()
+    if len(rows) < limit:
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        rows += session.query(Component.sku, Component.name) \
+            .filter(Component.name.ilike(pattern, escape="\\"), Component.sku.notin_([r.sku for r in rows])) \
+            .order_by(Component.sku).limit(limit - len(rows)).all()
+    return jsonify([{"sku": sku, "name": name} for sku, name in rows])
+
+
+@app.route("/schedule/complete", methods=["POST"])
+def complete_selected():
+    """Complete several tasks in one transaction."""
+    session = ScheduleSession()
+    task_ids = [int(t) for t in request.form.getlist("task_ids[]") if t.strip()]
+    if not task_ids:
+        flash("❌ No tasks selected.", "danger")
+        return redirect(url_for("schedule"))
+
+    try:
+        done = complete_tasks(session, task_ids, request.form.get("check_shortage") == "on")
+    except ShortageError as e:
+        session.rollback()
+        flash(f"❌ No tasks completed: {e}", "danger")
+        return redirect(url_for("schedule"))
+
+    reschedule(session, lambda s: s.remove(*(row.id for row in done)))
+    update_purchase_plan(session, skus={row.component_sku for row in done})
+    cache_sync.mark_changed(session)
+    session.commit()
+    flash(f"✅ Completed {len(done)} of {len(task_ids)} selected task(s)", "success")
+    return redirect(url_for("schedule"))
 
 
 # =========================================================
-# RUN
+# STOCK LEDGER
 # =========================================================
+def _ledger_item(args):
+    """(item_type, item_key) from ?sku= or ?name= (base item)."""
+    if args.get("name"):
+        return "base", args["name"]
+    return args.get("source", "component"), args.get("sku", "")
+
+
+@app.route("/stock/at")
+def stock_at():
+    """JSON: stock of ?sku= (or base ?name=) as of ?at=<ISO datetime>, default now."""
+    item_type, key = _ledger_item(request.args)
+    try:
+        at = datetime.fromisoformat(request.args["at"]) if request.args.get("at") else datetime.now()
+    except ValueError:
+        return jsonify({"error": "at must be an ISO datetime"}), 400
+    result = ledger.stock_at(ScheduleSession(), item_type, key, at)
+    snapshot = result["snapshot_as_of"]
+    return jsonify({"source": item_type, "key": key, "at": at.isoformat(timespec="seconds"),
+                    "balance": result["balance"], "movements_since_snapshot": result["movements"],
+                    "snapshot_as_of": snapshot.isoformat(timespec="seconds") if snapshot else None})
+
+
+@app.route("/stock/movements")
+def stock_movements():
+    """JSON audit trail of one item, newest first; follow ``next`` (?before=<iso>_<id>) for older rows."""
+    item_type, key = _ledger_item(request.args)
+    try:
+        limit = min(int(request.args.get("limit", 100)), 1000)
+        before = request.args.get("before")
+        if before:
+            moved_at, movement_id = before.rsplit("_", 1)
+            before = (datetime.fromisoformat(moved_at), int(movement_id))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer and before <iso>_<id>"}), 400
+
+    rows = ledger.movements(ScheduleSession(), item_type, key, before, limit)
+    next_url = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_url = url_for("stock_movements", **{k: v for k, v in request.args.items() if k != "before"},
+                           before=f"{last.moved_at.isoformat()}_{last.id}")
+    return jsonify({
+        "source": item_type, "key": key, "next": next_url,
+        "movements": [{"id": m.id, "moved_at": m.moved_at.isoformat(timespec="seconds"), "kind": m.kind,
+                       "quantity": m.quantity, "reference": m.reference} for m in rows],
+    })
+
+
+# =========================================================
+# WHAT-IF SIMULATION
+# =========================================================
+def _json_object(value, what):
+    """``value`` as a dict (None counts as empty); ValueError for any other JSON."""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError(f"{what} must be a JSON object")
+    return value
+
+
+@app.route("/simulate", methods=["POST"])
+def simulate():
+    """JSON what-if projection; nothing is written.
+
+    {"scenarios": [{"label", "demand", "extra", "lead_time"}], "items": [sku, ...]}
+    or {"monte_carlo": {"runs", "demand_cv", "lead_time_cv", "seed"}, "top": 50}.
+    Both accept "horizon_days" (default 30).
+    """
+    try:
+        body = _json_object(request.get_json(silent=True), "body")
+        horizon = int(body.get("horizon_days", HORIZON_DAYS))
+        if not 1 <= horizon <= 365:
+            raise ValueError("horizon_days must be between 1 and 365")
+        started = datetime.now()
+        simulator = Simulator.load(ScheduleSession(), horizon_days=horizon)
+
+        if "monte_carlo" in body:
+            mc = _json_object(body["monte_carlo"], "monte_carlo")
+            runs = int(mc.get("runs", 1000))
+            if not 1 <= runs <= 10000:
+                raise ValueError("runs must be between 1 and 10000")
+            result = simulator.monte_carlo(runs, float(mc.get("demand_cv", 0.2)),
+                                           float(mc.get("lead_time_cv", 0.1)), mc.get("seed"))
+            payload = {"runs": runs, "items": result.summary(int(body.get("top", 50)))}
+        else:
+            scenarios = body.get("scenarios") or []
+            if not isinstance(scenarios, list) or not 1 <= len(scenarios) <= 1000:
+                raise ValueError("scenarios must list 1 to 1000 scenarios")
+            scenarios = [_json_object(scenario, "each scenario") for scenario in scenarios]
+            for scenario in scenarios:
+                for key in ("demand", "lead_time", "extra"):
+                    _json_object(scenario.get(key), f"scenario {key}")
+            items = body.get("items")
+            if items is not None and not isinstance(items, list):
+                raise ValueError("items must be a list of SKUs")
+            items = None if items is None else [("component", sku) for sku in items]
+            result = simulator.run(scenarios)
+            payload = {"scenarios": [result.scenario(i, items) for i in range(len(scenarios))]}
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"start": started.isoformat(timespec="seconds"), "horizon_days": horizon,
+                    "seconds": round((datetime.now() - started).total_seconds(), 3), **payload})
+
+
+# =========================================================
+# APP FACTORY & RUN
+# =========================================================
+def create_app(config=None):
+    """Configure the app and its database for this process; returns the app.
+
+    Only the engine is created here; connections open on first use. With
+    INIT_SCHEMA the schema is brought up to date now and the pool emptied,
+    so under ``gunicorn --preload "app:create_app()"`` it runs once in the
+    master and every forked worker starts without inherited connections.
+    Each worker caches the BOM, costs, schedule and netting run, and drops
+    them when another process commits a change (see cache_sync.py), so
+    any number of workers can share one database. Another database still
+    needs another process.
+    """
+    if "metrics" in app.extensions:
+        if config and any(app.config.get(k) != v for k, v in config.items()):
+            raise RuntimeError("create_app() already configured this process with a different config")
+        return app
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    engine = configure_database(app.config["DATABASE_URL"], app.config["DB_POOL_SIZE"],
+                                app.config["DB_MAX_OVERFLOW"])
+    if app.config["INIT_SCHEMA"]:
+        init_schema()
+        engine.dispose()
+    init_metrics(app, [engine], service="mrp")
+    return app
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
 
@@ -0,0 +1,96 @@
+# archive.py
+# ---------------------------------------------------------
+# Moves completed production tasks older than the retention window from
+# production_tasks into production_tasks_archive, so the live table (and
+# everything that scans it) only holds open work and recent history.
+# Batches are copied and deleted in one transaction each; ids are kept,
+# so ledger references like "task:42" still resolve.
+#
+#   python archive.py [retention_days]
+
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, bindparam, DateTime
+
+from databases import SessionFactory
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = float(os.environ.get("MRP_TASK_RETENTION_DAYS", 90))
+ARCHIVE_SECONDS = float(os.environ.get("MRP_TASK_ARCHIVE_SECONDS", 3600))  # 0 = only via the CLI
+BATCH_SIZE = 5000
+
+_COLUMNS = "id, component_sku, quantity, status, created_at, planned_start, due_at, completed_at"
+
+# Tasks completed before this change have no completed_at; their created_at stands in
+_EXPIRED_SQL = text(
+    "SELECT id FROM production_tasks WHERE status = 'completed' "
+    "AND COALESCE(completed_at, created_at) < :cutoff ORDER BY id LIMIT :limit"
+)
+
+_COPY_SQL = text(
+    f"INSERT OR REPLACE INTO production_tasks_archive ({_COLUMNS}, archived_at) "
+    f"SELECT {_COLUMNS}, :now FROM production_tasks WHERE id IN :ids"
+).bindparams(bindparam("ids", expanding=True), bindparam("now", type_=DateTime))
+
+_DELETE_SQL = text("DELETE FROM production_tasks WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+
+
+def archive_completed(retention_days=RETENTION_DAYS, batch_size=BATCH_SIZE):
+    """Archive tasks completed more than ``retention_days`` ago; returns how many moved."""
+    # Compared as text: matches both "YYYY-MM-DD HH:MM" (created_at) and stored DATETIMEs
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M")
+    moved = 0
+    session = SessionFactory()
+    try:
+        while True:
+            ids = [row[0] for row in session.execute(_EXPIRED_SQL, {"cutoff": cutoff, "limit": batch_size})]
+            if not ids:
+                return moved
+            session.execute(_COPY_SQL, {"ids": ids, "now": datetime.now()})
+            session.execute(_DELETE_SQL, {"ids": ids})
+            session.commit()
+            moved += len(ids)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+# =========================================================
+# BACKGROUND ARCHIVER
+# =========================================================
+_archiver = None
+_archiver_lock = threading.Lock()
+
+
+def start_archiver(interval=ARCHIVE_SECONDS):
+    """Start the archiving thread once per process; no-op when interval <= 0."""
+    global _archiver
+    if interval <= 0 or _archiver is not None:
+        return
+    with _archiver_lock:
+        if _archiver is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    archive_completed()
+                except Exception:
+                    logger.exception("Task archiving failed")
+                time.sleep(interval)
+
+        _archiver = threading.Thread(target=run, name="task-archiver", daemon=True)
+        _archiver.start()
+
+
+if __name__ == "__main__":
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else RETENTION_DAYS
+    print(f"✅ Archived {archive_completed(days)} task(s) completed more than {days:g} day(s) ago")
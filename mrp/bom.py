@@ -0,0 +1,228 @@
+# bom.py
+# ---------------------------------------------------------
+# In-memory BOM graph built from components + component_boms.
+# Loaded once, cached, and invalidated by the admin routes.
+
+import logging
+import threading
+from collections import defaultdict, deque
+
+from databases import SessionFactory, Component, ComponentBOM
+
+logger = logging.getLogger(__name__)
+
+
+# =========================================================
+# 1. GRAPH
+# =========================================================
+class BomGraph:
+    """Adjacency view of every BOM line.
+
+    Nodes are keyed by ``(source_type, code)``: ``("component", sku)`` for
+    make items and ``("base", name)`` for buy items, mirroring how
+    ``ComponentBOM.child_sku`` is interpreted.
+
+    Lines that close a cycle in existing data are kept out of
+    ``children``/``parents`` (so every traversal sees a DAG) and listed
+    in ``cycles`` until someone fixes the BOM.
+    """
+
+    def __init__(self, components, lines):
+        self.components = {sku: name for sku, name in components}
+        self.children = defaultdict(list)      # parent key -> [(child key, qty_per)]
+        self.parents = defaultdict(list)       # child key  -> [(parent key, qty_per)]
+        self.cyclic_children = defaultdict(list)   # lines left out of the DAG, same shape as children
+        self.cycles = []                       # [sku, ..., sku] per left-out line, first == last
+
+        nodes = {("component", sku) for sku in self.components}
+        for parent_sku, child_sku, qty_per, source_type in lines:
+            parent = ("component", parent_sku)
+            child = (source_type or "base", child_sku)
+            self.children[parent].append((child, qty_per or 0.0))
+            self.parents[child].append((parent, qty_per or 0.0))
+            nodes.add(parent)
+            nodes.add(child)
+
+        self._break_cycles()
+        if self.cycles:
+            logger.warning("BOM contains %d cycle(s), ignored for planning: %s", len(self.cycles),
+                           "; ".join(" -> ".join(cycle) for cycle in self.cycles))
+        self.order, self.low_level_codes = self._topological_order(nodes)
+
+    @classmethod
+    def load(cls, session=None):
+        """Read the whole BOM in two queries, on ``session`` (seeing its pending lines) or a fresh one."""
+        own = session is None
+        if own:
+            session = SessionFactory()
+        try:
+            components = session.query(Component.sku, Component.name).all()
+            lines = session.query(
+                ComponentBOM.parent_sku, ComponentBOM.child_sku,
+                ComponentBOM.qty_per, ComponentBOM.source_type
+            ).all()
+        finally:
+            if own:
+                session.close()
+        return cls(components, lines)
+
+    def _break_cycles(self):
+        """Depth-first search; every back edge closes a cycle and moves to ``cyclic_children``."""
+        state = {}                  # node -> 1 while on the current path, 2 once finished
+        back_edges = []
+        for root in sorted(self.children):
+            if root in state:
+                continue
+            state[root] = 1
+            stack = [(root, iter(list(self.children[root])))]
+            while stack:
+                node, edges = stack[-1]
+                for child, qty_per in edges:
+                    seen = state.get(child)
+                    if seen == 1:
+                        back_edges.append((node, child, qty_per))
+                        path = [n for n, _ in stack]
+                        self.cycles.append([n[1] for n in path[path.index(child):]] + [child[1]])
+                    elif seen is None:
+                        state[child] = 1
+                        stack.append((child, iter(list(self.children.get(child, ())))))
+                        break
+                else:
+                    state[node] = 2
+                    stack.pop()
+
+        for parent, child, qty_per in back_edges:
+            self.children[parent].remove((child, qty_per))
+            self.parents[child].remove((parent, qty_per))
+            self.cyclic_children[parent].append((child, qty_per))
+
+    def _topological_order(self, nodes):
+        """Kahn's algorithm; the low-level code is the deepest level a node appears at."""
+        indegree = {node: 0 for node in nodes}
+        for parent, edges in self.children.items():
+            for child, _ in edges:
+                indegree[child] += 1
+
+        llc = {node: 0 for node in nodes}
+        queue = deque(node for node, deg in indegree.items() if deg == 0)
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for child, _ in self.children.get(node, ()):
+                llc[child] = max(llc[child], llc[node] + 1)
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    queue.append(child)
+        return order, llc
+
+    def explode(self, demand):
+        """Flatten gross requirements for ``{sku: qty}`` across every BOM level.
+
+        Each node is visited once, in low-level-code order, so shared
+        subassemblies are summed before they are exploded further.
+        Returns ``{(source_type, code): gross_qty}`` including the demanded SKUs.
+        """
+        gross = defaultdict(float)
+        for sku, qty in demand.items():
+            gross[("component", sku)] += qty
+
+        for node in self.order:
+            qty = gross.get(node)
+            if not qty:
+                continue
+            for child, qty_per in self.children.get(node, ()):
+                gross[child] += qty * qty_per
+        return dict(gross)
+
+    def descendants(self, roots):
+        """Every node reachable from ``roots`` (inclusive)."""
+        seen = set(roots)
+        stack = list(roots)
+        while stack:
+            for child, _ in self.children.get(stack.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return seen
+
+    def ancestors(self, roots):
+        """Every node that uses any of ``roots`` directly or transitively (inclusive)."""
+        seen = set(roots)
+        stack = list(roots)
+        while stack:
+            for parent, _ in self.parents.get(stack.pop(), ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return seen
+
+    def find_cycle(self, parent_sku, child_skus):
+        """Path that adding ``parent_sku -> child_skus`` would close, or None.
+
+        Only the subgraph below the new children is searched: a cycle exists
+        iff the parent is reachable from one of them, counting lines that
+        already close a cycle.
+        """
+        target = ("component", parent_sku)
+        for sku in child_skus:
+            start = ("component", sku)
+            came_from = {start: None}
+            stack = [start]
+            while stack:
+                node = stack.pop()
+                if node == target:
+                    path = []
+                    while node is not None:
+                        path.append(node[1])
+                        node = came_from[node]
+                    return [parent_sku] + path[::-1]
+                for child, _ in self.children.get(node, []) + self.cyclic_children.get(node, []):
+                    if child[0] == "component" and child not in came_from:
+                        came_from[child] = node
+                        stack.append(child)
+        return None
+
+    def explode_tasks(self, tasks):
+        """Explode a list of ``ProductionTask`` rows (e.g. the pending schedule)."""
+        demand = defaultdict(float)
+        for t in tasks:
+            demand[t.component_sku] += t.quantity or 0
+        return self.explode(demand)
+
+
+# =========================================================
+# 2. CACHE
+# =========================================================
+_graph = None
+_version = 0
+_lock = threading.Lock()
+
+
+def cache_version():
+    """Monotonic counter bumped on every invalidation; used to key derived caches."""
+    return _version
+
+
+def get_bom_graph(session=None):
+    """Return the cached graph, loading it on first use after an invalidation.
+
+    Pass the caller's session so a load inside its transaction reuses its
+    connection instead of opening another one next to its write lock.
+    """
+    global _graph
+    graph = _graph
+    if graph is None:
+        with _lock:
+            if _graph is None:
+                _graph = BomGraph.load(session)
+            graph = _graph
+    return graph
+
+
+def invalidate_bom_cache():
+    """Drop the cached graph; call after any write to components or BOM lines."""
+    global _graph, _version
+    with _lock:
+        _graph = None
+        _version += 1
@@ -0,0 +1,85 @@
+# cache_sync.py
+# ---------------------------------------------------------
+# Keeps the per-process caches (BOM graph, cost rollup, scheduler,
+# netting run) in step across worker processes and CLI runs.
+#
+# A transaction that changes what those caches are built from calls
+# mark_changed(session) before committing; its commit bumps the single
+# cache_version row. Each request, and each POS bridge drain, starts with
+# sync(): if another process moved the version, every cache is dropped
+# and rebuilds on next use. This process's own commits only advance the
+# version it has seen, since it already updated its caches in place.
+#
+# Derived writes (std_cost, planned start/due, planned_purchases) never
+# bump: they follow from the inputs, so workers don't invalidate each
+# other just for rebuilding.
+
+import threading
+
+from sqlalchemy import event, text
+
+from databases import SessionFactory
+from bom import invalidate_bom_cache
+from costing import invalidate_costs
+from netting import invalidate_purchase_plan
+from scheduler import invalidate_scheduler
+
+_BUMP_SQL = text(
+    "INSERT INTO cache_version (id, version) VALUES (1, 1) "
+    "ON CONFLICT (id) DO UPDATE SET version = version + 1 RETURNING version"
+)
+_READ_SQL = text("SELECT version FROM cache_version WHERE id = 1")
+
+_seen = None                # cache_version the caches of this process reflect
+_lock = threading.Lock()
+
+
+def invalidate_all():
+    """Drop every cache; each rebuilds from the database on next use."""
+    invalidate_bom_cache()
+    invalidate_costs()
+    invalidate_purchase_plan()
+    invalidate_scheduler()
+
+
+def mark_changed(session):
+    """Have the next commit of ``session`` tell other processes to drop their caches."""
+    session.info["cache_changed"] = True
+
+
+def sync(session):
+    """Drop the caches if another process committed a change since this one last looked."""
+    global _seen
+    version = session.execute(_READ_SQL).scalar() or 0
+    with _lock:
+        if version == _seen:
+            return
+        _seen = version
+    invalidate_all()
+
+
+@event.listens_for(SessionFactory, "before_commit")
+def _bump(session):
+    if session.info.pop("cache_changed", False):
+        session.info["cache_version"] = session.execute(_BUMP_SQL).scalar()
+
+
+@event.listens_for(SessionFactory, "after_commit")
+def _committed(session):
+    global _seen
+    version = session.info.pop("cache_version", None)
+    if version is None:
+        return
+    with _lock:
+        ours_only = _seen is not None and version == _seen + 1
+        _seen = version
+    if not ours_only:
+        invalidate_all()        # another process committed in between: our in-place updates may be stale
+
+
+@event.listens_for(SessionFactory, "after_rollback")
+def _rolled_back(session):
+    # The caller may already have updated the caches for changes that are now gone
+    changed = session.info.pop("cache_changed", False)
+    if session.info.pop("cache_version", None) is not None or changed:
+        invalidate_all()
@@ -0,0 +1,100 @@
+# costing.py
+# ---------------------------------------------------------
+# Rolled-up standard (material) cost per component:
+#   std_cost = Σ qty_per × cost(child), base item cost = unit_price.
+#
+# Costs are memoized per BOM node and computed children-first, so a full
+# rollup is a single pass over the DAG and shared subassemblies are
+# costed once. Later changes only recompute their where-used ancestors.
+
+import threading
+
+from sqlalchemy import text, bindparam
+
+from bom import get_bom_graph
+
+
+class CostRollup:
+    def __init__(self):
+        self.cost = {}             # component node -> unit cost
+        self.prices = {}           # base name -> unit_price
+
+    def _load_prices(self, session, names=None):
+        sql = "SELECT name, MAX(unit_price) FROM base_items {filter} GROUP BY name"
+        if names is None:
+            rows = session.execute(text(sql.format(filter=""))).all()
+        else:
+            stmt = text(sql.format(filter="WHERE name IN :names")).bindparams(bindparam("names", expanding=True))
+            rows = session.execute(stmt, {"names": list(names)}).all()
+        self.prices.update((name, price or 0.0) for name, price in rows)
+
+    def _unit_cost(self, node):
+        source, code = node
+        return self.prices.get(code, 0.0) if source == "base" else self.cost.get(node, 0.0)
+
+    def _recompute(self, graph, nodes):
+        """Cost ``nodes`` deepest level first; returns ``{sku: cost}`` for changed components."""
+        llc = graph.low_level_codes
+        changed = {}
+        for node in sorted(nodes, key=lambda n: llc.get(n, 0), reverse=True):
+            if node[0] != "component":
+                continue                # base items are priced directly
+            cost = sum(qty_per * self._unit_cost(child) for child, qty_per in graph.children.get(node, ()))
+            if self.cost.get(node) != cost:
+                self.cost[node] = cost
+                changed[node[1]] = cost
+        return changed
+
+    def rollup_all(self, session, graph):
+        self.prices, self.cost = {}, {}
+        self._load_prices(session)
+        return self._recompute(graph, graph.order)
+
+    def rollup_changed(self, session, graph, skus=(), names=()):
+        """Re-cost changed components / re-priced base items and everything that uses them."""
+        if names:
+            self._load_prices(session, names)
+        roots = {("component", s) for s in skus} | {("base", n) for n in names}
+        return self._recompute(graph, graph.ancestors(roots))
+
+
+def save_costs(session, changed):
+    """Write changed std_cost values with one executemany UPDATE."""
+    if changed:
+        session.execute(
+            text("UPDATE components SET std_cost = :cost WHERE sku = :sku"),
+            [{"sku": sku, "cost": cost} for sku, cost in changed.items()],
+        )
+
+
+# =========================================================
+# CACHE
+# =========================================================
+_rollup = None
+_lock = threading.Lock()
+
+
+def update_costs(session, skus=(), names=(), graph=None):
+    """Roll up costs after a BOM or price change; the caller commits.
+
+    The first call costs the whole catalog; later calls only touch the
+    where-used ancestors of the given component SKUs and base item names.
+    Pass ``graph`` when the BOM change is not committed yet.
+    """
+    global _rollup
+    with _lock:
+        graph = graph or get_bom_graph(session)
+        if _rollup is None:
+            _rollup = CostRollup()
+            changed = _rollup.rollup_all(session, graph)
+        else:
+            changed = _rollup.rollup_changed(session, graph, skus, names)
+        save_costs(session, changed)
+        return changed
+
+
+def invalidate_costs():
+    """Forget memoized costs; the next update_costs() rolls up the whole catalog again."""
+    global _rollup
+    with _lock:
+        _rollup = None
@@ -1,23 +1,145 @@
 # databases.py
 # ---------------------------------------------------------
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-from datetime import datetime, timedelta
+import functools
+import itertools
+import os
+import sqlite3
+import threading
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, DateTime, ForeignKey, Index, inspect, text, bindparam
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship, Session as OrmSession
+from datetime import datetime
 
 
 # =========================================================
-# 1. BASE ITEMS (BUY)
+# 0. ENGINE & SESSIONS
 # =========================================================
-BaseItemBase = declarative_base()
-base_engine = create_engine("sqlite:///base.db", connect_args={"check_same_thread": False})
-BaseItemSession = sessionmaker(bind=base_engine)
+# One SQLite file holds base items, components and the schedule so they
+# can be joined and updated atomically. Override with MRP_DATABASE_URL,
+# or "memory" for a private in-memory database (tests, benchmarks).
+#
+# Nothing connects at import. configure() creates the engine (app.py's
+# create_app() calls it with the app config); otherwise the first session
+# or get_engine() call configures from the environment and creates the
+# schema. A forked worker drops the pool it inherited and opens its own.
+DEFAULT_DATABASE_URL = "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "mrp.db")
+DATABASE_URL = os.environ.get("MRP_DATABASE_URL", DEFAULT_DATABASE_URL)
+POOL_SIZE = int(os.environ.get("MRP_DB_POOL_SIZE", 10))
+MAX_OVERFLOW = int(os.environ.get("MRP_DB_MAX_OVERFLOW", 20))
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",          # readers no longer block on the writer
+    "synchronous": "NORMAL",        # safe with WAL, one fsync per checkpoint
+    "cache_size": -64000,           # 64 MB page cache per connection
+    "mmap_size": 268435456,         # 256 MB memory-mapped reads
+    "busy_timeout": 5000,           # wait for the write lock instead of failing
+}
+
+_engine = None
+_engine_lock = threading.RLock()
+_schema_engine = None              # the engine whose schema init_schema() has brought up to date
+_memory_keeper = None               # holds a shared in-memory database open
+_memory_databases = itertools.count(1)
+
+
+def memory_url():
+    """A new in-memory database shared by every connection of this process."""
+    name = f"mrp-{os.getpid()}-{next(_memory_databases)}"
+    if sqlite3.sqlite_version_info >= (3, 36):
+        # memdb VFS: ordinary file locking, so busy_timeout waits for the writer as on disk
+        return f"sqlite:///file:/{name}?vfs=memdb&uri=true"
+    # Older SQLite: shared cache, where a second writer fails at once ("database table is locked")
+    return f"sqlite:///file:{name}?mode=memory&cache=shared&uri=true"
+
+
+def configure(url=None, pool_size=None, max_overflow=None):
+    """Create the engine for ``url`` (default MRP_DATABASE_URL) and make it current; returns it.
+
+    Does not connect or touch the schema. Replaces any previous engine.
+    """
+    global _engine, _memory_keeper
+    url = url or DATABASE_URL
+    memory = url == "memory"
+    if memory:
+        url = memory_url()
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_pre_ping=True,
+        # SQLAlchemy picks a per-thread pool for mode=memory URLs; these are shared, so pool normally
+        **({"poolclass": QueuePool} if memory else {}),
+    )
+    if engine.dialect.name == "sqlite":
+        # memdb has no WAL, and asking for it needs the write lock: a connection opened mid-write would fail
+        pragmas = {k: v for k, v in SQLITE_PRAGMAS.items() if not (memory and k == "journal_mode")}
+        event.listen(engine, "connect", functools.partial(_set_sqlite_pragmas, pragmas))
+    with _engine_lock:
+        if _memory_keeper is not None:
+            _memory_keeper.close()
+        if _engine is not None:
+            _engine.dispose()
+        _engine = engine
+        # The database lives only while a connection to it is open
+        _memory_keeper = engine.raw_connection() if memory else None
+    return engine
+
+
+def get_engine():
+    """The current engine, configured from the environment (schema included) on first use."""
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                configure()
+                init_schema()
+    return _engine
+
+
+def _set_sqlite_pragmas(pragmas, dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _after_fork():
+    # Connections must not be shared with the parent: forget them without closing
+    global _memory_keeper
+    if _engine is not None:
+        _engine.dispose(close=False)
+    _memory_keeper = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class _Session(OrmSession):
+    """Binds to whichever engine is current when it first needs a connection."""
+
+    def get_bind(self, *args, **kwargs):
+        return get_engine()
+
+
+Base = declarative_base()
+SessionFactory = sessionmaker(class_=_Session)
+
+# Request-scoped session, removed by the app's teardown handler.
+# The old per-database names are kept so existing call sites read the same.
+Session = scoped_session(SessionFactory)
+BaseItemSession = ComponentSession = ScheduleSession = Session
+
 
-class BaseItem(BaseItemBase):
+# =========================================================
+# 1. BASE ITEMS (BUY)
+# =========================================================
+class BaseItem(Base):
     __tablename__ = "base_items"
 
     id = Column(Integer, primary_key=True)             # Auto-increment ID
-    name = Column(String, nullable=False)              # Item name
+    name = Column(String, nullable=False, index=True)  # Item name; not unique, rows sharing one are summed
     vendor = Column(String, default="")                # Supplier/vendor name
     unit_price = Column(Float, default=0.0)            # Purchase cost per unit
     qty_in_stock = Column(Float, default=0.0)          # Available stock quantity
@@ -25,25 +147,22 @@ class BaseItem(BaseItemBase):
     def __repr__(self):
         return f"<BaseItem id={self.id} name={self.name} vendor={self.vendor} price={self.unit_price} qty={self.qty_in_stock}>"
 
-# Create database
-BaseItemBase.metadata.create_all(base_engine)
-
-
 # =========================================================
 # 2. COMPONENTS (MAKE)
 # =========================================================
-ComponentBase = declarative_base()
-component_engine = create_engine("sqlite:///components.db", connect_args={"check_same_thread": False})
-ComponentSession = sessionmaker(bind=component_engine)
-
-class Component(ComponentBase):
+class Component(Base):
     __tablename__ = "components"
 
     id = Column(Integer, primary_key=True)
     sku = Column(String, unique=True, index=True)       # e.g., ITEM-A
     name = Column(String)
-    lead_time = Column(Integer, default=0)
+    lead_time = Column(Integer, default=0)             # Hours per unit
     qty_in_stock = Column(Float, default=0.0)          # Available stock quantity
+    work_center = Column(String, nullable=True)        # WorkCenter.name; None = unconstrained
+    std_cost = Column(Float, default=0.0)              # Rolled-up material cost, set by costing.py
+    pos_product_id = Column(String, nullable=True, index=True)  # POS product sold as this SKU; None = same as sku
+    reorder_point = Column(Float, default=0.0)         # Replenish when stock + pending falls below; 0 = never
+    reorder_qty = Column(Float, default=0.0)           # Minimum replenishment task size
 
     # Relationship: this component’s BOM lines
     bom_lines = relationship("ComponentBOM", back_populates="parent", cascade="all, delete-orphan")
@@ -51,32 +170,28 @@ class Component(ComponentBase):
     def __repr__(self):
         return f"<Component sku={self.sku} name={self.name}>"
 
-class ComponentBOM(ComponentBase):
+class ComponentBOM(Base):
     __tablename__ = "component_boms"
 
     id = Column(Integer, primary_key=True)
-    parent_sku = Column(String, ForeignKey("components.sku"))
+    parent_sku = Column(String, ForeignKey("components.sku"), index=True)
     child_sku = Column(String)          # Can reference a base item OR another component
     qty_per = Column(Float)
     source_type = Column(String)        # "base" or "component" — tells recursion where to look
 
+    __table_args__ = (
+        Index("ix_component_boms_child", "child_sku", "source_type"),    # where-used lookups
+    )
+
     parent = relationship("Component", back_populates="bom_lines")
 
     def __repr__(self):
         return f"<BOM {self.parent_sku} ← {self.child_sku} x{self.qty_per} ({self.source_type})>"
 
-# Create database tables
-ComponentBase.metadata.create_all(component_engine)
-
 # =========================================================
 # 3. PRODUCTION SCHEDULE (TASK LIST)
 # =========================================================
-
-ScheduleBase = declarative_base()
-schedule_engine = create_engine("sqlite:///schedule.db", connect_args={"check_same_thread": False})
-ScheduleSession = sessionmaker(bind=schedule_engine)
-
-class ProductionTask(ScheduleBase):
+class ProductionTask(Base):
     __tablename__ = "production_tasks"
 
     id = Column(Integer, primary_key=True)
@@ -84,28 +199,222 @@ class ProductionTask(ScheduleBase):
     quantity = Column(Integer, default=1)
     status = Column(String, default="pending")
     created_at = Column(String, default=lambda: datetime.now().strftime("%Y-%m-%d %H:%M"))
+    planned_start = Column(DateTime)                    # Set by scheduler.py
+    due_at = Column(DateTime)                           # Planned finish, set by scheduler.py
+    completed_at = Column(DateTime)                     # Set by inventory.complete_tasks
+
+    # /schedule filters: status and/or SKU, ordered by due date or id; created_at for date ranges
+    __table_args__ = (
+        Index("ix_production_tasks_status_due_at", "status", "due_at"),
+        Index("ix_production_tasks_sku_status_due_at", "component_sku", "status", "due_at"),
+        Index("ix_production_tasks_created_at", "created_at"),
+    )
 
     def __repr__(self):
         return f"<Task {self.id} {self.component_sku} x{self.quantity} {self.status}>"
 
     @property
     def estimated_completion(self):
-        """Compute ETA using (lead_time × quantity)."""
-        from databases import ComponentSession, Component
-        comp_session = ComponentSession()
-        comp = comp_session.query(Component).filter_by(sku=self.component_sku).first()
-        if not comp:
-            return "-"
-        try:
-            start = datetime.strptime(self.created_at, "%Y-%m-%d %H:%M")
-            total_hours = (comp.lead_time or 0) * self.quantity
-            eta = start + timedelta(hours=total_hours)
-            return eta.strftime("%Y-%m-%d %H:%M")
-        except Exception:
-            return "-"
+        """Formatted due date, or "-" when it could not be computed."""
+        return self.due_at.strftime("%Y-%m-%d %H:%M") if self.due_at else "-"
 
 
+class ProductionTaskArchive(Base):
+    """Completed tasks past the retention window, moved out by archive.py. Same ids as when live."""
+    __tablename__ = "production_tasks_archive"
+
+    id = Column(Integer, primary_key=True)
+    component_sku = Column(String)
+    quantity = Column(Integer)
+    status = Column(String)
+    created_at = Column(String)
+    planned_start = Column(DateTime)
+    due_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_production_tasks_archive_sku_status_due_at", "component_sku", "status", "due_at"),
+        Index("ix_production_tasks_archive_created_at", "created_at"),
+    )
+
+    @property
+    def estimated_completion(self):
+        return self.due_at.strftime("%Y-%m-%d %H:%M") if self.due_at else "-"
+
+
+# =========================================================
+# 4. WORK CENTERS (CAPACITY)
+# =========================================================
+class WorkCenter(Base):
+    __tablename__ = "work_centers"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    capacity = Column(Integer, default=1)              # Tasks it can run in parallel
+
+    def __repr__(self):
+        return f"<WorkCenter {self.name} x{self.capacity}>"
+
+
+# =========================================================
+# 5. PLANNED PURCHASES (MRP NETTING OUTPUT)
+# =========================================================
+class PlannedPurchase(Base):
+    __tablename__ = "planned_purchases"
+
+    base_item_name = Column(String, primary_key=True)  # Matches ComponentBOM.child_sku for "base" lines
+    base_item_id = Column(Integer)
+    vendor = Column(String, index=True)
+    gross_qty = Column(Float, default=0.0)             # Demand from pending + planned production
+    on_hand = Column(Float, default=0.0)
+    net_qty = Column(Float, default=0.0)               # Suggested order quantity
+    unit_price = Column(Float, default=0.0)
+    est_cost = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<PlannedPurchase {self.base_item_name} x{self.net_qty} from {self.vendor}>"
+
+
+# =========================================================
+# 6. POS DEMAND BRIDGE STATE
+# =========================================================
+class PosBridgeState(Base):
+    __tablename__ = "pos_bridge_state"
+
+    id = Column(Integer, primary_key=True)              # Single row, id = 1
+    last_outbox_id = Column(Integer, default=0)         # Highest POS sales_outbox id applied here
+    updated_at = Column(DateTime, default=datetime.now)
+
+
+# =========================================================
+# 7. STOCK LEDGER
+# =========================================================
+# Every stock change is appended here; qty_in_stock on base items and
+# components is the cached running balance. See ledger.py.
+class StockMovement(Base):
+    __tablename__ = "stock_movements"
+
+    id = Column(Integer, primary_key=True)
+    moved_at = Column(DateTime, nullable=False, default=datetime.now)
+    item_type = Column(String, nullable=False)          # "base" (BaseItem.name) or "component" (Component.sku)
+    item_key = Column(String, nullable=False)
+    kind = Column(String, nullable=False)               # opening, receipt, production, consumption, sale
+    quantity = Column(Float, nullable=False)            # Signed: + into stock, - out of stock
+    reference = Column(String)                          # e.g. "task:42", "pos-outbox:100-180"
+
+    __table_args__ = (
+        Index("ix_stock_movements_item_time", "item_type", "item_key", "moved_at"),  # history / deltas per item
+        Index("ix_stock_movements_moved_at", "moved_at"),                             # snapshot windows
+        {"sqlite_autoincrement": True},
+    )
+
     def __repr__(self):
-        return f"<Task {self.id} {self.component_sku} {self.status}>"
+        return f"<StockMovement {self.kind} {self.item_type}:{self.item_key} {self.quantity:+g}>"
+
+
+class StockSnapshot(Base):
+    __tablename__ = "stock_snapshots"
+
+    item_type = Column(String, primary_key=True)
+    item_key = Column(String, primary_key=True)
+    as_of = Column(DateTime, primary_key=True)          # Balance includes every movement with moved_at <= as_of
+    balance = Column(Float, nullable=False)
+
+
+# =========================================================
+# 8. CACHE VERSION
+# =========================================================
+# Single row (id = 1), bumped by every commit that changes what the
+# in-process caches are built from. See cache_sync.py.
+class CacheVersion(Base):
+    __tablename__ = "cache_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# Columns added after tables were first created; create_all() skips them
+_ADDED_COLUMNS = {
+    "production_tasks": [("due_at", "DATETIME"), ("planned_start", "DATETIME"), ("completed_at", "DATETIME")],
+    "components": [("work_center", "VARCHAR"), ("std_cost", "FLOAT"), ("pos_product_id", "VARCHAR"),
+                   ("reorder_point", "FLOAT DEFAULT 0"), ("reorder_qty", "FLOAT DEFAULT 0")],
+}
+
+# Ledger opening rows for stock that predates it
+_OPENING_BALANCES_SQL = [
+    "INSERT INTO stock_movements (moved_at, item_type, item_key, kind, quantity) "
+    "SELECT :now, 'base', name, 'opening', SUM(qty_in_stock) FROM base_items "
+    "GROUP BY name HAVING SUM(qty_in_stock) != 0",
+    "INSERT INTO stock_movements (moved_at, item_type, item_key, kind, quantity) "
+    "SELECT :now, 'component', sku, 'opening', qty_in_stock FROM components WHERE qty_in_stock != 0",
+]
+
+# std_cost for components that have none yet (rows from before costing.py,
+# or copied in by migrate.py): the whole BOM below each one, expanded down
+# to its base items. A line leading back into its own path is skipped,
+# the way BomGraph skips cycles. From then on costing.py keeps it current.
+_STD_COST_SQL = """
+    WITH RECURSIVE prices(name, price) AS (
+        SELECT name, MAX(unit_price) FROM base_items GROUP BY name
+    ),
+    expanded(sku, child_sku, source_type, qty, path) AS (
+        SELECT b.parent_sku, b.child_sku, b.source_type, b.qty_per, ',' || b.parent_sku || ','
+        FROM component_boms b JOIN components c ON c.sku = b.parent_sku
+        WHERE c.std_cost IS NULL
+        UNION ALL
+        SELECT e.sku, b.child_sku, b.source_type, e.qty * b.qty_per, e.path || b.parent_sku || ','
+        FROM expanded e JOIN component_boms b ON b.parent_sku = e.child_sku
+        WHERE e.source_type = 'component' AND instr(e.path, ',' || e.child_sku || ',') = 0
+    )
+    UPDATE components SET std_cost = costs.cost
+    FROM (SELECT e.sku, SUM(e.qty * p.price) AS cost
+          FROM expanded e JOIN prices p ON p.name = e.child_sku
+          WHERE e.source_type = 'base' GROUP BY e.sku) AS costs
+    WHERE components.sku = costs.sku AND components.std_cost IS NULL
+"""
+
+
+def upgrade_schema(engine):
+    """Bring databases created by older versions up to the current models."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            for name, sql_type in columns:
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM stock_movements LIMIT 1")).first() is None:
+            # No history yet: open the ledger at the current balances
+            for sql in _OPENING_BALANCES_SQL:
+                conn.execute(text(sql).bindparams(bindparam("now", type_=DateTime)), {"now": datetime.now()})
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM components WHERE std_cost IS NULL LIMIT 1")).first() is not None:
+            conn.execute(text(_STD_COST_SQL))
+            conn.execute(text("UPDATE components SET std_cost = 0.0 WHERE std_cost IS NULL"))
+
+
+# =========================================================
+# 9. CREATE TABLES
+# =========================================================
+def init_schema():
+    """Create missing tables and apply upgrades, once per engine per process."""
+    global _schema_engine
+    engine = get_engine()
+    with _engine_lock:
+        if _schema_engine is engine:
+            return
+        Base.metadata.create_all(engine)
+        upgrade_schema(engine)
+        _schema_engine = engine
+
 
-ScheduleBase.metadata.create_all(schedule_engine)
\ No newline at end of file
+if __name__ == "__main__":
+    # Schema setup as a deploy step, before starting any workers
+    init_schema()
+    print(f"✅ Schema ready in {get_engine().url}")
@@ -0,0 +1,249 @@
+# demand_bridge.py
+# ---------------------------------------------------------
+# Feeds POS sales into MRP. POS checkout writes units sold to its
+# sales_outbox table; this consumer drains it in batches:
+#
+#   1. sum the batch per POS product and map it to a Component
+#      (Component.pos_product_id, or the same SKU when unset)
+#   2. decrement finished-goods stock and append "sale" movements to the
+#      stock ledger
+#   3. for SKUs with a reorder point, top projected stock (on hand +
+#      pending tasks) back up by growing a not-yet-started pending task
+#      or creating a new one
+#
+# The stock updates and the new outbox offset commit together in
+# mrp.db, so a batch is applied exactly once even if the consumer dies
+# before pruning the outbox.
+#
+#   python demand_bridge.py            drain once
+#   python demand_bridge.py --loop     keep draining every MRP_POS_BRIDGE_SECONDS
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text, bindparam, or_
+
+from databases import SessionFactory, Component, ProductionTask, PosBridgeState
+from scheduler import reschedule
+from netting import update_purchase_plan
+import cache_sync
+import ledger
+
+logger = logging.getLogger(__name__)
+
+POS_OUTBOX_URL = os.environ.get(
+    "MRP_POS_OUTBOX_URL",
+    "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pos", "pos.db"),
+)
+BATCH_SIZE = int(os.environ.get("MRP_POS_BRIDGE_BATCH", 5000))
+POLL_SECONDS = float(os.environ.get("MRP_POS_BRIDGE_SECONDS", 5))
+
+_outbox_engine = None
+_outbox_has_table = False          # sales_outbox seen once; POS never drops it
+
+
+def _outbox():
+    global _outbox_engine
+    if _outbox_engine is None:
+        _outbox_engine = create_engine(POS_OUTBOX_URL, connect_args={"timeout": 5})
+    return _outbox_engine
+
+
+def _outbox_missing():
+    """True while the POS SQLite file does not exist yet (connecting would create it)."""
+    url = _outbox().url
+    return url.get_backend_name() == "sqlite" and bool(url.database) and not os.path.exists(url.database)
+
+
+def _outbox_ready():
+    """True once the POS database exists with its sales_outbox table (POS creates it on first start)."""
+    global _outbox_has_table
+    if not _outbox_has_table and not _outbox_missing():
+        _outbox_has_table = inspect(_outbox()).has_table("sales_outbox")
+    return _outbox_has_table
+
+
+_FETCH_SQL = text(
+    "SELECT id, product_id, quantity FROM sales_outbox WHERE id > :after ORDER BY id LIMIT :limit"
+)
+_PRUNE_SQL = text("DELETE FROM sales_outbox WHERE id <= :upto")
+
+_PENDING_SQL = text(
+    "SELECT component_sku, SUM(quantity) FROM production_tasks "
+    "WHERE status = 'pending' AND component_sku IN :skus GROUP BY component_sku"
+).bindparams(bindparam("skus", expanding=True))
+
+# Latest pending task per SKU that has not started yet; replenishment grows it instead of adding another
+_MERGE_TARGET_SQL = text(
+    "SELECT component_sku, MAX(id) FROM production_tasks "
+    "WHERE status = 'pending' AND component_sku IN :skus "
+    "AND (planned_start IS NULL OR planned_start > :now) GROUP BY component_sku"
+).bindparams(bindparam("skus", expanding=True))
+
+_GROW_TASK_SQL = text("UPDATE production_tasks SET quantity = quantity + :qty WHERE id = :id")
+
+
+_ENSURE_STATE_SQL = text("INSERT OR IGNORE INTO pos_bridge_state (id, last_outbox_id) VALUES (1, 0)")
+
+# Advancing the offset first takes the write lock, so two consumers can never apply the same batch
+_CLAIM_SQL = text(
+    "UPDATE pos_bridge_state SET last_outbox_id = :upto, updated_at = :now "
+    "WHERE id = 1 AND last_outbox_id = :after"
+)
+
+
+def _replenish(session, skus):
+    """Create or grow pending tasks for ``skus`` now below their reorder point."""
+    rows = session.query(Component.sku, Component.qty_in_stock, Component.reorder_point, Component.reorder_qty) \
+        .filter(Component.sku.in_(skus), Component.reorder_point > 0).all()
+    if not rows:
+        return []
+    keys = [r.sku for r in rows]
+    pending = dict(session.execute(_PENDING_SQL, {"skus": keys}).all())
+
+    needed = {}
+    for sku, stock, reorder_point, reorder_qty in rows:
+        projected = (stock or 0) + (pending.get(sku) or 0)
+        if projected < reorder_point:
+            needed[sku] = int(max(reorder_point - projected, reorder_qty or 0) + 0.999999)  # whole units
+    if not needed:
+        return []
+
+    now = datetime.now()
+    targets = dict(session.execute(_MERGE_TARGET_SQL, {"skus": list(needed), "now": now}).all())
+    merged = [(task_id, sku) for sku, task_id in targets.items()]
+    if merged:
+        session.execute(_GROW_TASK_SQL, [{"id": task_id, "qty": needed[sku]} for task_id, sku in merged])
+
+    created_at = now.strftime("%Y-%m-%d %H:%M")
+    new_tasks = [ProductionTask(component_sku=sku, status="pending", quantity=qty, created_at=created_at)
+                 for sku, qty in needed.items() if sku not in targets]
+    session.add_all(new_tasks)
+    session.flush()
+
+    changed = merged + [(t.id, t.component_sku) for t in new_tasks]
+    planned = {row.id: row for row in session.query(
+        ProductionTask.id, ProductionTask.quantity, ProductionTask.created_at
+    ).filter(ProductionTask.id.in_([task_id for task_id, _ in changed]))}
+
+    def apply(scheduler):
+        plan = scheduler.remove(*(task_id for task_id, _ in merged))
+        for task_id, sku in changed:
+            row = planned[task_id]
+            plan.update(scheduler.add(task_id, sku, row.quantity, row.created_at))
+        return plan
+
+    reschedule(session, apply)
+    return changed
+
+
+def drain_once(batch_size=BATCH_SIZE):
+    """Apply one batch from the POS outbox; returns the number of outbox rows consumed."""
+    if not _outbox_ready():
+        return 0
+    session = SessionFactory()
+    try:
+        cache_sync.sync(session)            # replenishment reschedules on this process's caches
+        session.execute(_ENSURE_STATE_SQL)
+        session.commit()
+        after = session.query(PosBridgeState.last_outbox_id).filter_by(id=1).scalar() or 0
+        with _outbox().connect() as conn:
+            batch = conn.execute(_FETCH_SQL, {"after": after, "limit": batch_size}).all()
+        if not batch:
+            return 0
+        claimed = session.execute(_CLAIM_SQL, {"upto": batch[-1][0], "after": after, "now": datetime.now()})
+        if claimed.rowcount == 0:
+            session.rollback()                  # another consumer applied it first
+            return 0
+
+        sold = defaultdict(int)
+        for _, product_id, quantity in batch:
+            sold[product_id] += quantity or 0
+
+        # POS product -> SKU: an explicit pos_product_id wins over a matching SKU
+        sku_of = {}
+        for sku, pos_id in session.query(Component.sku, Component.pos_product_id).filter(
+                or_(Component.pos_product_id.in_(list(sold)), Component.sku.in_(list(sold)))):
+            if pos_id in sold:
+                sku_of[pos_id] = sku
+            elif sku in sold and (pos_id is None or pos_id == sku):
+                sku_of.setdefault(sku, sku)
+
+        decrements = defaultdict(int)
+        for product_id, qty in sold.items():
+            if product_id in sku_of:
+                decrements[sku_of[product_id]] += qty
+        if decrements:
+            reference = f"pos-outbox:{batch[0][0]}-{batch[-1][0]}"
+            ledger.move_stock(session, [("component", sku, ledger.SALE, -qty, reference)
+                                        for sku, qty in decrements.items()])
+            changed = _replenish(session, list(decrements))
+            update_purchase_plan(session, skus=set(decrements) | {sku for _, sku in changed})
+            cache_sync.mark_changed(session)
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    # Applied and committed above; pruning is only housekeeping
+    with _outbox().begin() as conn:
+        conn.execute(_PRUNE_SQL, {"upto": batch[-1][0]})
+    return len(batch)
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Drain until the outbox is empty; returns rows consumed."""
+    total = 0
+    while True:
+        n = drain_once(batch_size)
+        total += n
+        if n < batch_size:
+            return total
+
+
+# =========================================================
+# BACKGROUND CONSUMER
+# =========================================================
+_consumer = None
+_consumer_lock = threading.Lock()
+
+
+def start_consumer(interval=POLL_SECONDS):
+    """Start the draining thread once per process; no-op when interval <= 0."""
+    global _consumer
+    if interval <= 0 or _consumer is not None:
+        return
+    with _consumer_lock:
+        if _consumer is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    drain()
+                except Exception:
+                    logger.exception("POS demand bridge failed")
+                time.sleep(interval)
+
+        _consumer = threading.Thread(target=run, name="pos-demand-bridge", daemon=True)
+        _consumer.start()
+
+
+if __name__ == "__main__":
+    if "--loop" in sys.argv[1:]:
+        print(f"🔁 Draining {POS_OUTBOX_URL} every {POLL_SECONDS:g}s")
+        while True:
+            n = drain()
+            if n:
+                print(f"✅ Applied {n} POS sale line(s)")
+            time.sleep(POLL_SECONDS)
+    else:
+        print(f"✅ Applied {drain()} POS sale line(s)")
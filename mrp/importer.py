@@ -0,0 +1,323 @@
+# importer.py
+# ---------------------------------------------------------
+# Bulk catalog import for base items, components and BOM lines.
+#
+#   python importer.py --base-items base.csv --components comps.jsonl --boms boms.csv
+#
+# Files are CSV (with a header row) or JSON Lines, picked by extension.
+# Rows are streamed, validated against the database plus everything
+# imported so far, and inserted with executemany in large batches; one
+# transaction per file. Bad rows are reported and skipped, never fatal.
+#
+# Each file's commit bumps the cache version, so running app workers drop
+# their BOM/schedule/cost caches on their next request (see cache_sync.py).
+
+import argparse
+import csv
+import io
+import json
+import math
+import sys
+import time
+
+from sqlalchemy import insert
+
+from databases import SessionFactory, BaseItem, Component, ComponentBOM
+from bom import invalidate_bom_cache
+from costing import update_costs
+import cache_sync
+import ledger
+
+BATCH_SIZE = 10000
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = {"base_items": 0, "components": 0, "component_boms": 0}
+        self.errors = []               # (file label, line number, message)
+        self.changed_skus = set()      # components imported or given new BOM lines
+        self.changed_names = set()     # base items imported
+        self.started = time.perf_counter()
+
+    def error(self, label, line_no, message):
+        self.errors.append((label, line_no, message))
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return sum(self.inserted.values()) / elapsed if elapsed else 0.0
+
+    def summary(self):
+        counts = ", ".join(f"{n} {table}" for table, n in self.inserted.items())
+        return f"Imported {counts}; {len(self.errors)} row(s) rejected ({self.rows_per_second:,.0f} rows/s)"
+
+
+# =========================================================
+# READING
+# =========================================================
+def read_rows(stream, filename):
+    """Yield ``(line_no, dict)`` from a CSV or JSONL text stream; unusable lines yield the error instead."""
+    if filename.lower().endswith((".jsonl", ".json", ".ndjson")):
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+                continue
+            if not isinstance(row, dict):
+                row = ValueError(f"expected a JSON object, got {type(row).__name__}")
+            yield line_no, row
+    else:
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_no, row
+
+
+def _text(value):
+    return str(value).strip() if value is not None else ""
+
+
+def _number(value, cast, default=0):
+    value = _text(value)
+    if not value:
+        return default
+    number = cast(value)
+    if not math.isfinite(number):
+        raise ValueError(f"'{value}' is not a finite number")
+    return number
+
+
+def _batched_insert(session, table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+# =========================================================
+# VALIDATION + INSERT
+# =========================================================
+def _import_base_items(session, stream, filename, report, known_names):
+    rows = []
+    for line_no, raw in read_rows(stream, filename):
+        if isinstance(raw, Exception):
+            report.error(filename, line_no, f"unreadable row: {raw}")
+            continue
+        try:
+            name = _text(raw.get("name"))
+            if not name:
+                raise ValueError("name is required")
+            if name in known_names:
+                raise ValueError(f"base item '{name}' already exists")
+            row = {
+                "name": name,
+                "vendor": _text(raw.get("vendor")),
+                "unit_price": _number(raw.get("unit_price"), float, 0.0),
+                "qty_in_stock": _number(raw.get("qty_in_stock"), float, 0.0),
+            }
+        except ValueError as e:
+            report.error(filename, line_no, str(e))
+            continue
+        known_names.add(name)
+        rows.append(row)
+    _batched_insert(session, BaseItem.__table__, rows)
+    ledger.append_movements(session, [("base", r["name"], ledger.OPENING, r["qty_in_stock"], filename)
+                                      for r in rows])
+    report.inserted["base_items"] += len(rows)
+    return [r["name"] for r in rows]
+
+
+def _import_components(session, stream, filename, report, known_skus):
+    rows = []
+    for line_no, raw in read_rows(stream, filename):
+        if isinstance(raw, Exception):
+            report.error(filename, line_no, f"unreadable row: {raw}")
+            continue
+        try:
+            sku = _text(raw.get("sku"))
+            name = _text(raw.get("name"))
+            if not sku or not name:
+                raise ValueError("sku and name are required")
+            if sku in known_skus:
+                raise ValueError(f"component '{sku}' already exists")
+            row = {
+                "sku": sku,
+                "name": name,
+                "lead_time": _number(raw.get("lead_time"), int, 0),
+                "qty_in_stock": _number(raw.get("qty_in_stock"), float, 0.0),
+                "work_center": _text(raw.get("work_center")) or None,
+            }
+        except ValueError as e:
+            report.error(filename, line_no, str(e))
+            continue
+        known_skus.add(sku)
+        rows.append(row)
+    _batched_insert(session, Component.__table__, rows)
+    ledger.append_movements(session, [("component", r["sku"], ledger.OPENING, r["qty_in_stock"], filename)
+                                      for r in rows])
+    report.inserted["components"] += len(rows)
+    return [r["sku"] for r in rows]
+
+
+def _cyclic_edges(edges):
+    """Edges ``(parent, child)`` whose ends share a strongly connected component.
+
+    Iterative Tarjan over the whole component graph: one O(V + E) pass
+    however many rows were imported.
+    """
+    graph = {}
+    for parent, child in edges:
+        graph.setdefault(parent, []).append(child)
+        graph.setdefault(child, [])
+
+    index, low, on_stack, scc_of = {}, {}, set(), {}
+    stack, counter = [], 0
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph[child])))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                low[work[-1][0]] = min(low[work[-1][0]], low[node])
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    scc_of[member] = node
+                    if member == node:
+                        break
+
+    return {(p, c) for p, c in edges if p == c or scc_of[p] == scc_of[c]}
+
+
+def _import_boms(session, stream, filename, report, known_skus, known_names, existing_edges):
+    candidates = []                    # (line_no, row)
+    for line_no, raw in read_rows(stream, filename):
+        if isinstance(raw, Exception):
+            report.error(filename, line_no, f"unreadable row: {raw}")
+            continue
+        try:
+            parent = _text(raw.get("parent_sku"))
+            child = _text(raw.get("child_sku"))
+            source = _text(raw.get("source_type")) or "base"
+            qty = _number(raw.get("qty_per"), float, 0.0)
+            if source not in ("base", "component"):
+                raise ValueError(f"source_type must be 'base' or 'component', not '{source}'")
+            if parent not in known_skus:
+                raise ValueError(f"unknown parent component '{parent}'")
+            if source == "component" and child not in known_skus:
+                raise ValueError(f"unknown child component '{child}'")
+            if source == "base" and child not in known_names:
+                raise ValueError(f"unknown base item '{child}'")
+            if qty <= 0:
+                raise ValueError("qty_per must be positive")
+        except ValueError as e:
+            report.error(filename, line_no, str(e))
+            continue
+        candidates.append((line_no, {"parent_sku": parent, "child_sku": child,
+                                     "qty_per": qty, "source_type": source}))
+
+    new_edges = [(r["parent_sku"], r["child_sku"]) for _, r in candidates if r["source_type"] == "component"]
+    cyclic = _cyclic_edges(existing_edges + new_edges)
+
+    rows = []
+    for line_no, row in candidates:
+        if row["source_type"] == "component" and (row["parent_sku"], row["child_sku"]) in cyclic:
+            report.error(filename, line_no, f"would create a BOM cycle through '{row['parent_sku']}'")
+            continue
+        rows.append(row)
+    _batched_insert(session, ComponentBOM.__table__, rows)
+    report.inserted["component_boms"] += len(rows)
+    return {r["parent_sku"] for r in rows}
+
+
+def import_catalog(base_items=None, components=None, boms=None):
+    """Import any of the three files; each argument is ``(text_stream, filename)``.
+
+    Returns an ImportReport. Each file is committed as one transaction.
+    """
+    report = ImportReport()
+    session = SessionFactory()
+    try:
+        known_names = {name for (name,) in session.query(BaseItem.name)}
+        known_skus = {sku for (sku,) in session.query(Component.sku)}
+
+        if base_items:
+            report.changed_names.update(_import_base_items(session, *base_items, report, known_names))
+            cache_sync.mark_changed(session)
+            session.commit()
+        if components:
+            report.changed_skus.update(_import_components(session, *components, report, known_skus))
+            cache_sync.mark_changed(session)
+            session.commit()
+        if boms:
+            existing_edges = session.query(ComponentBOM.parent_sku, ComponentBOM.child_sku) \
+                .filter(ComponentBOM.source_type == "component").all()
+            report.changed_skus.update(_import_boms(session, *boms, report, known_skus, known_names,
+                                             [tuple(e) for e in existing_edges]))
+            cache_sync.mark_changed(session)
+            session.commit()
+
+        if report.changed_skus or report.changed_names:
+            invalidate_bom_cache()
+            update_costs(session, report.changed_skus, report.changed_names)
+            session.commit()
+    finally:
+        session.close()
+    return report
+
+
+def _open(path):
+    return (open(path, newline="", encoding="utf-8"), path) if path else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-import base items, components and BOM lines.")
+    parser.add_argument("--base-items", help="CSV/JSONL with name, vendor, unit_price, qty_in_stock")
+    parser.add_argument("--components", help="CSV/JSONL with sku, name, lead_time, qty_in_stock, work_center")
+    parser.add_argument("--boms", help="CSV/JSONL with parent_sku, child_sku, qty_per, source_type")
+    args = parser.parse_args(argv)
+
+    files = [_open(args.base_items), _open(args.components), _open(args.boms)]
+    try:
+        report = import_catalog(*files)
+    finally:
+        for f in files:
+            if f:
+                f[0].close()
+
+    for label, line_no, message in report.errors:
+        print(f"{label}:{line_no}: {message}", file=sys.stderr)
+    print(report.summary())
+    return 1 if report.errors else 0
+
+
+def upload_stream(file_storage):
+    """Wrap a Flask upload as ``(text_stream, filename)`` for import_catalog()."""
+    if not file_storage or not file_storage.filename:
+        return None
+    return io.TextIOWrapper(file_storage.stream, encoding="utf-8", newline=""), file_storage.filename
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# inventory.py
+# ---------------------------------------------------------
+# Stock movements driven by production. Everything here runs as
+# set-based SQL inside the caller's transaction; the caller commits.
+# Each completion also appends its consumption and output to the stock
+# ledger (see ledger.py), one row per task and item.
+
+from datetime import datetime
+
+from sqlalchemy import text, bindparam, DateTime
+
+
+class ShortageError(Exception):
+    """Completing the tasks would drive one or more children below zero."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages      # [(source_type, child_sku, required, on_hand)]
+        names = ", ".join(f"{sku} (need {req:g}, have {have:g})" for _, sku, req, have in shortages)
+        super().__init__(f"Insufficient stock: {names}")
+
+
+def _ids_sql(sql):
+    return text(sql).bindparams(bindparam("ids", expanding=True))
+
+
+def _ids_now_sql(sql):
+    return _ids_sql(sql).bindparams(bindparam("now", type_=DateTime))
+
+
+# Claiming the rows first takes SQLite's write lock, so concurrent
+# completions serialize here and a task can only be completed once.
+_CLAIM_SQL = _ids_now_sql(
+    "UPDATE production_tasks SET status = 'completed', completed_at = :now "
+    "WHERE id IN :ids AND status = 'pending' "
+    "RETURNING id, component_sku, quantity"
+)
+
+# Children required by the claimed tasks, summed per child
+_REQUIRED_CTE = (
+    "WITH req AS ("
+    " SELECT b.source_type AS source_type, b.child_sku AS child_sku,"
+    "        SUM(b.qty_per * t.quantity) AS required"
+    " FROM component_boms b JOIN production_tasks t ON t.component_sku = b.parent_sku"
+    " WHERE t.id IN :ids GROUP BY b.source_type, b.child_sku) "
+)
+
+_SHORTAGE_SQL = _ids_sql(
+    _REQUIRED_CTE
+    + "SELECT req.source_type, req.child_sku, req.required,"
+      " COALESCE(bi.qty_in_stock, c.qty_in_stock, 0) AS on_hand "
+      "FROM req "
+      "LEFT JOIN (SELECT name, SUM(qty_in_stock) AS qty_in_stock FROM base_items GROUP BY name) bi"
+      " ON req.source_type = 'base' AND bi.name = req.child_sku "
+      "LEFT JOIN components c ON req.source_type = 'component' AND c.sku = req.child_sku "
+      "WHERE COALESCE(bi.qty_in_stock, c.qty_in_stock, 0) < req.required"
+)
+
+# Base item names are not unique: rows sharing a name are one item whose
+# stock is their sum, so consumption comes off the lowest-id row only
+_CONSUME_BASE_SQL = _ids_sql(
+    "UPDATE base_items SET qty_in_stock = qty_in_stock - ("
+    " SELECT SUM(b.qty_per * t.quantity)"
+    " FROM component_boms b JOIN production_tasks t ON t.component_sku = b.parent_sku"
+    " WHERE t.id IN :ids AND b.source_type = 'base' AND b.child_sku = base_items.name) "
+    "WHERE id IN ("
+    " SELECT MIN(id) FROM base_items WHERE name IN ("
+    "  SELECT b.child_sku FROM component_boms b JOIN production_tasks t ON t.component_sku = b.parent_sku"
+    "  WHERE t.id IN :ids AND b.source_type = 'base')"
+    " GROUP BY name)"
+)
+
+_CONSUME_COMPONENT_SQL = _ids_sql(
+    "UPDATE components SET qty_in_stock = qty_in_stock - ("
+    " SELECT SUM(b.qty_per * t.quantity)"
+    " FROM component_boms b JOIN production_tasks t ON t.component_sku = b.parent_sku"
+    " WHERE t.id IN :ids AND b.source_type = 'component' AND b.child_sku = components.sku) "
+    "WHERE sku IN ("
+    " SELECT b.child_sku FROM component_boms b JOIN production_tasks t ON t.component_sku = b.parent_sku"
+    " WHERE t.id IN :ids AND b.source_type = 'component')"
+)
+
+_PRODUCE_SQL = _ids_sql(
+    "UPDATE components SET qty_in_stock = qty_in_stock + ("
+    " SELECT SUM(t.quantity) FROM production_tasks t"
+    " WHERE t.id IN :ids AND t.component_sku = components.sku) "
+    "WHERE sku IN (SELECT component_sku FROM production_tasks WHERE id IN :ids)"
+)
+
+_LEDGER_CONSUMPTION_SQL = _ids_now_sql(
+    "INSERT INTO stock_movements (moved_at, item_type, item_key, kind, quantity, reference) "
+    "SELECT :now, b.source_type, b.child_sku, 'consumption', -SUM(b.qty_per * t.quantity), 'task:' || t.id "
+    "FROM component_boms b JOIN production_tasks t ON t.component_sku = b.parent_sku "
+    "WHERE t.id IN :ids AND b.source_type IN ('base', 'component') "
+    "GROUP BY t.id, b.source_type, b.child_sku HAVING SUM(b.qty_per * t.quantity) != 0"
+)
+
+_LEDGER_PRODUCTION_SQL = _ids_now_sql(
+    "INSERT INTO stock_movements (moved_at, item_type, item_key, kind, quantity, reference) "
+    "SELECT :now, 'component', component_sku, 'production', quantity, 'task:' || id "
+    "FROM production_tasks WHERE id IN :ids AND quantity != 0"
+)
+
+
+def complete_tasks(session, task_ids, check_shortage=False):
+    """Complete pending tasks and backflush their BOM children.
+
+    Runs a fixed number of statements however many tasks or BOM lines are
+    involved. Tasks that are no longer pending are skipped. Returns the
+    claimed ``(id, component_sku, quantity)`` rows; raises ShortageError
+    (leaving the rollback to the caller) when ``check_shortage`` is set
+    and any child would go negative.
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return []
+
+    now = datetime.now()
+    claimed = session.execute(_CLAIM_SQL, {"ids": task_ids, "now": now}).all()
+    if not claimed:
+        return []
+    ids = {"ids": [row.id for row in claimed]}
+
+    if check_shortage:
+        shortages = session.execute(_SHORTAGE_SQL, ids).all()
+        if shortages:
+            raise ShortageError([tuple(row) for row in shortages])
+
+    session.execute(_CONSUME_BASE_SQL, ids)
+    session.execute(_CONSUME_COMPONENT_SQL, ids)
+    session.execute(_PRODUCE_SQL, ids)
+    stamped = dict(ids, now=now)
+    session.execute(_LEDGER_CONSUMPTION_SQL, stamped)
+    session.execute(_LEDGER_PRODUCTION_SQL, stamped)
+    return claimed
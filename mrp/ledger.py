@@ -0,0 +1,203 @@
+# ledger.py
+# ---------------------------------------------------------
+# Append-only stock ledger. Every stock change (receipt, production
+# output, BOM consumption, POS sale) is one stock_movements row, written
+# in the same transaction as the matching increment of the cached
+# qty_in_stock balance. Writers only append and increment: nothing reads
+# history to write, so a movement costs the same however long the ledger
+# grows, and concurrent writers no longer overwrite each other's stock.
+#
+# Snapshots store every moved item's balance as of a point in time.
+# "Stock of X at T" reads the latest snapshot at or before T plus the
+# movements between it and T: at most one snapshot interval of rows.
+#
+#   python ledger.py --snapshot     snapshot now (minus the settle lag)
+#   python ledger.py --verify       compare cached balances with the ledger
+
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, bindparam, insert, func, DateTime
+
+from databases import SessionFactory, StockMovement, StockSnapshot
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SECONDS = float(os.environ.get("MRP_STOCK_SNAPSHOT_SECONDS", 3600))  # 0 = only via the CLI
+# Snapshots stop this far behind now, so no movement can still commit inside a snapshotted window
+SNAPSHOT_LAG = timedelta(seconds=float(os.environ.get("MRP_STOCK_SNAPSHOT_LAG_SECONDS", 300)))
+
+RECEIPT, PRODUCTION, CONSUMPTION, SALE, OPENING = "receipt", "production", "consumption", "sale", "opening"
+
+_INCREMENT_SQL = {
+    # Rows sharing a base item name hold one summed balance: move it on the lowest-id row
+    "base": text("UPDATE base_items SET qty_in_stock = qty_in_stock + :qty "
+                 "WHERE id = (SELECT MIN(id) FROM base_items WHERE name = :key)"),
+    "component": text("UPDATE components SET qty_in_stock = qty_in_stock + :qty WHERE sku = :key"),
+}
+
+
+def append_movements(session, movements, moved_at=None):
+    """Append ``[(item_type, item_key, kind, quantity, reference)]`` to the ledger only; the caller commits.
+
+    For stock whose cached balance the caller has already set (new items, bulk imports).
+    """
+    moved_at = moved_at or datetime.now()
+    rows = [{"moved_at": moved_at, "item_type": item_type, "item_key": key, "kind": kind,
+             "quantity": qty, "reference": reference}
+            for item_type, key, kind, qty, reference in movements if qty]
+    if rows:
+        session.execute(insert(StockMovement), rows)
+    return len(rows)
+
+
+def move_stock(session, movements, moved_at=None):
+    """Append movements and apply them to the cached balances; the caller commits.
+
+    One executemany per item type plus one insert, however many movements.
+    """
+    movements = [m for m in movements if m[3]]
+    for item_type, sql in _INCREMENT_SQL.items():
+        params = [{"key": key, "qty": qty} for t, key, _, qty, _ in movements if t == item_type]
+        if params:
+            session.execute(sql, params)
+    return append_movements(session, movements, moved_at)
+
+
+# =========================================================
+# SNAPSHOTS
+# =========================================================
+def _dt_sql(sql, *names):
+    return text(sql).bindparams(*(bindparam(name, type_=DateTime) for name in names))
+
+
+# Items that moved in (since, as_of]: previous balance plus the window's movements
+_SNAPSHOT_SQL = _dt_sql(
+    "INSERT INTO stock_snapshots (item_type, item_key, as_of, balance) "
+    "SELECT d.item_type, d.item_key, :as_of, d.delta + COALESCE(("
+    "   SELECT s.balance FROM stock_snapshots s"
+    "   WHERE s.item_type = d.item_type AND s.item_key = d.item_key"
+    "   ORDER BY s.as_of DESC LIMIT 1), 0) "
+    "FROM (SELECT item_type, item_key, SUM(quantity) AS delta FROM stock_movements"
+    "      WHERE moved_at > :since AND moved_at <= :as_of GROUP BY item_type, item_key) d "
+    # Another worker snapshotted after :since was read: its rows already cover this window
+    "WHERE NOT EXISTS (SELECT 1 FROM stock_snapshots WHERE as_of > :since)",
+    "since", "as_of",
+)
+
+
+def take_snapshot(as_of=None):
+    """Snapshot every item that moved since the previous snapshot; returns rows written.
+
+    ``as_of`` defaults to now minus SNAPSHOT_LAG and must be later than the
+    previous snapshot.
+    """
+    as_of = as_of or datetime.now() - SNAPSHOT_LAG
+    session = SessionFactory()
+    try:
+        since = session.query(func.max(StockSnapshot.as_of)).scalar()
+        if since is not None and as_of <= since:
+            return 0
+        written = session.execute(_SNAPSHOT_SQL, {"since": since or datetime.min, "as_of": as_of}).rowcount
+        session.commit()
+        return written
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+# =========================================================
+# POINT-IN-TIME READS
+# =========================================================
+def stock_at(session, item_type, item_key, at):
+    """``{balance, snapshot_as_of, movements}``: the stock of one item as of ``at``."""
+    snapshot = session.query(StockSnapshot.as_of, StockSnapshot.balance).filter(
+        StockSnapshot.item_type == item_type, StockSnapshot.item_key == item_key, StockSnapshot.as_of <= at
+    ).order_by(StockSnapshot.as_of.desc()).first()
+
+    delta = session.query(func.coalesce(func.sum(StockMovement.quantity), 0.0), func.count(StockMovement.id)) \
+        .filter(StockMovement.item_type == item_type, StockMovement.item_key == item_key,
+                StockMovement.moved_at <= at)
+    if snapshot:
+        delta = delta.filter(StockMovement.moved_at > snapshot.as_of)
+    total, count = delta.one()
+    return {
+        "balance": (snapshot.balance if snapshot else 0.0) + total,
+        "snapshot_as_of": snapshot.as_of if snapshot else None,
+        "movements": count,
+    }
+
+
+def movements(session, item_type, item_key, before=None, limit=100):
+    """Newest-first movements of one item; ``before`` is a (moved_at, id) keyset cursor."""
+    query = session.query(StockMovement).filter(
+        StockMovement.item_type == item_type, StockMovement.item_key == item_key)
+    if before:
+        moved_at, movement_id = before
+        query = query.filter((StockMovement.moved_at < moved_at) |
+                             ((StockMovement.moved_at == moved_at) & (StockMovement.id < movement_id)))
+    return query.order_by(StockMovement.moved_at.desc(), StockMovement.id.desc()).limit(limit).all()
+
+
+_DRIFT_SQL = text(
+    "SELECT c.item_type, c.item_key, c.cached, COALESCE(l.total, 0) FROM ("
+    "   SELECT 'base' AS item_type, name AS item_key, SUM(qty_in_stock) AS cached FROM base_items GROUP BY name"
+    "   UNION ALL SELECT 'component', sku, qty_in_stock FROM components) c "
+    "LEFT JOIN (SELECT item_type, item_key, SUM(quantity) AS total FROM stock_movements"
+    "           GROUP BY item_type, item_key) l ON l.item_type = c.item_type AND l.item_key = c.item_key "
+    "WHERE ABS(COALESCE(c.cached, 0) - COALESCE(l.total, 0)) > 1e-6"
+)
+
+
+def verify_balances(session):
+    """``[(item_type, item_key, cached, ledger)]`` wherever qty_in_stock disagrees with the ledger."""
+    return [tuple(row) for row in session.execute(_DRIFT_SQL)]
+
+
+# =========================================================
+# BACKGROUND SNAPSHOTS
+# =========================================================
+_snapshotter = None
+_snapshotter_lock = threading.Lock()
+
+
+def start_snapshotter(interval=SNAPSHOT_SECONDS):
+    """Start the snapshot thread once per process; no-op when interval <= 0."""
+    global _snapshotter
+    if interval <= 0 or _snapshotter is not None:
+        return
+    with _snapshotter_lock:
+        if _snapshotter is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    take_snapshot()
+                except Exception:
+                    logger.exception("Stock snapshot failed")
+                time.sleep(interval)
+
+        _snapshotter = threading.Thread(target=run, name="stock-snapshots", daemon=True)
+        _snapshotter.start()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--snapshot"]:
+        print(f"✅ Snapshot written for {take_snapshot()} item(s)")
+    elif sys.argv[1:] == ["--verify"]:
+        session = SessionFactory()
+        drift = verify_balances(session)
+        session.close()
+        for item_type, key, cached, ledger in drift:
+            print(f"❌ {item_type} {key}: cached {cached:g}, ledger {ledger:g}")
+        print("✅ Cached balances match the ledger" if not drift else f"{len(drift)} item(s) drifted")
+        sys.exit(1 if drift else 0)
+    else:
+        sys.exit("usage: python ledger.py --snapshot | --verify")
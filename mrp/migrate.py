@@ -0,0 +1,60 @@
+# migrate.py
+# ---------------------------------------------------------
+# One-off merge of the legacy per-table SQLite files (base.db,
+# components.db, schedule.db) into the consolidated database.
+#
+#   python migrate.py [legacy_dir]
+
+import os
+import sys
+
+from sqlalchemy import text
+
+from databases import get_engine
+
+LEGACY_FILES = {
+    "base.db": ["base_items"],
+    "components.db": ["components", "component_boms"],
+    "schedule.db": ["production_tasks"],
+}
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.exec_driver_sql(f"PRAGMA {schema}.table_info({table})")]
+
+
+def merge_legacy_files(legacy_dir="."):
+    """ATTACH each legacy file and copy its tables with INSERT ... SELECT.
+
+    Rows keep their primary keys; ones already present are skipped, so
+    re-running the merge is harmless. Returns ``{table: rows_copied}``.
+    """
+    copied = {}
+    with get_engine().connect() as conn:
+        for filename, tables in LEGACY_FILES.items():
+            path = os.path.join(legacy_dir, filename)
+            if not os.path.exists(path):
+                continue
+
+            conn.execute(text("ATTACH DATABASE :path AS legacy"), {"path": path})
+            try:
+                for table in tables:
+                    source_cols = _columns(conn, "legacy", table)
+                    if not source_cols:
+                        continue
+                    cols = ", ".join(c for c in _columns(conn, "main", table) if c in source_cols)
+                    result = conn.exec_driver_sql(
+                        f"INSERT OR IGNORE INTO main.{table} ({cols}) SELECT {cols} FROM legacy.{table}"
+                    )
+                    copied[table] = result.rowcount
+                conn.commit()
+            finally:
+                conn.execute(text("DETACH DATABASE legacy"))
+    return copied
+
+
+if __name__ == "__main__":
+    counts = merge_legacy_files(sys.argv[1] if len(sys.argv) > 1 else ".")
+    for table, n in counts.items():
+        print(f"{table}: {n} row(s) merged")
+    print(f"✅ Legacy databases merged into {get_engine().url}")
@@ -0,0 +1,159 @@
+# netting.py
+# ---------------------------------------------------------
+# MRP net-requirements run. Pending ProductionTasks are scheduled
+# receipts for their SKU and consume their BOM children; any component
+# shortfall becomes a planned production order that is exploded further,
+# and any base-item shortfall becomes a planned purchase.
+#
+# The result is materialized in planned_purchases. After the first full
+# run only the BOM descendants of what changed are recomputed.
+
+import threading
+from datetime import datetime
+
+from sqlalchemy import text, bindparam, delete, insert
+
+from databases import PlannedPurchase
+from bom import get_bom_graph
+
+
+def _in(sql):
+    return text(sql).bindparams(bindparam("keys", expanding=True))
+
+
+# {filter} is either empty or "AND <column> IN :keys"
+_COMPONENT_STOCK = "SELECT sku, qty_in_stock FROM components WHERE 1 = 1 {filter}"
+_RECEIPTS = ("SELECT component_sku, SUM(quantity) FROM production_tasks "
+             "WHERE status = 'pending' {filter} GROUP BY component_sku")
+_BASE_ITEMS = ("SELECT name, MIN(id), MAX(vendor), MAX(unit_price), SUM(qty_in_stock) "
+               "FROM base_items WHERE 1 = 1 {filter} GROUP BY name")
+
+
+class NettingRun:
+    """Gross-to-net state for every node of the BOM graph."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.on_hand = {}          # node -> qty_in_stock
+        self.receipts = {}         # component node -> pending task quantity
+        self.planned = {}          # component node -> planned production qty
+        self.gross = {}            # node -> gross requirement
+        self.base_info = {}        # base name -> (id, vendor, unit_price)
+
+    # ---------------- state ----------------
+    def _load(self, session, skus=None, names=None):
+        """(Re)read stock and receipts, for everything or only the given keys."""
+        def fetch(sql, keys, column):
+            if keys is None:
+                return session.execute(text(sql.format(filter=""))).all()
+            if not keys:
+                return []
+            stmt = _in(sql.format(filter=f"AND {column} IN :keys"))
+            return session.execute(stmt, {"keys": list(keys)}).all()
+
+        if skus is not None:
+            for sku in skus:
+                self.receipts.pop(("component", sku), None)
+        if names is not None:
+            for name in names:
+                self.on_hand.pop(("base", name), None)
+                self.base_info.pop(name, None)
+
+        for sku, qty in fetch(_COMPONENT_STOCK, skus, "sku"):
+            self.on_hand[("component", sku)] = qty or 0.0
+        for sku, qty in fetch(_RECEIPTS, skus, "component_sku"):
+            self.receipts[("component", sku)] = qty or 0.0
+        for name, item_id, vendor, price, qty in fetch(_BASE_ITEMS, names, "name"):
+            self.on_hand[("base", name)] = qty or 0.0
+            self.base_info[name] = (item_id, vendor or "", price or 0.0)
+
+    def _recompute(self, nodes):
+        """Gross-to-net for ``nodes`` in low-level-code order (parents first)."""
+        llc = self.graph.low_level_codes
+        for node in sorted(nodes, key=lambda n: llc.get(n, 0)):
+            gross = 0.0
+            for parent, qty_per in self.graph.parents.get(node, ()):
+                gross += (self.receipts.get(parent, 0.0) + self.planned.get(parent, 0.0)) * qty_per
+            self.gross[node] = gross
+            if node[0] == "component":
+                net = gross - self.on_hand.get(node, 0.0) - self.receipts.get(node, 0.0)
+                self.planned[node] = max(net, 0.0)
+
+    def _purchase_rows(self, names):
+        now = datetime.now()
+        rows = []
+        for name in names:
+            node = ("base", name)
+            gross = self.gross.get(node, 0.0)
+            on_hand = self.on_hand.get(node, 0.0)
+            net = gross - on_hand
+            if net <= 0:
+                continue
+            item_id, vendor, price = self.base_info.get(name, (None, "", 0.0))
+            rows.append({
+                "base_item_name": name, "base_item_id": item_id, "vendor": vendor,
+                "gross_qty": gross, "on_hand": on_hand, "net_qty": net,
+                "unit_price": price, "est_cost": net * price, "updated_at": now,
+            })
+        return rows
+
+    # ---------------- runs ----------------
+    def run_full(self, session):
+        self._load(session)
+        self._recompute(self.graph.order)
+        names = {code for source, code in self.graph.order if source == "base"}
+        session.execute(delete(PlannedPurchase))
+        rows = self._purchase_rows(names)
+        if rows:
+            session.execute(insert(PlannedPurchase), rows)
+
+    def run_incremental(self, session, skus=(), names=()):
+        """Recompute only the BOM descendants of changed components and base items."""
+        skus, names = set(skus), set(names)
+        if not skus and not names:
+            return
+        affected = self.graph.descendants({("component", s) for s in skus})
+        affected |= {("base", n) for n in names}
+        affected_skus = {code for source, code in affected if source == "component"}
+        affected_names = {code for source, code in affected if source == "base"}
+
+        self._load(session, affected_skus, affected_names)
+        self._recompute(affected)
+
+        if affected_names:
+            session.execute(delete(PlannedPurchase).where(
+                PlannedPurchase.base_item_name.in_(affected_names)))
+            rows = self._purchase_rows(affected_names)
+            if rows:
+                session.execute(insert(PlannedPurchase), rows)
+
+
+# =========================================================
+# CACHE
+# =========================================================
+_run = None
+_lock = threading.Lock()
+
+
+def update_purchase_plan(session, skus=(), names=()):
+    """Refresh planned_purchases after a change; the caller commits.
+
+    Pass the component SKUs whose tasks or stock changed and the base item
+    names whose stock changed. A full run happens instead the first time,
+    and whenever the BOM graph has been rebuilt.
+    """
+    global _run
+    with _lock:
+        graph = get_bom_graph(session)
+        if _run is None or _run.graph is not graph:
+            run = NettingRun(graph)
+            run.run_full(session)
+            _run = run
+        else:
+            _run.run_incremental(session, skus, names)
+
+
+def invalidate_purchase_plan():
+    global _run
+    with _lock:
+        _run = None
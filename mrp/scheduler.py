@@ -0,0 +1,229 @@
+# scheduler.py
+# ---------------------------------------------------------
+# Finite-capacity scheduler for pending ProductionTasks.
+#
+# Tasks are dispatched in one global sequence — deepest BOM level first,
+# then release time, then id — onto work centers with a fixed number of
+# parallel slots. A task starts when its slot is free, it has been
+# released (created_at) and every pending task for its component children
+# has finished. Duration is lead_time × quantity hours.
+
+import heapq
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from databases import Component, ProductionTask, WorkCenter
+from bom import get_bom_graph
+
+
+class _Planned:
+    __slots__ = ("id", "sku", "quantity", "release", "key", "start", "finish", "slot")
+
+    def __init__(self, task_id, sku, quantity, release, llc):
+        self.id = task_id
+        self.sku = sku
+        self.quantity = quantity or 0
+        self.release = release
+        self.key = (-llc, release, task_id)
+        self.start = self.finish = self.slot = None
+
+
+class CapacityScheduler:
+    """In-memory plan over the pending queue with incremental updates.
+
+    Every mutating method returns ``{task_id: (start, finish)}`` for the
+    tasks whose plan changed, ready to be written back with save_plan().
+    """
+
+    def __init__(self, graph, components, capacities):
+        self.graph = graph
+        self.lead_times = {sku: lead_time or 0 for sku, lead_time, _ in components}
+        self.work_center_of = {sku: wc for sku, _, wc in components}
+        self.capacities = capacities               # work center name -> slots
+        self.sequence = []                         # _Planned, sorted by key
+        self.keys = []                             # parallel list for bisect
+        self.by_id = {}
+        self._component_children = {}
+        self._tail = None                          # slot state after the last task
+
+    # ---------------- loading ----------------
+    @classmethod
+    def load(cls, session):
+        """Read the pending queue on the caller's session, including tasks it has not committed."""
+        components = session.query(Component.sku, Component.lead_time, Component.work_center).all()
+        capacities = dict(session.query(WorkCenter.name, WorkCenter.capacity).all())
+        pending = session.query(
+            ProductionTask.id, ProductionTask.component_sku,
+            ProductionTask.quantity, ProductionTask.created_at
+        ).filter(ProductionTask.status == "pending").all()
+
+        scheduler = cls(get_bom_graph(session), components, capacities)
+        for row in pending:
+            scheduler._insert(scheduler._make(row.id, row.component_sku, row.quantity, row.created_at))
+        return scheduler
+
+    def _make(self, task_id, sku, quantity, created_at):
+        release = datetime.strptime(created_at, "%Y-%m-%d %H:%M")
+        llc = self.graph.low_level_codes.get(("component", sku), 0)
+        return _Planned(task_id, sku, quantity, release, llc)
+
+    def _insert(self, planned):
+        pos = bisect_left(self.keys, planned.key)
+        self.sequence.insert(pos, planned)
+        self.keys.insert(pos, planned.key)
+        self.by_id[planned.id] = planned
+        return pos
+
+    def _children(self, sku):
+        children = self._component_children.get(sku)
+        if children is None:
+            children = [code for (source, code), _ in self.graph.children.get(("component", sku), ())
+                        if source == "component"]
+            self._component_children[sku] = children
+        return children
+
+    # ---------------- planning ----------------
+    def _state_before(self, pos):
+        """Slot free-times and per-SKU finish times after sequence[:pos].
+
+        Rebuilt from recorded slot assignments, so no heap work is redone.
+        """
+        free = {wc: [datetime.min] * cap for wc, cap in self.capacities.items() if cap}
+        sku_finish = {}
+        for t in self.sequence[:pos]:
+            if t.finish is None:
+                continue
+            if t.slot is not None:
+                free[self.work_center_of[t.sku]][t.slot] = t.finish
+            if t.finish > sku_finish.get(t.sku, datetime.min):
+                sku_finish[t.sku] = t.finish
+        heaps = {wc: [(f, slot) for slot, f in enumerate(slots)] for wc, slots in free.items()}
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        return heaps, sku_finish
+
+    def _plan_one(self, t, heaps, sku_finish):
+        if t.sku not in self.lead_times:
+            t.start = t.finish = t.slot = None         # unknown component: nothing to plan
+            return
+        ready = t.release
+        for child in self._children(t.sku):
+            done = sku_finish.get(child)
+            if done and done > ready:
+                ready = done
+
+        heap = heaps.get(self.work_center_of.get(t.sku))
+        if heap is None:                               # no work center: unconstrained
+            t.start, t.slot = ready, None
+        else:
+            free_at, slot = heapq.heappop(heap)
+            t.start, t.slot = max(ready, free_at), slot
+        t.finish = t.start + timedelta(hours=self.lead_times[t.sku] * t.quantity)
+        if heap is not None:
+            heapq.heappush(heap, (t.finish, t.slot))
+        if t.finish > sku_finish.get(t.sku, datetime.min):
+            sku_finish[t.sku] = t.finish
+
+    def _plan_from(self, pos):
+        heaps, sku_finish = self._state_before(pos)
+        changed = {}
+        for t in self.sequence[pos:]:
+            before = (t.start, t.finish)
+            self._plan_one(t, heaps, sku_finish)
+            if (t.start, t.finish) != before:
+                changed[t.id] = (t.start, t.finish)
+        self._tail = (heaps, sku_finish)
+        return changed
+
+    def plan_all(self):
+        return self._plan_from(0)
+
+    # ---------------- incremental updates ----------------
+    def add(self, task_id, sku, quantity, created_at):
+        if task_id in self.by_id:
+            return {}                   # a load() inside the adding transaction already planned it
+        planned = self._make(task_id, sku, quantity, created_at)
+        pos = self._insert(planned)
+        if pos == len(self.sequence) - 1 and self._tail is not None:
+            # Appended at the end: plan it against the cached tail state only
+            heaps, sku_finish = self._tail
+            self._plan_one(planned, heaps, sku_finish)
+            return {planned.id: (planned.start, planned.finish)}
+        return self._plan_from(pos)
+
+    def remove(self, *task_ids):
+        """Drop completed/cancelled tasks and replan everything queued after them."""
+        positions = []
+        for task_id in task_ids:
+            planned = self.by_id.pop(task_id, None)
+            if planned is not None:
+                idx = bisect_left(self.keys, planned.key)
+                del self.sequence[idx]
+                del self.keys[idx]
+                positions.append(idx)
+        if not positions:
+            return {}
+        return self._plan_from(min(positions))
+
+    def set_lead_time(self, sku, lead_time):
+        self.lead_times[sku] = lead_time or 0
+        first = next((i for i, t in enumerate(self.sequence) if t.sku == sku), None)
+        return {} if first is None else self._plan_from(first)
+
+
+# =========================================================
+# PERSISTENCE & CACHE
+# =========================================================
+def save_plan(session, changed):
+    """Write planned start/finish for changed tasks in one executemany UPDATE."""
+    if changed:
+        session.execute(update(ProductionTask), [
+            {"id": task_id, "planned_start": start, "due_at": finish}
+            for task_id, (start, finish) in changed.items()
+        ])
+
+
+_scheduler = None
+_lock = threading.RLock()
+
+
+def _current(session):
+    """Cached scheduler; a (re)load stages its full plan on ``session``."""
+    global _scheduler
+    if _scheduler is None or _scheduler.graph is not get_bom_graph(session):
+        scheduler = CapacityScheduler.load(session)
+        save_plan(session, scheduler.plan_all())
+        _scheduler = scheduler
+    return _scheduler
+
+
+def ensure_plan(session):
+    """Materialize the plan if the scheduler was (re)built; the caller commits."""
+    with _lock:
+        return _current(session)
+
+
+def reschedule(session, change):
+    """Apply ``change(scheduler)`` under the lock and stage the new plan on ``session``.
+
+    e.g. ``reschedule(session, lambda s: s.remove(task_id))``. The caller commits.
+    """
+    with _lock:
+        scheduler = _current(session)
+        try:
+            changed = change(scheduler)
+        except Exception:
+            invalidate_scheduler()
+            raise
+        save_plan(session, changed)
+        return changed
+
+
+def invalidate_scheduler():
+    """Force a full replan on next use (work centers changed, writes failed, ...)."""
+    global _scheduler
+    with _lock:
+        _scheduler = None
@@ -0,0 +1,308 @@
+# simulation.py
+# ---------------------------------------------------------
+# What-if projection of stock under demand and lead-time scenarios,
+# evaluated for a whole batch of scenarios at once with NumPy.
+#
+# Time runs in daily buckets from now. Every pending ProductionTask is a
+# receipt of its SKU on its planned due day and backflushes its BOM
+# children the same day, as inventory.complete_tasks does. Wherever a
+# component's projected stock would go negative, the shortfall is made
+# lot-for-lot: a planned order that starts lead_time × qty hours before
+# it is needed and consumes its children then. Requirements travel down
+# the BOM one low-level code at a time: stock is projected on dense
+# (item, scenario, day) arrays, and only the nonzero task completions and
+# planned order starts are pushed through the level's sparse parent → child
+# matrix, so the cost follows the events rather than items × days.
+#
+# Scenario knobs, per component SKU ("*" = every component):
+#   demand     factor on pending task quantities     {"SKU-1": 2.0}
+#   extra      extra demand, due now or on day N     {"SKU-1": 50} / {"SKU-1": [50, 7]}
+#   lead_time  factor on Component.lead_time         {"*": 1.5}
+#
+# Results hold, per scenario and item, the first day projected stock goes
+# negative (-1 = never within the horizon) and the stock at the horizon.
+
+import math
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:         # the rest of the app runs without it
+    np = None
+
+from sqlalchemy import text
+
+from bom import get_bom_graph
+
+HORIZON_DAYS = 30
+# (scenario, item, day) cells per working array; bounds memory per batch
+CHUNK_CELLS = 4_000_000
+
+_COMPONENTS_SQL = text("SELECT sku, qty_in_stock, lead_time FROM components")
+_BASE_SQL = text("SELECT name, SUM(qty_in_stock) FROM base_items GROUP BY name")
+_PENDING_SQL = text("SELECT component_sku, quantity, due_at FROM production_tasks WHERE status = 'pending'")
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("What-if simulation needs NumPy: pip install numpy")
+
+
+class Simulator:
+    """Current stock, pending tasks and BOM as arrays, ready for any number of scenarios."""
+
+    def __init__(self, graph, components, base_items, pending, now=None, horizon_days=HORIZON_DAYS):
+        require_numpy()
+        self.now = now or datetime.now()
+        self.days = horizon_days
+        # Grouped by low-level code (still parents before children), so each level is one
+        # slice, with its components first: only they plan orders and have children
+        llc = graph.low_level_codes
+        self.nodes = sorted(graph.order, key=lambda node: (llc.get(node, 0), node[0] != "component"))
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+
+        self.on_hand = np.zeros(n)
+        self.lead_hours = np.zeros(n)                      # per unit, components only
+        self.is_component = np.array([source == "component" for source, _ in self.nodes], dtype=bool)
+        for sku, qty, lead_time in components:
+            i = self.index.get(("component", sku))
+            if i is not None:
+                self.on_hand[i], self.lead_hours[i] = qty or 0.0, lead_time or 0
+        for name, qty in base_items:
+            i = self.index.get(("base", name))
+            if i is not None:
+                self.on_hand[i] = qty or 0.0
+
+        # Pending tasks: due offset (days from now) and duration at the current lead time
+        tasks = [(self.index[("component", sku)], qty or 0, due_at) for sku, qty, due_at in pending
+                 if ("component", sku) in self.index]
+        self.task_node = np.array([t[0] for t in tasks], dtype=np.int64)
+        self.task_qty = np.array([t[1] for t in tasks], dtype=float)
+        self.task_duration = self.lead_hours[self.task_node] * self.task_qty / 24.0
+        self.task_due = np.array([
+            (_as_datetime(due_at) - self.now).total_seconds() / 86400.0 if due_at else duration
+            for (_, _, due_at), duration in zip(tasks, self.task_duration)
+        ], dtype=float)
+
+        # Sparse BOM: per level, a CSR matrix of parent (row) -> child edges
+        codes = [llc.get(node, 0) for node in self.nodes]
+        self.levels = []
+        lo = 0
+        while lo < n:
+            hi = bisect_right(codes, codes[lo], lo)
+            made = lo + sum(1 for source, _ in self.nodes[lo:hi] if source == "component")
+            rows = [[(self.index[child], qty_per) for child, qty_per in graph.children.get(self.nodes[parent], ())]
+                    for parent in range(lo, made)]
+            self.levels.append({
+                "members": slice(lo, hi),
+                "made": slice(lo, made),
+                "indptr": np.cumsum([0] + [len(r) for r in rows]),
+                "child": np.array([c for r in rows for c, _ in r], dtype=np.int64),
+                "qty_per": np.array([q or 0.0 for r in rows for _, q in r], dtype=float),
+            })
+            lo = hi
+
+    @classmethod
+    def load(cls, session, horizon_days=HORIZON_DAYS):
+        return cls(get_bom_graph(session), session.execute(_COMPONENTS_SQL).all(), session.execute(_BASE_SQL).all(),
+                   session.execute(_PENDING_SQL).all(), horizon_days=horizon_days)
+
+    # ---------------- scenario inputs ----------------
+    def _factors(self, overrides):
+        """Per-node factor row from ``{sku | "*": factor}``."""
+        row = np.ones(len(self.nodes))
+        if "*" in overrides:
+            row[self.is_component] = float(overrides["*"])
+        for sku, factor in overrides.items():
+            if sku != "*":
+                row[self._component(sku)] = float(factor)
+        return row
+
+    def _component(self, sku):
+        try:
+            return self.index[("component", sku)]
+        except KeyError:
+            raise ValueError(f"Unknown component '{sku}'") from None
+
+    def _extra(self, scenarios):
+        """``(scenario, node, day, qty)`` arrays for the scenarios' extra demand."""
+        rows = []
+        for s, scenario in enumerate(scenarios):
+            for sku, value in (scenario.get("extra") or {}).items():
+                qty, day = (value, 0) if isinstance(value, (int, float)) else value
+                if not 0 <= int(day) < self.days:
+                    raise ValueError(f"Extra demand for '{sku}' is due outside the {self.days}-day horizon")
+                rows.append((s, self._component(sku), int(day), float(qty)))
+        if not rows:
+            return None
+        s, node, day, qty = zip(*rows)
+        return np.array(s), np.array(node), np.array(day), np.array(qty, dtype=float)
+
+    # ---------------- runs ----------------
+    def run(self, scenarios):
+        """Evaluate ``[{label, demand, extra, lead_time}]``; returns a SimulationResult."""
+        demand = np.array([self._factors(s.get("demand") or {}) for s in scenarios]).reshape(-1, len(self.nodes))
+        lead = np.array([self._factors(s.get("lead_time") or {}) for s in scenarios]).reshape(-1, len(self.nodes))
+        extra = self._extra(scenarios)
+        labels = [s.get("label") or f"scenario {i + 1}" for i, s in enumerate(scenarios)]
+
+        result = SimulationResult(self, labels)
+        step = self._chunk()
+        for lo in range(0, len(scenarios), step):
+            hi = min(lo + step, len(scenarios))
+            chunk_extra = None
+            if extra is not None:
+                keep = (extra[0] >= lo) & (extra[0] < hi)
+                chunk_extra = (extra[0][keep] - lo,) + tuple(a[keep] for a in extra[1:])
+            result.fill(lo, *self._project(demand[lo:hi], lead[lo:hi], chunk_extra))
+        return result
+
+    def monte_carlo(self, runs=1000, demand_cv=0.2, lead_time_cv=0.1, seed=None):
+        """``runs`` scenarios with independent lognormal (mean 1) factors per component."""
+        rng = np.random.default_rng(seed)
+        result = SimulationResult(self, [f"run {i + 1}" for i in range(runs)])
+        step = self._chunk()
+        for lo in range(0, runs, step):
+            size = (min(step, runs - lo), len(self.nodes))
+            result.fill(lo, *self._project(_lognormal(rng, demand_cv, size), _lognormal(rng, lead_time_cv, size)))
+        return result
+
+    def _chunk(self):
+        return max(CHUNK_CELLS // max(len(self.nodes) * self.days, 1), 1)
+
+    def _scatter(self, shape, node, scenario, day, qty):
+        """Dense (node, scenario, day) array summing ``qty`` at the given coordinates."""
+        n_count, s_count, d_count = shape
+        flat = (node * s_count + scenario) * d_count + day
+        return np.bincount(flat.ravel(), weights=qty.ravel(), minlength=n_count * s_count * d_count).reshape(shape)
+
+    def _project(self, demand, lead, extra=None):
+        """Projected stock for one batch; returns (shortage_day, end_stock), both (scenario, node).
+
+        Works node-major, (node, scenario, day), so a level is a contiguous
+        slice and the BOM edges gather and reduce whole rows.
+        """
+        s_count, n_count, days = demand.shape[0], len(self.nodes), self.days
+        shape = (n_count, s_count, days)
+        demand, lead = demand.T, lead.T
+
+        # Pending tasks: quantity and finish move with the scenario's factors; past due lands today
+        factor = demand[self.task_node]
+        qty = self.task_qty[:, None] * factor
+        duration = self.task_duration[:, None]
+        due = self.task_due[:, None] - duration + duration * factor * lead[self.task_node]
+        due = np.floor(np.maximum(due, 0.0)).astype(np.int64)
+        inside = due < days
+        receipts = self._scatter(shape, np.broadcast_to(self.task_node[:, None], due.shape)[inside],
+                                 np.broadcast_to(np.arange(s_count), due.shape)[inside], due[inside], qty[inside])
+        gross = np.zeros(shape)
+        if extra is not None:
+            scenario, node, day, extra_qty = extra
+            gross += self._scatter(shape, node, scenario, day, extra_qty)
+
+        shortage_day = np.full((n_count, s_count), -1, dtype=np.int32)
+        end_stock = np.empty((n_count, s_count))
+        for level in self.levels:
+            members = level["members"]
+            # In place: this level's gross rows are not read again
+            stock = np.subtract(receipts[members], gross[members], out=gross[members])
+            np.cumsum(stock, axis=2, out=stock)
+            stock += self.on_hand[members, None, None]
+            short = stock < -1e-9
+            shortage_day[members] = np.where(short.any(axis=2), short.argmax(axis=2), -1)
+            end_stock[members] = stock[:, :, -1]
+            if not level["child"].size:
+                continue
+
+            # Lot-for-lot planned orders for component shortfalls, released lead time earlier
+            made = level["made"]
+            shortfall = np.maximum.accumulate(np.maximum(-stock[:made.stop - made.start], 0.0), axis=2)
+            planned = np.diff(shortfall, axis=2, prepend=0.0)
+            m_idx, s_idx, d_idx = np.nonzero(planned > 1e-9)
+            amount = planned[m_idx, s_idx, d_idx]
+            hours = self.lead_hours[made][m_idx] * lead[made][m_idx, s_idx] * amount
+            release = np.maximum(d_idx - np.ceil(hours / 24.0).astype(np.int64), 0)
+            starts = self._scatter(planned.shape, m_idx, s_idx, release, amount)
+
+            # Children are consumed by task completions and planned order starts. Both are
+            # sparse in time, so only nonzero (parent, scenario, day) cells are exploded.
+            supply = receipts[made] + starts
+            m_idx, s_idx, d_idx = np.nonzero(supply)
+            amount = supply[m_idx, s_idx, d_idx]
+            first, count = level["indptr"][m_idx], np.diff(level["indptr"])[m_idx]
+            event = np.repeat(np.arange(len(m_idx)), count)
+            edge = first[event] + np.arange(len(event)) - np.repeat(np.cumsum(count) - count, count)
+            flat = (level["child"][edge] * s_count + s_idx[event]) * days + d_idx[event]
+            np.add.at(gross.reshape(-1), flat, amount[event] * level["qty_per"][edge])
+        return shortage_day.T, end_stock.T
+
+
+class SimulationResult:
+    """Shortage day and horizon-end stock per scenario and item."""
+
+    def __init__(self, simulator, labels):
+        self.nodes = simulator.nodes
+        self.index = simulator.index
+        self.start = simulator.now
+        self.days = simulator.days
+        self.labels = labels
+        self.shortage_day = np.full((len(labels), len(self.nodes)), -1, dtype=np.int32)
+        self.end_stock = np.zeros((len(labels), len(self.nodes)))
+
+    def fill(self, lo, shortage_day, end_stock):
+        self.shortage_day[lo:lo + len(shortage_day)] = shortage_day
+        self.end_stock[lo:lo + len(end_stock)] = end_stock
+
+    def _date(self, day):
+        return (self.start + timedelta(days=int(day))).date().isoformat()
+
+    def scenario(self, s, items=None):
+        """One scenario: every shortage, and projected stock for ``items`` (default: the short ones)."""
+        short = np.flatnonzero(self.shortage_day[s] >= 0)
+        if items is None:
+            shown = short
+        else:
+            shown = [self.index[node] for node in items if node in self.index]
+        return {
+            "label": self.labels[s],
+            "shortages": [{"source": self.nodes[i][0], "key": self.nodes[i][1],
+                           "date": self._date(self.shortage_day[s, i])}
+                          for i in sorted(short, key=lambda i: self.shortage_day[s, i])],
+            "projected_stock": [{"source": self.nodes[i][0], "key": self.nodes[i][1],
+                                 "end_stock": round(float(self.end_stock[s, i]), 3)} for i in shown],
+        }
+
+    def summary(self, top=50):
+        """Items most often short across the scenarios, with shortage dates and stock percentiles."""
+        short = self.shortage_day >= 0
+        probability = short.mean(axis=0)
+        ranked = [i for i in np.argsort(-probability, kind="stable") if probability[i] > 0][:top]
+        p5, p50, p95 = np.percentile(self.end_stock[:, ranked], [5, 50, 95], axis=0) if ranked else ([], [], [])
+        rows = []
+        for j, i in enumerate(ranked):
+            days = self.shortage_day[short[:, i], i]
+            rows.append({
+                "source": self.nodes[i][0], "key": self.nodes[i][1],
+                "shortage_probability": round(float(probability[i]), 4),
+                "earliest_shortage": self._date(days.min()),
+                "median_shortage": self._date(math.floor(np.median(days))),
+                "end_stock_p5": round(float(p5[j]), 3),
+                "end_stock_p50": round(float(p50[j]), 3),
+                "end_stock_p95": round(float(p95[j]), 3),
+            })
+        return rows
+
+
+def _lognormal(rng, cv, size):
+    """Factors with mean 1 and coefficient of variation ``cv`` (all 1 when cv is 0)."""
+    if cv <= 0:
+        return np.ones(size)
+    sigma = math.sqrt(math.log(1 + cv * cv))
+    return rng.lognormal(-sigma * sigma / 2, sigma, size)
+
+
+def _as_datetime(value):
+    # Raw text() rows give SQLite DATETIMEs back as strings
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
@@ -0,0 +1,61 @@
+from sqlalchemy import event, insert
+
+import databases
+from databases import BaseItem, Component, ComponentBOM, WorkCenter
+
+
+def seed_catalog(components, base_items=20):
+    session = databases.SessionFactory()
+    session.add(WorkCenter(name="Assembly", capacity=2))
+    session.execute(insert(BaseItem), [
+        {"name": f"base-{i}", "vendor": "Acme", "unit_price": 1.0 + i, "qty_in_stock": 100.0}
+        for i in range(base_items)
+    ])
+    session.execute(insert(Component), [
+        {"sku": f"C{i:05d}", "name": f"Component {i}", "lead_time": 1, "qty_in_stock": 0.0}
+        for i in range(components)
+    ])
+    lines = [{"parent_sku": f"C{i:05d}", "child_sku": f"base-{i % base_items}", "qty_per": 2.0,
+              "source_type": "base"} for i in range(components)]
+    lines += [{"parent_sku": f"C{i:05d}", "child_sku": f"C{i - 1:05d}", "qty_per": 1.0,
+               "source_type": "component"} for i in range(1, components)]
+    session.execute(insert(ComponentBOM), lines)
+    session.commit()
+    session.close()
+
+
+def count_statements(client, url):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = databases.get_engine()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_admin_query_count_does_not_grow_with_the_catalog(client, fresh_database):
+    counts = {}
+    # 1200 components is past SQLAlchemy's 500-key IN batches, so a batched eager load would show up
+    for size in (10, 1200):
+        fresh_database()
+        seed_catalog(size)
+        cold = count_statements(client, "/admin")
+        warm = count_statements(client, "/admin")
+        counts[size] = (cold, warm)
+
+    assert counts[10] == counts[1200], counts
+    cold, warm = counts[10]
+    assert warm < cold
+
+
+def test_admin_page_lists_each_components_children(client):
+    seed_catalog(3, base_items=2)
+    page = client.get("/admin").get_data(as_text=True)
+    assert "base-0, Component 1" in page          # C00002: its base line, then its component child
@@ -0,0 +1,68 @@
+# test_cache_sync.py
+# ---------------------------------------------------------
+# Workers drop their caches when another process changes the data they
+# were built from, and keep them across their own changes.
+
+import bom
+import cache_sync
+import scheduler
+from databases import Component, SessionFactory, get_engine
+from sqlalchemy import insert
+
+
+def commit_from_another_process(*components):
+    """Insert components and bump the version on a raw connection, as another worker would."""
+    with get_engine().begin() as conn:
+        if components:
+            conn.execute(insert(Component.__table__), [{"sku": sku, "name": sku} for sku in components])
+        conn.execute(cache_sync._BUMP_SQL)
+
+
+def test_a_change_from_another_process_reloads_the_caches(client):
+    client.get("/admin")
+    assert "WHEEL" not in bom.get_bom_graph().components
+
+    commit_from_another_process("WHEEL")
+    assert "WHEEL" not in bom.get_bom_graph().components           # stale until the next request
+
+    assert b"WHEEL" in client.get("/admin").data
+    assert "WHEEL" in bom.get_bom_graph().components
+
+
+def test_own_changes_keep_the_caches(client):
+    client.post("/admin", data={"form_type": "component", "sku": "FRAME", "comp_name": "Frame", "lead_time": "1"})
+    client.get("/schedule")
+    graph, plan = bom.get_bom_graph(), scheduler._scheduler
+
+    client.post("/schedule", data={"form_type": "add_task", "component_sku": "FRAME", "qty": "2"})
+    client.get("/schedule")
+
+    assert bom.get_bom_graph() is graph and scheduler._scheduler is plan
+
+
+def test_a_commit_racing_another_process_reloads_the_caches(client):
+    client.get("/schedule")
+    session = SessionFactory()
+    try:
+        cache_sync.sync(session)
+        commit_from_another_process()                               # lands between our sync and our commit
+        session.add(Component(sku="FRAME", name="Frame"))
+        cache_sync.mark_changed(session)
+        session.commit()
+    finally:
+        session.close()
+
+    assert bom._graph is None and scheduler._scheduler is None
+
+
+def test_a_rolled_back_change_reloads_the_caches(client):
+    client.get("/schedule")
+    session = SessionFactory()
+    try:
+        session.add(Component(sku="FRAME", name="Frame"))
+        cache_sync.mark_changed(session)
+        session.rollback()
+    finally:
+        session.close()
+
+    assert bom._graph is None and scheduler._scheduler is None
@@ -0,0 +1,74 @@
+# test_costing.py
+# ---------------------------------------------------------
+# Standard costs: backfilled by the schema upgrade, kept current by the
+# admin writes, and never written by a page load.
+
+from sqlalchemy import event, insert, select, update
+
+import databases
+from bom import BomGraph
+from costing import CostRollup
+from databases import BaseItem, Component, ComponentBOM
+
+
+def seed_uncosted(session):
+    """A shared subassembly, a base item sold by two vendors and a component without lines."""
+    session.execute(insert(BaseItem), [
+        {"name": "bolt", "vendor": "A", "unit_price": 1.0, "qty_in_stock": 0},
+        {"name": "bolt", "vendor": "B", "unit_price": 1.5, "qty_in_stock": 0},
+        {"name": "tube", "vendor": "A", "unit_price": 4.0, "qty_in_stock": 0},
+    ])
+    session.execute(insert(Component), [
+        {"sku": sku, "name": sku, "qty_in_stock": 0} for sku in ("FRAME", "FORK", "BIKE", "DECAL")
+    ])
+    session.execute(update(Component).values(std_cost=None))      # as left by older versions
+    session.execute(insert(ComponentBOM), [
+        {"parent_sku": "FRAME", "child_sku": "bolt", "qty_per": 4, "source_type": "base"},
+        {"parent_sku": "FRAME", "child_sku": "tube", "qty_per": 3, "source_type": "base"},
+        {"parent_sku": "FORK", "child_sku": "FRAME", "qty_per": 0.5, "source_type": "component"},
+        {"parent_sku": "BIKE", "child_sku": "FRAME", "qty_per": 1, "source_type": "component"},
+        {"parent_sku": "BIKE", "child_sku": "FORK", "qty_per": 2, "source_type": "component"},
+        {"parent_sku": "BIKE", "child_sku": "bolt", "qty_per": 2, "source_type": "base"},
+        {"parent_sku": "BIKE", "child_sku": "missing", "qty_per": 1, "source_type": "base"},
+    ])
+    session.commit()
+
+
+def test_upgrade_backfills_the_same_costs_as_the_rollup(session):
+    seed_uncosted(session)
+
+    databases.upgrade_schema(databases.get_engine())
+
+    stored = dict(session.execute(select(Component.sku, Component.std_cost)).all())
+    expected = CostRollup().rollup_all(session, BomGraph.load(session))
+    assert stored == {**expected, "DECAL": 0.0}
+    assert stored["BIKE"] == 18.0 + 2 * 9.0 + 3.0
+
+
+def test_admin_page_load_writes_nothing(client, session):
+    seed_uncosted(session)
+    writes = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE"):
+            writes.append(statement)
+
+    engine = databases.get_engine()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert client.get("/admin").status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert writes == []
+
+
+def test_price_change_rolls_up_every_cost_on_a_cold_cache(client, session):
+    seed_uncosted(session)
+    bolt_id = session.query(BaseItem.id).filter_by(vendor="B").scalar()
+
+    assert client.post("/admin", data={"form_type": "base_price", "item_id": bolt_id,
+                                       "unit_price": "2"}).status_code == 302
+
+    session.expire_all()
+    costs = dict(session.execute(select(Component.sku, Component.std_cost)).all())
+    assert costs == {"FRAME": 20.0, "FORK": 10.0, "BIKE": 20.0 + 2 * 10.0 + 4.0, "DECAL": 0.0}
@@ -0,0 +1,55 @@
+# test_demand_bridge.py
+# ---------------------------------------------------------
+# Draining the POS sales outbox into MRP stock.
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+import demand_bridge
+from databases import Component
+
+
+@pytest.fixture
+def outbox(app, monkeypatch):
+    """An in-memory POS database standing in for pos.db, with no tables yet."""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    monkeypatch.setattr(demand_bridge, "_outbox_engine", engine)
+    monkeypatch.setattr(demand_bridge, "_outbox_has_table", False)
+    return engine
+
+
+def create_outbox_table(engine, *rows):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE sales_outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id INTEGER,"
+                          " product_id VARCHAR, quantity INTEGER, created_at DATETIME)"))
+        for product_id, quantity in rows:
+            conn.execute(text("INSERT INTO sales_outbox (product_id, quantity) VALUES (:p, :q)"),
+                         {"p": product_id, "q": quantity})
+
+
+def test_nothing_to_drain_before_pos_creates_its_outbox(outbox):
+    assert demand_bridge.drain_once() == 0
+
+
+def test_sales_decrement_the_mapped_component(outbox, session):
+    session.add(Component(sku="FRAME", name="Frame", qty_in_stock=10))
+    session.commit()
+    assert demand_bridge.drain_once() == 0
+
+    create_outbox_table(outbox, ("FRAME", 3), ("FRAME", 2), ("UNKNOWN", 1))
+
+    assert demand_bridge.drain_once() == 3
+    assert session.query(Component.qty_in_stock).scalar() == 5
+    with outbox.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM sales_outbox")).scalar() == 0
+
+
+def test_other_outbox_errors_are_not_mistaken_for_a_missing_table(outbox):
+    with outbox.begin() as conn:
+        conn.execute(text("CREATE TABLE gone (id INTEGER)"))
+        conn.execute(text("CREATE VIEW sales_outbox AS SELECT id, id AS product_id, id AS quantity FROM gone"))
+        conn.execute(text("DROP TABLE gone"))
+
+    with pytest.raises(Exception, match="no such table"):
+        demand_bridge.drain_once()
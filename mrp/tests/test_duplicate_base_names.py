@@ -0,0 +1,59 @@
+# test_duplicate_base_names.py
+# ---------------------------------------------------------
+# Base item names are not unique; rows sharing one are a single item
+# whose stock is their sum, so every movement lands on one row.
+
+from sqlalchemy import func
+
+from databases import BaseItem, Component, ComponentBOM, ProductionTask
+from inventory import ShortageError, complete_tasks
+from ledger import append_movements, move_stock, verify_balances
+
+
+def seed_duplicates(session, task_qty=3):
+    session.add_all([
+        BaseItem(name="bolt", vendor="A", unit_price=1.0, qty_in_stock=4),
+        BaseItem(name="bolt", vendor="B", unit_price=1.5, qty_in_stock=6),
+        Component(sku="FRAME", name="Frame", qty_in_stock=0),
+        ComponentBOM(parent_sku="FRAME", child_sku="bolt", qty_per=2, source_type="base"),
+        ProductionTask(component_sku="FRAME", quantity=task_qty),
+    ])
+    append_movements(session, [("base", "bolt", "opening", 10, None)])
+    session.commit()
+    return session.query(ProductionTask.id).scalar()
+
+
+def bolt_stock(session):
+    return [qty for qty, in session.query(BaseItem.qty_in_stock).order_by(BaseItem.id)]
+
+
+def test_consumption_comes_off_one_row_per_name(session):
+    task_id = seed_duplicates(session)
+
+    complete_tasks(session, [task_id], check_shortage=True)
+    session.commit()
+
+    assert bolt_stock(session) == [-2, 6]
+    assert session.query(func.sum(BaseItem.qty_in_stock)).scalar() == 4
+
+
+def test_shortage_checks_the_summed_stock(session):
+    task_id = seed_duplicates(session, task_qty=6)      # needs 12 bolts, 10 on hand across both rows
+
+    try:
+        complete_tasks(session, [task_id], check_shortage=True)
+    except ShortageError as e:
+        assert e.shortages == [("base", "bolt", 12, 10)]
+    else:
+        raise AssertionError("expected a shortage")
+    session.rollback()
+
+
+def test_ledger_moves_stock_on_one_row_per_name(session):
+    seed_duplicates(session)
+
+    move_stock(session, [("base", "bolt", "receipt", 5, "po:1"), ("base", "bolt", "sale", -1, None)])
+    session.commit()
+
+    assert bolt_stock(session) == [8, 6]
+    assert verify_balances(session) == []
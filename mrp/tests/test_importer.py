@@ -0,0 +1,48 @@
+# test_importer.py
+# ---------------------------------------------------------
+# Bad rows are reported with their line number and skipped; the rest of
+# the file still imports.
+
+import io
+
+from databases import BaseItem, Component
+from importer import import_catalog
+
+
+def jsonl(*lines):
+    return io.StringIO("\n".join(lines) + "\n"), "rows.jsonl"
+
+
+def test_non_object_json_rows_are_reported_not_fatal(session):
+    report = import_catalog(base_items=jsonl(
+        '["bolt", "A", 1.0]',
+        '"nut"',
+        'null',
+        '{"name": "washer", "unit_price": 0.1}',
+    ))
+
+    assert [line_no for _, line_no, _ in report.errors] == [1, 2, 3]
+    assert "expected a JSON object, got list" in report.errors[0][2]
+    assert [name for name, in session.query(BaseItem.name)] == ["washer"]
+
+
+def test_non_object_rows_are_rejected_by_every_importer(session):
+    report = import_catalog(components=jsonl('[1, 2]', '{"sku": "FRAME", "name": "Frame"}'),
+                            boms=jsonl('42'))
+
+    assert [(label, line_no) for label, line_no, _ in report.errors] == [("rows.jsonl", 1)] * 2
+    assert all("expected a JSON object" in message for _, _, message in report.errors)
+    assert [sku for sku, in session.query(Component.sku)] == ["FRAME"]
+
+
+def test_non_finite_numbers_are_rejected(session):
+    report = import_catalog(base_items=jsonl(
+        '{"name": "bolt", "unit_price": NaN}',
+        '{"name": "nut", "qty_in_stock": "inf"}',
+        '{"name": "screw", "unit_price": 1e999}',
+        '{"name": "washer", "unit_price": "0.1", "qty_in_stock": 5}',
+    ))
+
+    assert [line_no for _, line_no, _ in report.errors] == [1, 2, 3]
+    assert all("not a finite number" in message for _, _, message in report.errors)
+    assert session.query(BaseItem.name, BaseItem.unit_price, BaseItem.qty_in_stock).all() == [("washer", 0.1, 5)]
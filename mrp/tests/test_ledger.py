@@ -0,0 +1,37 @@
+# test_ledger.py
+# ---------------------------------------------------------
+# Stock snapshots plus the movements after them give point-in-time stock,
+# however many workers take snapshots.
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import ledger
+from databases import Component, StockSnapshot, get_engine
+
+
+def test_concurrent_snapshots_never_double_count(session):
+    start = datetime.now() - timedelta(hours=3)
+    session.add(Component(sku="FRAME", name="Frame", qty_in_stock=0))
+    ledger.move_stock(session, [("component", "FRAME", ledger.RECEIPT, 5, None)], moved_at=start)
+    ledger.move_stock(session, [("component", "FRAME", ledger.RECEIPT, 2, None)], moved_at=start + timedelta(hours=1))
+    session.commit()
+    other_worker_done = []
+
+    def other_worker_snapshots_first(conn, cursor, statement, *args):
+        # Runs after this worker read the previous snapshot time, before it writes
+        if statement.startswith("INSERT INTO stock_snapshots") and not other_worker_done:
+            other_worker_done.append(True)
+            ledger.take_snapshot(start + timedelta(minutes=30))
+
+    event.listen(get_engine(), "before_cursor_execute", other_worker_snapshots_first)
+    try:
+        ledger.take_snapshot(start + timedelta(hours=2))
+    finally:
+        event.remove(get_engine(), "before_cursor_execute", other_worker_snapshots_first)
+
+    assert [balance for balance, in session.query(StockSnapshot.balance).order_by(StockSnapshot.as_of)] == [5]
+    assert ledger.take_snapshot(start + timedelta(hours=2)) == 1
+    assert ledger.stock_at(session, "component", "FRAME", datetime.now())["balance"] == 7
+    assert [balance for balance, in session.query(StockSnapshot.balance).order_by(StockSnapshot.as_of)] == [5, 7]
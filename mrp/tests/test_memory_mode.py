@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from databases import BaseItem, Component, ProductionTask
+
+
+def test_admin_and_schedule_writes_on_a_fresh_memory_app(client, session):
+    assert client.post("/admin", data={"form_type": "base", "name": "bolt", "vendor": "Acme",
+                                       "unit_price": "2", "qty_in_stock": "10"}).status_code == 302
+    assert client.post("/admin", data={"form_type": "component", "sku": "FRAME", "comp_name": "Frame",
+                                       "lead_time": "2", "child_sku[]": ["bolt"], "qty_per[]": ["4"],
+                                       "source_type[]": ["base"]}).status_code == 302
+    assert client.post("/schedule", data={"form_type": "add_task", "component_sku": "FRAME",
+                                          "qty": "3"}).status_code == 302
+
+    assert session.query(BaseItem.name).all() == [("bolt",)]
+    assert session.query(Component.sku, Component.std_cost).all() == [("FRAME", 8.0)]
+    task = session.query(ProductionTask).one()
+    assert (task.component_sku, task.quantity, task.status) == ("FRAME", 3, "pending")
+    assert task.due_at - task.planned_start == timedelta(hours=6)       # lead_time x quantity
+
+    assert client.get("/schedule").status_code == 200
+    assert client.get("/procurement").status_code == 200
+
+
+def test_each_test_gets_an_empty_database(session):
+    assert session.query(BaseItem).count() == 0
+    assert session.query(ProductionTask).count() == 0
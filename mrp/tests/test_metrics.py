@@ -0,0 +1,44 @@
+# test_metrics.py
+# ---------------------------------------------------------
+# The shared request metrics: SQL run by the app's own before_request
+# hooks is charged to the route, and ?profile=1 is matched exactly.
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from shared.metrics import _enable_profiling, init_metrics
+
+
+def make_app():
+    engine = create_engine("sqlite://")
+    app = Flask(__name__)
+
+    @app.before_request
+    def sync():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    @app.route("/page")
+    def page():
+        return "page"
+
+    return app, init_metrics(app, [engine], service="test")
+
+
+def test_sql_in_earlier_hooks_counts_for_the_route():
+    app, metrics = make_app()
+
+    assert app.test_client().get("/page").status_code == 200
+
+    assert metrics.sql_count["page"] == 1
+    assert "(background)" not in metrics.sql_count
+
+
+def test_profile_parameter_must_be_exactly_one():
+    app, _ = make_app()
+    _enable_profiling(app)
+    client = app.test_client()
+
+    assert client.get("/page?profile=10").get_data(as_text=True) == "page"
+    assert client.get("/page?noprofile=1").get_data(as_text=True) == "page"
+    assert "samples every" in client.get("/page?x=2&profile=1").get_data(as_text=True)
@@ -0,0 +1,45 @@
+# test_simulate.py
+# ---------------------------------------------------------
+# /simulate answers 400, not 500, to JSON of the wrong shape.
+
+import pytest
+
+import simulation
+from databases import Component
+
+needs_numpy = pytest.mark.skipif(simulation.np is None, reason="what-if simulation needs NumPy")
+
+
+@pytest.mark.parametrize("body", [[{"scenarios": []}], "scenarios", 7])
+def test_non_object_bodies_are_rejected(client, body):
+    response = client.post("/simulate", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "body must be a JSON object"}
+
+
+@needs_numpy
+@pytest.mark.parametrize("body, error", [
+    ({"monte_carlo": [100]}, "monte_carlo must be a JSON object"),
+    ({"scenarios": {"label": "rush"}}, "scenarios must list 1 to 1000 scenarios"),
+    ({"scenarios": ["rush"]}, "each scenario must be a JSON object"),
+    ({"scenarios": [{"demand": [2.0]}]}, "scenario demand must be a JSON object"),
+    ({"scenarios": [{"extra": "FRAME"}]}, "scenario extra must be a JSON object"),
+    ({"scenarios": [{}], "items": "FRAME"}, "items must be a list of SKUs"),
+])
+def test_nested_values_of_the_wrong_shape_are_rejected(client, body, error):
+    response = client.post("/simulate", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
+
+
+@needs_numpy
+def test_object_bodies_still_simulate(client, session):
+    session.add(Component(sku="FRAME", name="Frame", lead_time=2))
+    session.commit()
+
+    response = client.post("/simulate", json={"scenarios": [{"label": "baseline"}]})
+
+    assert response.status_code == 200
+    assert [s["label"] for s in response.get_json()["scenarios"]] == ["baseline"]
@@ -1,15 +1,82 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file
-from databases import Product, ProductSession, CartItem, CartSession, Transaction, TransactionSession
-import json
-import csv
-import io
-from datetime import datetime
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, g
+from databases import configure as configure_database, init_schema, Session, Product, ProductSession, Transaction, TransactionSession, TransactionLine
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import selectinload
+from carts import get_cart_store
+from catalog import get_catalog, invalidate_catalog, bump_catalog_version, sync_catalog
+import export
+import reports
+import sales
+import os
+import sys
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+# shared/ sits beside mrp/ and pos/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.metrics import init_metrics  # noqa: E402
 
 app = Flask(__name__)
 
+DEFAULT_CONFIG = {
+    'DATABASE_URL': None,       # None: POS_DATABASE_URL or pos.db next to this file; 'memory': in-memory
+    'DB_POOL_SIZE': None,       # None: POS_DB_POOL_SIZE (10)
+    'DB_MAX_OVERFLOW': None,    # None: POS_DB_MAX_OVERFLOW (20)
+    'INIT_SCHEMA': True,        # False if `python databases.py` already ran
+}
+
 # Payment types available
 PAYMENT_TYPES = ["Cash", "Credit Card", "Debit Card", "E-Wallet"]
 
+# Transactions shown per page on /transactions
+PAGE_SIZE = 50
+
+# Each till keeps its own cart, identified by this cookie (or an X-Terminal-Id header)
+TERMINAL_COOKIE = 'pos_terminal'
+
+
+@app.before_request
+def sync_catalog_cache():
+    """Reload the catalog if another worker changed products."""
+    sync_catalog(Session())
+
+
+@app.teardown_appcontext
+def remove_session(exc=None):
+    """Return the request's session (and its connection) to the pool."""
+    Session.remove()
+
+
+def terminal_id():
+    terminal = request.headers.get('X-Terminal-Id') or request.cookies.get(TERMINAL_COOKIE)
+    if not terminal:
+        terminal = g.new_terminal = uuid.uuid4().hex
+    return terminal
+
+
+def not_modified(etag):
+    """A 304 for ``etag`` if the client already has it, else None."""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def with_etag(body, etag):
+    response = app.make_response(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # revalidate every time, but cheaply
+    return response
+
+
+@app.after_request
+def remember_terminal(response):
+    if 'new_terminal' in g:
+        response.set_cookie(TERMINAL_COOKIE, g.new_terminal, max_age=365 * 24 * 3600, httponly=True, samesite='Lax')
+    return response
+
 
 # ---------------- HOME ROUTE ----------------
 @app.route('/')
@@ -20,10 +87,9 @@ def index():
 # ---------------- ADMIN ROUTES ----------------
 @app.route('/admin')
 def admin():
-    session = ProductSession()
-    products = session.query(Product).all()
-    session.close()
-    return render_template('admin.html', products=products)
+    catalog = get_catalog()
+    return not_modified(catalog.etag) or with_etag(
+        render_template('admin.html', products=catalog.products), catalog.etag)
 
 
 @app.route('/admin/add_product', methods=['POST'])
@@ -37,8 +103,10 @@ def add_product():
     )
 
     session.add(new_product)
+    bump_catalog_version(session)
     session.commit()
     session.close()
+    invalidate_catalog()
 
     return redirect(url_for('admin'))
 
@@ -49,7 +117,9 @@ def delete_product(product_id):
     product = session.query(Product).filter_by(id=product_id).first()
     if product:
         session.delete(product)
+        bump_catalog_version(session)
         session.commit()
+        invalidate_catalog()
     session.close()
     return redirect(url_for('admin'))
 
@@ -57,128 +127,108 @@ def delete_product(product_id):
 # ---------------- CUSTOMER ROUTES ----------------
 @app.route('/customer')
 def customer():
-    session = ProductSession()
-    products = session.query(Product).all()
-    session.close()
+    catalog = get_catalog()
+    cart_items = get_cart_store().items(terminal_id())
 
-    cart_session = CartSession()
-    cart_items = cart_session.query(CartItem).filter_by(session_id="current").all()
-    cart_session.close()
+    # The page changes with the catalog or this terminal's cart
+    etag = f"{catalog.etag}-{zlib.crc32(repr(cart_items).encode('utf-8')):08x}"
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
     subtotal = sum(item.unit_price * item.quantity for item in cart_items)
-
-    return render_template('customer.html', products=products, cart_items=cart_items, subtotal=subtotal,
-                           payment_types=PAYMENT_TYPES)
+    return with_etag(render_template('customer.html', products=catalog.products, cart_items=cart_items,
+                                     subtotal=subtotal, payment_types=PAYMENT_TYPES), etag)
 
 
 @app.route('/customer/add_to_cart', methods=['POST'])
 def add_to_cart():
-    session = CartSession()
-
-    product_id = request.form['product_id']
-    product_name = request.form['product_name']
-    unit_price = float(request.form['unit_price'])
-
-    # Check if item already in cart
-    existing_item = session.query(CartItem).filter_by(
-        product_id=product_id,
-        session_id="current"
-    ).first()
-
-    if existing_item:
-        existing_item.quantity += 1
-    else:
-        new_cart_item = CartItem(
-            product_id=product_id,
-            product_name=product_name,
-            unit_price=unit_price,
-            quantity=1,
-            session_id="current"
-        )
-        session.add(new_cart_item)
-
-    session.commit()
-    session.close()
-
+    product = get_catalog().get(request.form['product_id'])
+    if product is None:
+        return 'Unknown product', 404
+    get_cart_store().add(terminal_id(), product.product_id, product.product_name, product.unit_price)
     return redirect(url_for('customer'))
 
 
-@app.route('/customer/remove_from_cart/<int:cart_id>', methods=['POST'])
-def remove_from_cart(cart_id):
-    session = CartSession()
-    cart_item = session.query(CartItem).filter_by(id=cart_id).first()
-    if cart_item:
-        session.delete(cart_item)
-        session.commit()
-    session.close()
+@app.route('/customer/remove_from_cart/<product_id>', methods=['POST'])
+def remove_from_cart(product_id):
+    get_cart_store().remove(terminal_id(), product_id)
     return redirect(url_for('customer'))
 
 
 @app.route('/customer/checkout', methods=['POST'])
 def checkout():
-    cart_session = CartSession()
-    cart_items = cart_session.query(CartItem).filter_by(session_id="current").all()
-
-    if not cart_items:
-        cart_session.close()
-        return redirect(url_for('customer'))
-
     # Get payment type from form
     payment_type = request.form.get('payment_type', 'Cash')
 
-    # Calculate totals
-    subtotal = sum(item.unit_price * item.quantity for item in cart_items)
-    tax = subtotal * 0.1  # 10% tax
-    total = subtotal + tax
-
-    # Prepare items for storage
-    items_data = [
-        {
-            "product_name": item.product_name,
-            "quantity": item.quantity,
-            "unit_price": item.unit_price
-        }
-        for item in cart_items
-    ]
-
-    # Save transaction with payment type
-    trans_session = TransactionSession()
-    new_transaction = Transaction(
-        items=json.dumps(items_data),
-        subtotal=subtotal,
-        tax=tax,
-        total=total,
-        payment_amount=total,
-        change_amount=0.0,
-        payment_type=payment_type
-    )
-    trans_session.add(new_transaction)
-    trans_session.commit()
-    trans_session.close()
-
-    # Clear cart
-    for item in cart_items:
-        cart_session.delete(item)
-    cart_session.commit()
-    cart_session.close()
+    try:
+        sales.checkout_cart(get_cart_store(), get_catalog(), terminal_id(), payment_type)
+    except sales.UnavailableProducts as e:
+        return f"{e}. Remove them from the cart and try again.", 409
+    except sales.SalePending:
+        return "Payment is still being recorded. Check the transactions list before charging again.", 202
+    except TimeoutError:
+        return "Payment was not recorded. Try again.", 503
 
     # Redirect back to customer page (blank slate)
     return redirect(url_for('customer'))
 
 
 # ---------------- TRANSACTIONS ROUTE ----------------
+def _parse_day(value, end_of_day=False):
+    if not value:
+        return None
+    day = datetime.strptime(value, '%Y-%m-%d')
+    return day.replace(hour=23, minute=59, second=59, microsecond=999999) if end_of_day else day
+
+
+def _transaction_filters(args):
+    """Query filters from ?start=&end=&payment_type=&min_total=&max_total=. Raises ValueError."""
+    filters = []
+    start = _parse_day(args.get('start'))
+    end = _parse_day(args.get('end'), end_of_day=True)
+    if start:
+        filters.append(Transaction.transaction_date >= start)
+    if end:
+        filters.append(Transaction.transaction_date <= end)
+    if args.get('payment_type'):
+        filters.append(Transaction.payment_type == args['payment_type'])
+    if args.get('min_total'):
+        filters.append(Transaction.total >= float(args['min_total']))
+    if args.get('max_total'):
+        filters.append(Transaction.total <= float(args['max_total']))
+    return filters
+
+
 @app.route('/transactions')
 def transactions():
+    """Newest first, PAGE_SIZE at a time; ?before=<date>_<id> continues after a row (keyset)."""
     session = TransactionSession()
-    all_transactions = session.query(Transaction).order_by(Transaction.transaction_date.desc()).all()
-
-    # Parse JSON items for each transaction
+    try:
+        filters = _transaction_filters(request.args)
+        before = request.args.get('before')
+        if before:
+            date_part, id_part = before.rsplit('_', 1)
+            filters.append(tuple_(Transaction.transaction_date, Transaction.id) <
+                           tuple_(datetime.fromisoformat(date_part), int(id_part)))
+    except ValueError:
+        session.close()
+        return 'Invalid filter value', 400
+
+    page = session.query(Transaction).options(selectinload(Transaction.lines)) \
+        .filter(*filters) \
+        .order_by(Transaction.transaction_date.desc(), Transaction.id.desc()) \
+        .limit(PAGE_SIZE + 1).all()
+    has_more = len(page) > PAGE_SIZE
+    page = page[:PAGE_SIZE]
+
+    # Items are decoded only for the rows on this page
     transactions_data = []
-    for trans in all_transactions:
+    for trans in page:
         transactions_data.append({
             'id': trans.id,
             'date': trans.transaction_date,
-            'item_list': json.loads(trans.items),  # Changed from 'items' to 'item_list'
+            'item_list': trans.item_list,
             'subtotal': trans.subtotal,
             'tax': trans.tax,
             'total': trans.total,
@@ -186,49 +236,288 @@ def transactions():
             'change_amount': trans.change_amount,
             'payment_type': trans.payment_type
         })
-
     session.close()
-    return render_template('transactions.html', transactions=transactions_data)
 
-# ---------------- CSV DOWNLOAD ROUTE ----------------
+    filter_args = {k: v for k, v in request.args.items() if k != 'before' and v}
+    next_url = None
+    if has_more:
+        last = page[-1]
+        next_url = url_for('transactions', before=f"{last.transaction_date.isoformat()}_{last.id}", **filter_args)
+
+    return render_template('transactions.html', transactions=transactions_data, payment_types=PAYMENT_TYPES,
+                           filters=filter_args, next_url=next_url,
+                           first_url=url_for('transactions', **filter_args) if before else None)
+
+# ---------------- EXPORT ROUTE ----------------
 @app.route('/transactions/download_csv')
+@app.route('/transactions/export')
 def download_csv():
+    """Stream the history; takes the /transactions filters plus ?format=csv|lines|parquet and ?gzip=1."""
+    try:
+        filters = _transaction_filters(request.args)
+    except ValueError:
+        return 'Invalid filter value', 400
+
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') == '1'
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    if fmt == 'parquet':
+        if not export.parquet_available():
+            return 'Parquet export needs pyarrow installed', 400
+        write, mimetype, filename = export.parquet_chunks, 'application/vnd.apache.parquet', f'transactions_{stamp}.parquet'
+        compress = False  # Parquet compresses its own pages
+    elif fmt in ('csv', 'lines'):
+        write = lambda session, filters: export.csv_chunks(session, filters, lines=(fmt == 'lines'))
+        mimetype = 'text/csv'
+        filename = f'transaction_lines_{stamp}.csv' if fmt == 'lines' else f'transactions_{stamp}.csv'
+    else:
+        return 'format must be csv, lines or parquet', 400
+
+    def generate():
+        session = TransactionSession()
+        try:
+            chunks = write(session, filters)
+            yield from export.gzip_chunks(chunks) if compress else chunks
+        finally:
+            session.close()
+
+    if compress:
+        mimetype, filename = 'application/gzip', filename + '.gz'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+# ---------------- POS API ----------------
+# JSON endpoints for scanner-driven lanes; one call per action, no page render.
+def _cart_json(terminal):
+    lines = get_cart_store().items(terminal)
+    subtotal, tax, total = sales.cart_totals(lines)
+    return {
+        'lines': [{'product_id': l.product_id, 'name': l.product_name, 'price': l.unit_price, 'qty': l.quantity}
+                  for l in lines],
+        'subtotal': round(subtotal, 2),
+        'tax': round(tax, 2),
+        'total': round(total, 2)
+    }
+
+
+def _scan_batch():
+    """[(product, quantity)] from {"items": [{"product_id": ..., "quantity": n}, ...]}, or an error response."""
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return None, (jsonify({'error': 'body must be a JSON object'}), 400)
+    items = body.get('items')
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({'error': 'items must be a non-empty list'}), 400)
+
+    catalog = get_catalog()
+    batch, unknown = [], []
+    for item in items:
+        code = str(item.get('product_id') or item.get('barcode') or '') if isinstance(item, dict) else ''
+        quantity = item.get('quantity', 1) if isinstance(item, dict) else None
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            return None, (jsonify({'error': f'quantity for {code or "item"} must be a positive integer'}), 400)
+        product = catalog.get(code)
+        if product is None:
+            unknown.append(code)
+        else:
+            batch.append((product, quantity))
+    if unknown:
+        return None, (jsonify({'error': 'unknown products', 'product_ids': unknown}), 404)
+    return batch, None
+
+
+@app.route('/api/scan/<code>')
+def lookup_product(code):
+    """Look up a scanned product code (the product_id is the barcode)."""
+    product = get_catalog().get(code)
+    if product is None:
+        return jsonify({'error': 'unknown product'}), 404
+    return jsonify({'product_id': product.product_id, 'name': product.product_name, 'price': product.unit_price})
+
+
+@app.route('/api/cart', methods=['GET', 'DELETE'])
+def api_cart():
+    terminal = terminal_id()
+    if request.method == 'DELETE':
+        get_cart_store().clear(terminal)
+    return jsonify(_cart_json(terminal))
+
+
+@app.route('/api/cart/add', methods=['POST'])
+def api_cart_add():
+    """Add a batch of scans; all-or-nothing if any product is unknown."""
+    batch, error = _scan_batch()
+    if error:
+        return error
+    terminal = terminal_id()
+    store = get_cart_store()
+    for product, quantity in batch:
+        store.add(terminal, product.product_id, product.product_name, product.unit_price, quantity)
+    return jsonify(_cart_json(terminal))
+
+
+@app.route('/api/cart/remove', methods=['POST'])
+def api_cart_remove():
+    """Remove quantities (a line disappears when it reaches zero)."""
+    batch, error = _scan_batch()
+    if error:
+        return error
+    terminal = terminal_id()
+    store = get_cart_store()
+    for product, quantity in batch:
+        store.remove(terminal, product.product_id, quantity)
+    return jsonify(_cart_json(terminal))
+
+
+@app.route('/api/checkout', methods=['POST'])
+def api_checkout():
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return jsonify({'error': 'body must be a JSON object'}), 400
+    payment_type = body.get('payment_type', 'Cash')
+    if payment_type not in PAYMENT_TYPES:
+        return jsonify({'error': f'payment_type must be one of {", ".join(PAYMENT_TYPES)}'}), 400
+
+    try:
+        trans = sales.checkout_cart(get_cart_store(), get_catalog(), terminal_id(), payment_type)
+    except sales.UnavailableProducts as e:
+        return jsonify({'error': 'products no longer for sale', 'products': e.names}), 409
+    except sales.SalePending:
+        return jsonify({'status': 'pending', 'error': 'sale is still being recorded; do not charge again'}), 202
+    except TimeoutError:
+        return jsonify({'error': 'sale was not recorded; try again'}), 503
+    if trans is None:
+        return jsonify({'error': 'cart is empty'}), 400
+
+    return jsonify({
+        'transaction_id': trans.id,
+        'subtotal': round(trans.subtotal, 2),
+        'tax': round(trans.tax, 2),
+        'total': round(trans.total, 2),
+        'payment_type': trans.payment_type
+    }), 201
+
+
+# ---------------- CATALOG API ----------------
+@app.route('/api/products')
+def product_catalog():
+    catalog = get_catalog()
+    return not_modified(catalog.etag) or with_etag(jsonify({
+        'version': catalog.version,
+        'products': [p._asdict() for p in catalog.products]
+    }), catalog.etag)
+
+
+# ---------------- PRODUCT SALES ROUTE ----------------
+@app.route('/api/products/<product_id>/sales')
+def product_sales(product_id):
+    """Units and revenue for one product, optionally bounded by ?start=&end= (YYYY-MM-DD)."""
     session = TransactionSession()
-    all_transactions = session.query(Transaction).order_by(Transaction.transaction_date.desc()).all()
-
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Write header
-    writer.writerow(['Transaction ID', 'Date', 'Items (JSON)', 'Subtotal', 'Tax', 'Total', 'Payment Amount', 'Change',
-                     'Payment Type'])
-
-    # Write data
-    for trans in all_transactions:
-        writer.writerow([
-            trans.id,
-            trans.transaction_date.strftime('%Y-%m-%d %H:%M:%S'),
-            trans.items,  # JSON string in one cell
-            f"{trans.subtotal:.2f}",
-            f"{trans.tax:.2f}",
-            f"{trans.total:.2f}",
-            f"{trans.payment_amount:.2f}",
-            f"{trans.change_amount:.2f}",
-            trans.payment_type
-        ])
-
+    query = session.query(
+        func.coalesce(func.sum(TransactionLine.quantity), 0),
+        func.coalesce(func.sum(TransactionLine.quantity * TransactionLine.unit_price), 0.0),
+        func.count(func.distinct(TransactionLine.transaction_id))
+    ).filter(TransactionLine.product_id == product_id)
+
+    start, end = request.args.get('start'), request.args.get('end')
+    try:
+        if start:
+            query = query.filter(TransactionLine.transaction_date >= datetime.strptime(start, '%Y-%m-%d'))
+        if end:
+            end_day = datetime.strptime(end, '%Y-%m-%d').replace(hour=23, minute=59, second=59, microsecond=999999)
+            query = query.filter(TransactionLine.transaction_date <= end_day)
+    except ValueError:
+        session.close()
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+
+    units, revenue, transactions_count = query.one()
+    session.close()
+    return jsonify({
+        'product_id': product_id,
+        'units_sold': units,
+        'revenue': round(revenue, 2),
+        'transactions': transactions_count
+    })
+
+
+# ---------------- REPORTS ROUTES ----------------
+def _report_range(args):
+    """(start, end) as YYYY-MM-DD strings; defaults to the last 30 days. Raises ValueError."""
+    end = _parse_day(args.get('end')) or datetime.now()
+    start = _parse_day(args.get('start')) or end - timedelta(days=29)
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+
+@app.route('/reports')
+def sales_reports():
+    try:
+        start, end = _report_range(request.args)
+    except ValueError:
+        return 'Invalid date', 400
+    session = TransactionSession()
+    daily = reports.daily_sales(session, start, end)
+    mix = reports.payment_mix(session, start, end)
+    top = reports.top_products(session, start, end)
+    hourly_day = request.args.get('day') or end
+    hourly = reports.hourly_sales(session, hourly_day)
     session.close()
+    return render_template('reports.html', start=start, end=end, daily=daily, mix=mix, top=top,
+                           hourly=hourly, hourly_day=hourly_day)
 
-    # Prepare file for download
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-    )
+
+@app.route('/api/reports/<kind>')
+def sales_reports_api(kind):
+    """kind is daily, hourly (?day=), payment_mix or top_products (?limit=); ranges via ?start=&end=."""
+    try:
+        start, end = _report_range(request.args)
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'start/end must be YYYY-MM-DD and limit an integer'}), 400
+
+    session = TransactionSession()
+    if kind == 'daily':
+        data = reports.daily_sales(session, start, end)
+    elif kind == 'hourly':
+        data = reports.hourly_sales(session, request.args.get('day') or end)
+    elif kind == 'payment_mix':
+        data = reports.payment_mix(session, start, end)
+    elif kind == 'top_products':
+        data = reports.top_products(session, start, end, limit)
+    else:
+        session.close()
+        return jsonify({'error': f'unknown report {kind}'}), 404
+    session.close()
+    return jsonify({'start': start, 'end': end, 'rows': data})
+
+
+# ---------------- APP FACTORY ----------------
+def create_app(config=None):
+    """Set up the app and its database for this process and return it.
+
+    Creating the engine opens no connection. INIT_SCHEMA migrates now and
+    then empties the pool, so a preloading master (gunicorn --preload
+    "app:create_app()") forks workers that each open their own
+    connections. One database per process. Every worker caches the
+    catalog and reloads it when another one changes products, but carts
+    live in the worker that served the scan: run a single worker, or pin
+    each terminal to one (see carts.py).
+    """
+    if 'metrics' in app.extensions:
+        if config and any(app.config.get(k) != v for k, v in config.items()):
+            raise RuntimeError('create_app() already configured this process with a different config')
+        return app
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    engine = configure_database(app.config['DATABASE_URL'], app.config['DB_POOL_SIZE'],
+                                app.config['DB_MAX_OVERFLOW'])
+    if app.config['INIT_SCHEMA']:
+        init_schema()
+        engine.dispose()
+    init_metrics(app, [engine], service='pos')
+    return app
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,207 @@
+# carts.py
+# ---------------------------------------------------------
+# In-process cart store, one cart per terminal. Scans only touch a dict
+# under a lock; abandoned carts expire after a TTL. Durability is a
+# write-behind snapshot into cart_items every few seconds (and at exit),
+# so a restart restores the carts as of the last snapshot.
+#
+# Carts live in the serving process: run one POS process per store, or
+# pin each terminal to a worker.
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import delete, insert
+
+from databases import SessionFactory, CartItem
+
+logger = logging.getLogger(__name__)
+
+CART_TTL_SECONDS = float(os.environ.get("POS_CART_TTL_SECONDS", 4 * 3600))
+CART_SNAPSHOT_SECONDS = float(os.environ.get("POS_CART_SNAPSHOT_SECONDS", 2))  # 0 disables persistence
+
+CartLine = namedtuple("CartLine", "product_id product_name unit_price quantity")
+
+
+class _Cart:
+    __slots__ = ("lines", "touched")
+
+    def __init__(self, now):
+        self.lines = {}          # product_id -> CartLine, in scan order
+        self.touched = now
+
+
+class CartStore:
+    """Thread-safe ``{terminal_id: cart}``. Lines are immutable, so callers may keep them."""
+
+    def __init__(self, ttl=CART_TTL_SECONDS):
+        self.ttl = ttl
+        self._carts = {}
+        self._dirty = set()      # terminals changed since the last snapshot
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self._writer = None
+
+    # ---------------- cart operations ----------------
+    def _cart(self, terminal, create):
+        """Caller holds the lock."""
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._evict(now)
+        cart = self._carts.get(terminal)
+        if cart is None and create:
+            cart = self._carts[terminal] = _Cart(now)
+        if cart is not None:
+            cart.touched = now
+        return cart
+
+    def items(self, terminal):
+        with self._lock:
+            cart = self._cart(terminal, create=False)
+            return list(cart.lines.values()) if cart else []
+
+    def add(self, terminal, product_id, product_name, unit_price, quantity=1):
+        """Add ``quantity`` of a product (merging with an existing line); returns the line."""
+        with self._lock:
+            cart = self._cart(terminal, create=True)
+            line = cart.lines.get(product_id)
+            if line:
+                line = line._replace(quantity=line.quantity + quantity)
+            else:
+                line = CartLine(product_id, product_name, unit_price, quantity)
+            cart.lines[product_id] = line
+            self._dirty.add(terminal)
+            return line
+
+    def remove(self, terminal, product_id, quantity=None):
+        """Drop a line, or only ``quantity`` of it. Returns the remaining line or None."""
+        with self._lock:
+            cart = self._cart(terminal, create=False)
+            line = cart.lines.get(product_id) if cart else None
+            if line is None:
+                return None
+            self._dirty.add(terminal)
+            if quantity is not None and quantity < line.quantity:
+                line = cart.lines[product_id] = line._replace(quantity=line.quantity - quantity)
+                return line
+            del cart.lines[product_id]
+            return None
+
+    def take(self, terminal):
+        """Remove and return a terminal's lines, so only one checkout can charge them."""
+        with self._lock:
+            cart = self._carts.pop(terminal, None)
+            if cart is None:
+                return []
+            self._dirty.add(terminal)
+            return list(cart.lines.values())
+
+    def put_back(self, terminal, lines):
+        """Undo take() after a failed checkout, merging with anything scanned since."""
+        for line in lines:
+            self.add(terminal, line.product_id, line.product_name, line.unit_price, line.quantity)
+
+    def clear(self, terminal):
+        with self._lock:
+            if self._carts.pop(terminal, None) is not None:
+                self._dirty.add(terminal)
+
+    def terminals(self):
+        with self._lock:
+            return len(self._carts)
+
+    # ---------------- expiry ----------------
+    def _evict(self, now):
+        expired = [t for t, cart in self._carts.items() if now - cart.touched > self.ttl]
+        for terminal in expired:
+            del self._carts[terminal]
+        self._dirty.update(expired)
+        self._next_sweep = now + min(self.ttl / 10, 60)
+
+    def evict_expired(self):
+        with self._lock:
+            self._evict(time.monotonic())
+
+    # ---------------- persistence ----------------
+    def restore(self):
+        """Load the last snapshot from cart_items."""
+        session = SessionFactory()
+        try:
+            rows = session.query(CartItem).order_by(CartItem.id).all()
+        finally:
+            session.close()
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                cart = self._carts.setdefault(row.session_id, _Cart(now))
+                cart.lines[row.product_id] = CartLine(row.product_id, row.product_name, row.unit_price, row.quantity)
+
+    def flush(self):
+        """Write every cart changed since the last flush; returns how many were written."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+
+        session = SessionFactory()
+        try:
+            # The delete takes SQLite's write lock before the carts are read: a sale that
+            # committed earlier has already taken its cart, and one committing later
+            # deletes what we write, so a paid cart is never written back
+            session.execute(delete(CartItem).where(CartItem.session_id.in_(list(dirty))))
+            with self._lock:
+                snapshot = {t: list(self._carts[t].lines.values()) if t in self._carts else [] for t in dirty}
+            rows = [
+                {"session_id": terminal, "product_id": line.product_id, "product_name": line.product_name,
+                 "unit_price": line.unit_price, "quantity": line.quantity}
+                for terminal, lines in snapshot.items() for line in lines
+            ]
+            if rows:
+                session.execute(insert(CartItem), rows)
+            session.commit()
+        except Exception:
+            session.rollback()
+            with self._lock:
+                self._dirty |= dirty     # retry on the next flush
+            raise
+        finally:
+            session.close()
+        return len(snapshot)
+
+    def start_write_behind(self, interval):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Cart snapshot failed")
+
+        self._writer = threading.Thread(target=run, name="cart-snapshot", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+
+# ---------------- SHARED STORE ----------------
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cart_store():
+    """The process-wide store, restored from the last snapshot on first use."""
+    global _store
+    store = _store
+    if store is None:
+        with _store_lock:
+            if _store is None:
+                store = CartStore()
+                if CART_SNAPSHOT_SECONDS > 0:
+                    store.restore()
+                    store.start_write_behind(CART_SNAPSHOT_SECONDS)
+                _store = store
+            store = _store
+    return store
@@ -0,0 +1,87 @@
+# catalog.py
+# ---------------------------------------------------------
+# Read-through product catalog cache. Loaded once, shared by every
+# request, and invalidated by the admin routes. Each load gets a content
+# ETag so pages built from it can answer If-None-Match with 304.
+#
+# The cache is per process. Product changes also bump the cache_version
+# row, and every request starts with sync_catalog(), so other workers
+# reload on their next request.
+
+import hashlib
+import threading
+from collections import namedtuple
+
+from sqlalchemy import text
+
+from databases import SessionFactory, Product
+
+CatalogProduct = namedtuple("CatalogProduct", "id product_id product_name unit_price")
+
+
+class Catalog:
+    def __init__(self, products, version):
+        self.products = tuple(products)                       # in admin (insertion) order
+        self.by_id = {p.product_id: p for p in self.products}
+        self.version = version
+        digest = hashlib.sha1(repr(self.products).encode("utf-8")).hexdigest()[:16]
+        self.etag = f"catalog-{digest}"
+
+    @classmethod
+    def load(cls, version):
+        session = SessionFactory()
+        try:
+            rows = session.query(Product.id, Product.product_id, Product.product_name, Product.unit_price) \
+                .order_by(Product.id).all()
+        finally:
+            session.close()
+        return cls((CatalogProduct(*row) for row in rows), version)
+
+    def get(self, product_id):
+        return self.by_id.get(product_id)
+
+
+_catalog = None
+_version = 0
+_lock = threading.Lock()
+_seen = None                # cache_version the cached catalog reflects
+
+_BUMP_SQL = text(
+    "INSERT INTO cache_version (id, version) VALUES (1, 1) "
+    "ON CONFLICT (id) DO UPDATE SET version = version + 1"
+)
+_READ_SQL = text("SELECT version FROM cache_version WHERE id = 1")
+
+
+def get_catalog():
+    """Return the cached catalog, loading it on first use after an invalidation."""
+    global _catalog
+    catalog = _catalog
+    if catalog is None:
+        with _lock:
+            if _catalog is None:
+                _catalog = Catalog.load(_version)
+            catalog = _catalog
+    return catalog
+
+
+def bump_catalog_version(session):
+    """Stage a version bump with a product change, so every worker reloads once it commits."""
+    session.execute(_BUMP_SQL)
+
+
+def sync_catalog(session):
+    """Drop the cache if the catalog changed, in any process, since this one last looked."""
+    global _seen
+    version = session.execute(_READ_SQL).scalar() or 0
+    if version != _seen:
+        invalidate_catalog()
+        _seen = version
+
+
+def invalidate_catalog():
+    """Drop the cache; call after committing any change to products."""
+    global _catalog, _version
+    with _lock:
+        _catalog = None
+        _version += 1
@@ -1,31 +1,141 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text
-from sqlalchemy.orm import declarative_base, sessionmaker
+import os
+import functools
+import itertools
+import json
+import sqlite3
+import threading
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, DateTime, Text, ForeignKey, Index
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship, Session as OrmSession
 from datetime import datetime
 
-# ---------------- PRODUCTS DATABASE ----------------
-ProductBase = declarative_base()
-product_engine = create_engine("sqlite:///products.db", connect_args={"check_same_thread": False})
-ProductSession = sessionmaker(bind=product_engine)
+# ---------------- ENGINE & SESSIONS ----------------
+# Products, transactions and carts share one SQLite file so a checkout can
+# write the sale and clear the cart atomically. Override with POS_DATABASE_URL
+# ("memory" = a private in-memory database).
+#
+# Importing this module opens nothing: configure() (called by create_app())
+# builds the engine, and sessions connect through get_engine() on first
+# use, which falls back to the environment and creates the schema for
+# scripts. Forked workers start with an empty pool of their own.
+DEFAULT_DATABASE_URL = "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "pos.db")
+DATABASE_URL = os.environ.get("POS_DATABASE_URL", DEFAULT_DATABASE_URL)
+POOL_SIZE = int(os.environ.get("POS_DB_POOL_SIZE", 10))
+MAX_OVERFLOW = int(os.environ.get("POS_DB_MAX_OVERFLOW", 20))
 
-class Product(ProductBase):
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",          # readers no longer block on the writer
+    "synchronous": "NORMAL",        # safe with WAL, one fsync per checkpoint
+    "cache_size": -64000,           # 64 MB page cache per connection
+    "mmap_size": 268435456,         # 256 MB memory-mapped reads
+    "busy_timeout": 5000,           # wait for the write lock instead of failing
+}
+
+_engine = None
+_engine_lock = threading.RLock()
+_schema_engine = None               # engine that init_schema() has already run against
+_memory_keeper = None               # an in-memory database is dropped with its last connection
+_memory_databases = itertools.count(1)
+
+
+def memory_url():
+    """A new in-memory database shared by every connection of this process."""
+    name = f"pos-{os.getpid()}-{next(_memory_databases)}"
+    if sqlite3.sqlite_version_info >= (3, 36):
+        # memdb VFS: ordinary file locking, so busy_timeout waits for the writer as on disk
+        return f"sqlite:///file:/{name}?vfs=memdb&uri=true"
+    # Older SQLite: shared cache, where a second writer fails at once ("database table is locked")
+    return f"sqlite:///file:{name}?mode=memory&cache=shared&uri=true"
+
+
+def configure(url=None, pool_size=None, max_overflow=None):
+    """Build the engine for ``url`` (default POS_DATABASE_URL), replacing any previous one; returns it."""
+    global _engine, _memory_keeper
+    url = url or DATABASE_URL
+    memory = url == "memory"
+    if memory:
+        url = memory_url()
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_pre_ping=True,
+        # SQLAlchemy picks a per-thread pool for mode=memory URLs; these are shared, so pool normally
+        **({"poolclass": QueuePool} if memory else {}),
+    )
+    if engine.dialect.name == "sqlite":
+        # memdb has no WAL, and asking for it needs the write lock: a connection opened mid-write would fail
+        pragmas = {k: v for k, v in SQLITE_PRAGMAS.items() if not (memory and k == "journal_mode")}
+        event.listen(engine, "connect", functools.partial(_set_sqlite_pragmas, pragmas))
+    with _engine_lock:
+        if _memory_keeper is not None:
+            _memory_keeper.close()
+        if _engine is not None:
+            _engine.dispose()
+        _engine = engine
+        _memory_keeper = engine.raw_connection() if memory else None
+    return engine
+
+
+def get_engine():
+    """The current engine; configured from the environment, schema included, if nobody has yet."""
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                configure()
+                init_schema()
+    return _engine
+
+
+def _set_sqlite_pragmas(pragmas, dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _after_fork():
+    # The parent's connections stay the parent's: drop them here without closing
+    global _memory_keeper
+    if _engine is not None:
+        _engine.dispose(close=False)
+    _memory_keeper = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class _Session(OrmSession):
+    """Session bound to the current engine at first use rather than at creation."""
+
+    def get_bind(self, *args, **kwargs):
+        return get_engine()
+
+
+Base = declarative_base()
+SessionFactory = sessionmaker(class_=_Session)
+
+# Request-scoped session, removed by the app's teardown handler.
+# The old per-database names are kept so existing call sites read the same.
+Session = scoped_session(SessionFactory)
+ProductSession = TransactionSession = CartSession = Session
+
+# ---------------- PRODUCTS ----------------
+class Product(Base):
     __tablename__ = "products"
     id = Column(Integer, primary_key=True)
     product_id = Column(String, unique=True)  # e.g., "P001"
     product_name = Column(String)
     unit_price = Column(Float)
 
-ProductBase.metadata.create_all(product_engine)
-
-# ---------------- TRANSACTIONS DATABASE ----------------
-TransactionBase = declarative_base()
-transaction_engine = create_engine("sqlite:///transactions.db", connect_args={"check_same_thread": False})
-TransactionSession = sessionmaker(bind=transaction_engine)
-
-class Transaction(TransactionBase):
+# ---------------- TRANSACTIONS ----------------
+class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True)
     transaction_date = Column(DateTime, default=datetime.now)
-    items = Column(Text)
+    items = Column(Text, nullable=True)  # Legacy JSON; NULL once moved to transaction_lines
     subtotal = Column(Float)
     tax = Column(Float, default=0.0)
     service_charge = Column(Float, default=0.0)
@@ -34,20 +144,117 @@ class Transaction(TransactionBase):
     change_amount = Column(Float)
     payment_type = Column(String, default="Cash")
 
-TransactionBase.metadata.create_all(transaction_engine)
+    lines = relationship("TransactionLine", back_populates="transaction",
+                         cascade="all, delete-orphan", order_by="TransactionLine.id")
+
+    __table_args__ = (
+        Index("ix_transactions_date_id", "transaction_date", "id"),  # Keyset pagination on /transactions
+    )
 
-# ---------------- PENDING TRANSACTION (CART) DATABASE ----------------
-CartBase = declarative_base()
-cart_engine = create_engine("sqlite:///cart.db", connect_args={"check_same_thread": False})
-CartSession = sessionmaker(bind=cart_engine)
+    @property
+    def item_list(self):
+        """Line items as dicts (product_name, quantity, unit_price), whichever storage holds them."""
+        if self.items:
+            return json.loads(self.items)
+        return [
+            {"product_id": l.product_id, "product_name": l.product_name,
+             "quantity": l.quantity, "unit_price": l.unit_price}
+            for l in self.lines
+        ]
 
-class CartItem(CartBase):
+class TransactionLine(Base):
+    __tablename__ = "transaction_lines"
+    id = Column(Integer, primary_key=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), index=True)
+    transaction_date = Column(DateTime)      # Copied from the header for date-bounded product queries
+    product_id = Column(String)              # Product.product_id, e.g. "P001"
+    product_name = Column(String)
+    quantity = Column(Integer)
+    unit_price = Column(Float)
+
+    transaction = relationship("Transaction", back_populates="lines")
+
+    __table_args__ = (
+        Index("ix_transaction_lines_product_date", "product_id", "transaction_date"),
+    )
+
+# ---------------- SALES ROLLUPS ----------------
+# Pre-aggregated by reports.record_sale() at checkout; rebuilt with `python reports.py --rebuild`.
+# Buckets are local-time strings: "YYYY-MM-DD HH:00" and "YYYY-MM-DD".
+class SalesHourly(Base):
+    __tablename__ = "sales_hourly"
+    hour = Column(String, primary_key=True)
+    payment_type = Column(String, primary_key=True)
+    transactions = Column(Integer, default=0)
+    subtotal = Column(Float, default=0.0)
+    tax = Column(Float, default=0.0)
+    total = Column(Float, default=0.0)
+
+class SalesDaily(Base):
+    __tablename__ = "sales_daily"
+    day = Column(String, primary_key=True)
+    payment_type = Column(String, primary_key=True)
+    transactions = Column(Integer, default=0)
+    subtotal = Column(Float, default=0.0)
+    tax = Column(Float, default=0.0)
+    total = Column(Float, default=0.0)
+
+class ProductSalesDaily(Base):
+    __tablename__ = "product_sales_daily"
+    day = Column(String, primary_key=True)
+    product_id = Column(String, primary_key=True)  # "" for legacy lines with no known product
+    product_name = Column(String)
+    units = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+
+# ---------------- SALES OUTBOX (POS -> MRP) ----------------
+# Units sold per product, written with each sale and drained by mrp/demand_bridge.py.
+class SalesOutbox(Base):
+    __tablename__ = "sales_outbox"
+    id = Column(Integer, primary_key=True)
+    transaction_id = Column(Integer)
+    product_id = Column(String)
+    quantity = Column(Integer)
+    created_at = Column(DateTime, default=datetime.now)
+
+    # The consumer tracks the last id it applied and prunes behind it, so ids must never be reused
+    __table_args__ = {"sqlite_autoincrement": True}
+
+# ---------------- PENDING TRANSACTION (CART) ----------------
+# Write-behind snapshot of the in-memory carts (see carts.py), one row per line.
+class CartItem(Base):
     __tablename__ = "cart_items"
     id = Column(Integer, primary_key=True)
     product_id = Column(String)
     product_name = Column(String)
     unit_price = Column(Float)
     quantity = Column(Integer)
-    session_id = Column(String, default="current")  # Allows multiple carts if needed
+    session_id = Column(String, default="current", index=True)  # Terminal id
+
+# ---------------- CACHE VERSION ----------------
+# Single row (id = 1), bumped with every product change so each worker's catalog cache can tell (see catalog.py).
+class CacheVersion(Base):
+    __tablename__ = "cache_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# ---------------- SCHEMA ----------------
+def init_schema():
+    """Create missing tables and indexes, once per engine per process."""
+    global _schema_engine
+    engine = get_engine()
+    with _engine_lock:
+        if _schema_engine is engine:
+            return
+        Base.metadata.create_all(engine)
+        # create_all() skips tables that already exist; add indexes introduced since
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
+        _schema_engine = engine
+
 
-CartBase.metadata.create_all(cart_engine)
\ No newline at end of file
+if __name__ == "__main__":
+    # Run once before starting the workers, then create_app({"INIT_SCHEMA": False})
+    init_schema()
+    print(f"✅ Schema ready in {get_engine().url}")
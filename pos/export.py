@@ -0,0 +1,181 @@
+# export.py
+# ---------------------------------------------------------
+# Streaming transaction export. Rows come off the database in
+# EXPORT_BATCH-sized chunks (yield_per) and are written out as they
+# arrive, so memory stays flat however many transactions match.
+#
+#   csv      one row per transaction, items as a JSON cell (the original layout)
+#   lines    one row per line item
+#   parquet  line items as Parquet row groups (needs pyarrow)
+#
+# Any text format can be gzip-compressed on the fly.
+
+import csv
+import io
+import itertools
+import json
+import zlib
+
+from sqlalchemy import select
+
+from databases import Transaction, TransactionLine
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+EXPORT_BATCH = 1000
+
+TRANSACTION_HEADER = ['Transaction ID', 'Date', 'Items (JSON)', 'Subtotal', 'Tax', 'Total', 'Payment Amount',
+                      'Change', 'Payment Type']
+LINE_HEADER = ['Transaction ID', 'Date', 'Product ID', 'Product Name', 'Quantity', 'Unit Price', 'Line Total',
+               'Payment Type']
+
+
+def parquet_available():
+    return pq is not None
+
+
+# ---------------- READING ----------------
+def iter_transactions(session, filters=()):
+    """Yield ``(header_row, items)`` newest first, streaming header+line rows in one query.
+
+    Transactions not yet backfilled still carry their items as JSON and
+    have no lines; both shapes come out as the same list of dicts.
+    """
+    stmt = select(
+        Transaction.id, Transaction.transaction_date, Transaction.items, Transaction.subtotal, Transaction.tax,
+        Transaction.total, Transaction.payment_amount, Transaction.change_amount, Transaction.payment_type,
+        TransactionLine.product_id, TransactionLine.product_name, TransactionLine.quantity,
+        TransactionLine.unit_price
+    ).outerjoin(TransactionLine, TransactionLine.transaction_id == Transaction.id) \
+        .where(*filters) \
+        .order_by(Transaction.transaction_date.desc(), Transaction.id.desc(), TransactionLine.id) \
+        .execution_options(yield_per=EXPORT_BATCH)
+
+    for _, rows in itertools.groupby(session.execute(stmt), key=lambda r: r.id):
+        rows = list(rows)
+        header = rows[0]
+        if header.items:
+            items = json.loads(header.items)
+        else:
+            items = [
+                {"product_id": r.product_id, "product_name": r.product_name,
+                 "quantity": r.quantity, "unit_price": r.unit_price}
+                for r in rows if r.product_name is not None
+            ]
+        yield header, items
+
+
+# ---------------- WRITERS ----------------
+def _csv_rows(session, filters, lines):
+    if lines:
+        yield LINE_HEADER
+        for t, items in iter_transactions(session, filters):
+            date = t.transaction_date.strftime('%Y-%m-%d %H:%M:%S')
+            for item in items:
+                yield [t.id, date, item.get('product_id') or '', item['product_name'], item['quantity'],
+                       f"{item['unit_price']:.2f}", f"{item['unit_price'] * item['quantity']:.2f}", t.payment_type]
+    else:
+        yield TRANSACTION_HEADER
+        for t, items in iter_transactions(session, filters):
+            yield [
+                t.id,
+                t.transaction_date.strftime('%Y-%m-%d %H:%M:%S'),
+                json.dumps(items),  # JSON string in one cell
+                f"{t.subtotal:.2f}",
+                f"{t.tax:.2f}",
+                f"{t.total:.2f}",
+                f"{t.payment_amount:.2f}",
+                f"{t.change_amount:.2f}",
+                t.payment_type
+            ]
+
+
+def csv_chunks(session, filters=(), lines=False):
+    """UTF-8 CSV, one chunk per EXPORT_BATCH rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for i, row in enumerate(_csv_rows(session, filters, lines), start=1):
+        writer.writerow(row)
+        if i % EXPORT_BATCH == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    """Gzip-compress a byte stream as it is produced."""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _Sink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def parquet_chunks(session, filters=()):
+    """Line items as Parquet, one row group per EXPORT_BATCH lines."""
+    schema = pa.schema([
+        ('transaction_id', pa.int64()), ('transaction_date', pa.timestamp('us')),
+        ('product_id', pa.string()), ('product_name', pa.string()), ('quantity', pa.int64()),
+        ('unit_price', pa.float64()), ('line_total', pa.float64()), ('payment_type', pa.string()),
+    ])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    columns = {name: [] for name in schema.names}
+
+    def write_batch():
+        writer.write_table(pa.table(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+        return sink.drain()
+
+    for t, items in iter_transactions(session, filters):
+        for item in items:
+            columns['transaction_id'].append(t.id)
+            columns['transaction_date'].append(t.transaction_date)
+            columns['product_id'].append(item.get('product_id'))
+            columns['product_name'].append(item['product_name'])
+            columns['quantity'].append(item['quantity'])
+            columns['unit_price'].append(item['unit_price'])
+            columns['line_total'].append(item['unit_price'] * item['quantity'])
+            columns['payment_type'].append(t.payment_type)
+        if len(columns['transaction_id']) >= EXPORT_BATCH:
+            yield write_batch()
+
+    if columns['transaction_id']:
+        yield write_batch()
+    writer.close()
+    yield sink.drain()
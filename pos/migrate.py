@@ -0,0 +1,112 @@
+# migrate.py
+# ---------------------------------------------------------
+# One-off merge of the legacy per-table SQLite files (products.db,
+# transactions.db, cart.db) into the consolidated database, and the
+# backfill of transaction_lines from the old JSON items column.
+#
+#   python migrate.py [legacy_dir]
+#   python migrate.py --backfill-lines
+
+import json
+import os
+import sys
+
+from sqlalchemy import text, insert, update, select
+
+from databases import get_engine, Product, Transaction, TransactionLine
+
+LEGACY_FILES = {
+    "products.db": ["products"],
+    "transactions.db": ["transactions"],
+    "cart.db": ["cart_items"],
+}
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.exec_driver_sql(f"PRAGMA {schema}.table_info({table})")]
+
+
+def merge_legacy_files(legacy_dir="."):
+    """ATTACH each legacy file and copy its tables with INSERT ... SELECT.
+
+    Rows keep their primary keys; ones already present are skipped, so
+    re-running the merge is harmless. Returns ``{table: rows_copied}``.
+    """
+    copied = {}
+    with get_engine().connect() as conn:
+        for filename, tables in LEGACY_FILES.items():
+            path = os.path.join(legacy_dir, filename)
+            if not os.path.exists(path):
+                continue
+
+            conn.execute(text("ATTACH DATABASE :path AS legacy"), {"path": path})
+            try:
+                for table in tables:
+                    source_cols = _columns(conn, "legacy", table)
+                    if not source_cols:
+                        continue
+                    cols = ", ".join(c for c in _columns(conn, "main", table) if c in source_cols)
+                    result = conn.exec_driver_sql(
+                        f"INSERT OR IGNORE INTO main.{table} ({cols}) SELECT {cols} FROM legacy.{table}"
+                    )
+                    copied[table] = result.rowcount
+                conn.commit()
+            finally:
+                conn.execute(text("DETACH DATABASE legacy"))
+    return copied
+
+
+def backfill_transaction_lines(batch_size=1000):
+    """Move ``Transaction.items`` JSON into transaction_lines, one batch per commit.
+
+    Walks unmigrated transactions by id (keyset, never OFFSET), so memory
+    stays flat and an interrupted run resumes where it stopped. Each
+    migrated header has its ``items`` cleared. Returns the number of
+    transactions migrated.
+    """
+    migrated = 0
+    last_id = 0
+    with get_engine().connect() as conn:
+        # Legacy JSON only has names; map them back to product codes where possible
+        product_ids = dict(conn.execute(select(Product.product_name, Product.product_id)).all())
+        while True:
+            batch = conn.execute(
+                select(Transaction.id, Transaction.transaction_date, Transaction.items)
+                .where(Transaction.id > last_id, Transaction.items.is_not(None))
+                .order_by(Transaction.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+
+            lines = []
+            for trans_id, date, items in batch:
+                for item in json.loads(items):
+                    lines.append({
+                        "transaction_id": trans_id,
+                        "transaction_date": date,
+                        "product_id": item.get("product_id") or product_ids.get(item.get("product_name")),
+                        "product_name": item.get("product_name"),
+                        "quantity": item.get("quantity"),
+                        "unit_price": item.get("unit_price"),
+                    })
+            if lines:
+                conn.execute(insert(TransactionLine), lines)
+            ids = [row[0] for row in batch]
+            conn.execute(update(Transaction).where(Transaction.id.in_(ids)).values(items=None))
+            conn.commit()
+
+            migrated += len(batch)
+            last_id = ids[-1]
+    return migrated
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--backfill-lines"]:
+        n = backfill_transaction_lines()
+        print(f"✅ {n} transaction(s) moved to transaction_lines")
+        sys.exit(0)
+    counts = merge_legacy_files(sys.argv[1] if len(sys.argv) > 1 else ".")
+    for table, n in counts.items():
+        print(f"{table}: {n} row(s) merged")
+    print(f"✅ Legacy databases merged into {get_engine().url}")
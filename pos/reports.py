@@ -0,0 +1,141 @@
+# reports.py
+# ---------------------------------------------------------
+# Sales rollups. Checkout folds each sale into the hourly, daily and
+# per-product tables inside its own transaction, so reports read a few
+# pre-aggregated rows instead of scanning the history.
+#
+#   python reports.py --rebuild     recompute every rollup from history
+
+import sys
+
+from sqlalchemy import func, delete, text
+from sqlalchemy.dialects.sqlite import insert
+
+from databases import get_engine, SessionFactory, SalesHourly, SalesDaily, ProductSalesDaily
+
+
+def _upsert(model, keys, totals, replace=()):
+    """INSERT ... ON CONFLICT DO UPDATE adding ``totals`` onto an existing row; run with executemany."""
+    stmt = insert(model)
+    set_ = {name: getattr(model, name) + stmt.excluded[name] for name in totals}
+    set_.update({name: stmt.excluded[name] for name in replace})
+    return stmt.on_conflict_do_update(index_elements=keys, set_=set_)
+
+
+_SALES_TOTALS = ("transactions", "subtotal", "tax", "total")
+
+
+# ---------------- INCREMENTAL ----------------
+def record_sales(session, transactions):
+    """Add transactions (with their lines) to the rollups; the caller commits.
+
+    Sales are summed per bucket first, so a batch costs three statements.
+    """
+    hourly, daily, products = {}, {}, {}
+    for t in transactions:
+        date = t.transaction_date
+        hour, day = date.strftime('%Y-%m-%d %H:00'), date.strftime('%Y-%m-%d')
+        for buckets, key in ((hourly, (hour, t.payment_type)), (daily, (day, t.payment_type))):
+            n, subtotal, tax, total = buckets.get(key, (0, 0.0, 0.0, 0.0))
+            buckets[key] = (n + 1, subtotal + t.subtotal, tax + t.tax, total + t.total)
+        for line in t.lines:
+            key = (day, line.product_id or "")
+            _, units, revenue = products.get(key, (None, 0, 0.0))
+            products[key] = (line.product_name, units + line.quantity, revenue + line.quantity * line.unit_price)
+
+    if hourly:
+        session.execute(_upsert(SalesHourly, ["hour", "payment_type"], _SALES_TOTALS), [
+            {"hour": h, "payment_type": p, **dict(zip(_SALES_TOTALS, v))} for (h, p), v in hourly.items()])
+        session.execute(_upsert(SalesDaily, ["day", "payment_type"], _SALES_TOTALS), [
+            {"day": d, "payment_type": p, **dict(zip(_SALES_TOTALS, v))} for (d, p), v in daily.items()])
+    if products:
+        session.execute(_upsert(ProductSalesDaily, ["day", "product_id"], ("units", "revenue"), ("product_name",)), [
+            {"day": d, "product_id": pid, "product_name": name, "units": units, "revenue": revenue}
+            for (d, pid), (name, units, revenue) in products.items()])
+
+
+# ---------------- REBUILD ----------------
+# Aggregation runs inside SQLite as one GROUP BY per table: no rows cross into Python.
+_REBUILD_SQL = [
+    "INSERT INTO sales_hourly (hour, payment_type, transactions, subtotal, tax, total) "
+    "SELECT strftime('%Y-%m-%d %H:00', transaction_date), payment_type, COUNT(*), "
+    "       SUM(subtotal), SUM(tax), SUM(total) "
+    "FROM transactions GROUP BY 1, 2",
+
+    "INSERT INTO sales_daily (day, payment_type, transactions, subtotal, tax, total) "
+    "SELECT substr(hour, 1, 10), payment_type, SUM(transactions), SUM(subtotal), SUM(tax), SUM(total) "
+    "FROM sales_hourly GROUP BY 1, 2",
+
+    "INSERT INTO product_sales_daily (day, product_id, product_name, units, revenue) "
+    "SELECT date(transaction_date), COALESCE(product_id, ''), MAX(product_name), "
+    "       SUM(quantity), SUM(quantity * unit_price) "
+    "FROM transaction_lines GROUP BY 1, 2",
+]
+
+
+def rebuild_rollups():
+    """Recompute all rollups from transactions and transaction_lines in one transaction.
+
+    Legacy JSON items are moved to transaction_lines first so they are counted.
+    """
+    from migrate import backfill_transaction_lines
+    backfill_transaction_lines()
+
+    with get_engine().begin() as conn:
+        for model in (SalesHourly, SalesDaily, ProductSalesDaily):
+            conn.execute(delete(model))
+        for sql in _REBUILD_SQL:
+            conn.execute(text(sql))
+
+
+# ---------------- QUERIES ----------------
+def daily_sales(session, start, end):
+    """``[{day, transactions, subtotal, tax, total}]`` for days in [start, end] (YYYY-MM-DD)."""
+    rows = session.query(
+        SalesDaily.day, func.sum(SalesDaily.transactions), func.sum(SalesDaily.subtotal),
+        func.sum(SalesDaily.tax), func.sum(SalesDaily.total)
+    ).filter(SalesDaily.day.between(start, end)).group_by(SalesDaily.day).order_by(SalesDaily.day).all()
+    return [{"day": d, "transactions": n, "subtotal": round(sub, 2), "tax": round(tax, 2), "total": round(tot, 2)}
+            for d, n, sub, tax, tot in rows]
+
+
+def hourly_sales(session, day):
+    """``[{hour, transactions, total}]`` for one day."""
+    rows = session.query(
+        SalesHourly.hour, func.sum(SalesHourly.transactions), func.sum(SalesHourly.total)
+    ).filter(SalesHourly.hour.between(f"{day} 00:00", f"{day} 23:00")) \
+        .group_by(SalesHourly.hour).order_by(SalesHourly.hour).all()
+    return [{"hour": h, "transactions": n, "total": round(tot, 2)} for h, n, tot in rows]
+
+
+def payment_mix(session, start, end):
+    """``[{payment_type, transactions, total, share}]``, largest first."""
+    rows = session.query(
+        SalesDaily.payment_type, func.sum(SalesDaily.transactions), func.sum(SalesDaily.total)
+    ).filter(SalesDaily.day.between(start, end)) \
+        .group_by(SalesDaily.payment_type).order_by(func.sum(SalesDaily.total).desc()).all()
+    grand = sum(tot for _, _, tot in rows) or 1.0
+    return [{"payment_type": p, "transactions": n, "total": round(tot, 2), "share": round(tot / grand, 4)}
+            for p, n, tot in rows]
+
+
+def top_products(session, start, end, limit=10):
+    """``[{product_id, product_name, units, revenue}]`` by revenue."""
+    rows = session.query(
+        ProductSalesDaily.product_id, func.max(ProductSalesDaily.product_name),
+        func.sum(ProductSalesDaily.units), func.sum(ProductSalesDaily.revenue)
+    ).filter(ProductSalesDaily.day.between(start, end)) \
+        .group_by(ProductSalesDaily.product_id) \
+        .order_by(func.sum(ProductSalesDaily.revenue).desc()).limit(limit).all()
+    return [{"product_id": pid, "product_name": name, "units": units, "revenue": round(rev, 2)}
+            for pid, name, units, rev in rows]
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["--rebuild"]:
+        sys.exit("usage: python reports.py --rebuild")
+    rebuild_rollups()
+    session = SessionFactory()
+    days = session.query(func.count(func.distinct(SalesDaily.day))).scalar()
+    session.close()
+    print(f"✅ Sales rollups rebuilt ({days} day(s) of history)")
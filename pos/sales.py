@@ -0,0 +1,235 @@
+# sales.py
+# ---------------------------------------------------------
+# Recording a sale. The header, its lines, the rollups, the MRP outbox
+# rows and the removal of the terminal's cart snapshot are written in one
+# transaction, so a sale is either fully recorded with its cart gone or
+# not recorded at all.
+#
+# With POS_GROUP_COMMIT_MS set, sales are handed to a single writer
+# thread that batches everything arriving within that window into one
+# transaction (one fsync), then wakes each caller once its sale is durable.
+# A caller that times out cancels its sale if the writer has not picked it
+# up yet; otherwise the sale is reported as pending, never retried.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session as OrmSession
+
+from databases import get_engine, SessionFactory, Transaction, TransactionLine, CartItem, SalesOutbox
+import reports
+
+TAX_RATE = 0.1  # 10% tax
+GROUP_COMMIT_MS = float(os.environ.get("POS_GROUP_COMMIT_MS", 0))  # 0 = commit each sale inline
+GROUP_COMMIT_MAX = int(os.environ.get("POS_GROUP_COMMIT_MAX", 256))
+COMMIT_TIMEOUT = 30  # seconds a caller waits for the writer
+
+
+class UnavailableProducts(ValueError):
+    """Cart holds products that have been removed from the catalog since they were scanned."""
+
+    def __init__(self, names):
+        self.names = names
+        super().__init__(f"No longer for sale: {', '.join(names)}")
+
+
+class SalePending(Exception):
+    """The writer is committing the sale but has not finished: it may still be recorded."""
+
+    def __init__(self, future):
+        self.future = future     # resolves to the transaction id, or the error that stopped it
+        super().__init__("Sale is still being recorded")
+
+
+def cart_totals(lines):
+    """(subtotal, tax, total) for cart lines."""
+    subtotal = sum((line.unit_price * line.quantity for line in lines), 0.0)
+    tax = subtotal * TAX_RATE
+    return subtotal, tax, subtotal + tax
+
+
+def build_transaction(lines, payment_type):
+    """An unsaved Transaction for priced cart lines."""
+    subtotal, tax, total = cart_totals(lines)
+    now = datetime.now()
+    return Transaction(
+        transaction_date=now,
+        lines=[
+            TransactionLine(
+                transaction_date=now,
+                product_id=line.product_id,
+                product_name=line.product_name,
+                quantity=line.quantity,
+                unit_price=line.unit_price
+            )
+            for line in lines
+        ],
+        subtotal=subtotal,
+        tax=tax,
+        total=total,
+        payment_amount=total,
+        change_amount=0.0,
+        payment_type=payment_type
+    )
+
+
+def save_sales(session, sales):
+    """Stage ``[(terminal, transaction)]`` on ``session`` and commit; returns the new ids.
+
+    Use a session with ``expire_on_commit=False`` if the transactions are read afterwards.
+    """
+    transactions = [t for _, t in sales]
+    session.add_all(transactions)
+    reports.record_sales(session, transactions)
+    session.execute(delete(CartItem).where(CartItem.session_id.in_({terminal for terminal, _ in sales})))
+    session.flush()
+    ids = [t.id for t in transactions]
+    session.execute(insert(SalesOutbox), [
+        {"transaction_id": t.id, "product_id": line.product_id, "quantity": line.quantity,
+         "created_at": t.transaction_date}
+        for t in transactions for line in t.lines
+    ])
+    session.commit()
+    return ids
+
+
+def checkout_cart(store, catalog, terminal, payment_type):
+    """Price a terminal's cart from ``catalog`` and record it as a sale.
+
+    Returns the committed Transaction (detached), or None for an empty
+    cart. The cart is taken from ``store`` first, so a concurrent or
+    repeated checkout finds it empty; on any failure it is put back. On
+    SalePending it is only put back if that sale ends up failing.
+    """
+    lines = store.take(terminal)
+    if not lines:
+        return None
+    try:
+        missing = [line.product_name for line in lines if catalog.get(line.product_id) is None]
+        if missing:
+            raise UnavailableProducts(missing)
+        # Price every line from the catalog as it is now, not as it was when scanned
+        priced = [
+            line._replace(product_name=product.product_name, unit_price=product.unit_price)
+            for line, product in ((line, catalog.get(line.product_id)) for line in lines)
+        ]
+        transaction = build_transaction(priced, payment_type)
+        commit_sale(terminal, transaction)
+    except SalePending as e:
+        def put_back_if_failed(future):
+            if future.exception() is not None:
+                store.put_back(terminal, lines)
+        e.future.add_done_callback(put_back_if_failed)
+        raise
+    except Exception:
+        store.put_back(terminal, lines)
+        raise
+    return transaction
+
+
+# ---------------- GROUP COMMIT ----------------
+class GroupCommitWriter:
+    """Single writer thread that commits queued sales in batches."""
+
+    def __init__(self, window_ms=GROUP_COMMIT_MS, max_batch=GROUP_COMMIT_MAX):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sale-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, terminal, transaction):
+        future = Future()
+        self._queue.put((terminal, transaction, future))
+        return future
+
+    def _collect(self):
+        """The next batch, minus sales whose callers gave up (cancelled) while they were queued."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # From here on a caller can no longer cancel: a timeout reports the sale as pending
+        return [item for item in batch if item[2].set_running_or_notify_cancel()]
+
+    def _run(self):
+        # One dedicated connection; with fsync amortized over the batch it can afford FULL sync
+        engine = get_engine()
+        with engine.connect() as conn:
+            if engine.dialect.name == "sqlite":
+                conn.exec_driver_sql("PRAGMA synchronous=FULL")
+                conn.commit()
+            while True:
+                batch = self._collect()
+                if batch:
+                    self._commit(conn, batch)
+
+    def _commit(self, conn, batch):
+        session = OrmSession(bind=conn, expire_on_commit=False)
+        try:
+            ids = save_sales(session, [(terminal, t) for terminal, t, _ in batch])
+            error = None
+        except Exception as e:
+            session.rollback()
+            error = e
+        finally:
+            session.close()
+
+        if error is None:
+            for (_, _, future), trans_id in zip(batch, ids):
+                future.set_result(trans_id)
+        elif len(batch) > 1:
+            for item in batch:              # isolate the bad sale; the rest still commit
+                self._commit(conn, [item])
+        else:
+            batch[0][2].set_exception(error)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = GroupCommitWriter()
+        return _writer
+
+
+def commit_sale(terminal, transaction):
+    """Durably record one sale and return its id, inline or through the group-commit writer.
+
+    Raises TimeoutError if the writer never picked the sale up (it is
+    cancelled and will not be recorded), or SalePending if it is still
+    committing it.
+    """
+    if GROUP_COMMIT_MS > 0:
+        future = _get_writer().submit(terminal, transaction)
+        try:
+            return future.result(timeout=COMMIT_TIMEOUT)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise TimeoutError(f"Sale not recorded within {COMMIT_TIMEOUT}s") from None
+            if not future.done():
+                raise SalePending(future) from None
+            return future.result()
+    session = SessionFactory(expire_on_commit=False)  # the caller still reads the saved sale
+    try:
+        return save_sales(session, [(terminal, transaction)])[0]
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -0,0 +1,24 @@
+# test_api_bodies.py
+# ---------------------------------------------------------
+# JSON endpoints answer 400, not 500, to bodies that are not objects.
+
+import pytest
+
+HEADERS = {"X-Terminal-Id": "T1"}
+
+
+@pytest.mark.parametrize("url", ["/api/cart/add", "/api/cart/remove", "/api/checkout"])
+@pytest.mark.parametrize("body", [[{"product_id": "P001"}], "P001", 3])
+def test_non_object_bodies_are_rejected(client, products, url, body):
+    response = client.post(url, json=body, headers=HEADERS)
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "body must be a JSON object"}
+
+
+def test_object_bodies_still_work(client, products):
+    response = client.post("/api/cart/add", json={"items": [{"product_id": "P001", "quantity": 2}]}, headers=HEADERS)
+    assert response.status_code == 200 and response.get_json()["total"] == 5.5
+
+    response = client.post("/api/checkout", json={"payment_type": "Cash"}, headers=HEADERS)
+    assert response.status_code == 201 and response.get_json()["total"] == 5.5
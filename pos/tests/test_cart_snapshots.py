@@ -0,0 +1,47 @@
+# test_cart_snapshots.py
+# ---------------------------------------------------------
+# The write-behind cart snapshot restores open carts after a restart and
+# never brings back one that has been paid for.
+
+from sqlalchemy import event
+
+import sales
+from carts import CartStore
+from catalog import get_catalog
+from databases import CartItem, Transaction, get_engine
+
+
+def test_flushed_carts_are_restored(products):
+    store = CartStore()
+    store.add("T1", "P001", "Coffee", 2.5, 2)
+    store.add("T2", "P002", "Bagel", 4.0)
+    assert store.flush() == 2
+
+    restored = CartStore()
+    restored.restore()
+    assert [(line.product_id, line.quantity) for line in restored.items("T1")] == [("P001", 2)]
+    assert [(line.product_id, line.quantity) for line in restored.items("T2")] == [("P002", 1)]
+
+
+def test_flush_never_writes_back_a_cart_paid_for_mid_flush(session, products):
+    store = CartStore()
+    store.add("T1", "P001", "Coffee", 2.5, 2)
+    checkouts = []
+
+    def check_out_first(conn, cursor, statement, *args):
+        # The sale commits after flush() has started but before its first write
+        if statement.startswith("DELETE FROM cart_items") and not checkouts:
+            checkouts.append("T1")
+            sales.checkout_cart(store, get_catalog(), "T1", "Cash")
+
+    event.listen(get_engine(), "before_cursor_execute", check_out_first)
+    try:
+        store.flush()
+    finally:
+        event.remove(get_engine(), "before_cursor_execute", check_out_first)
+
+    assert session.query(Transaction).count() == 1
+    assert session.query(CartItem).count() == 0
+    restored = CartStore()
+    restored.restore()
+    assert restored.items("T1") == []
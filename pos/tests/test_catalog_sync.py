@@ -0,0 +1,42 @@
+# test_catalog_sync.py
+# ---------------------------------------------------------
+# Product changes made by another worker reach this one's catalog cache
+# on its next request.
+
+from sqlalchemy import insert, text
+
+from databases import Product, get_engine
+
+
+def change_products_from_another_worker(bump=True):
+    with get_engine().begin() as conn:
+        conn.execute(insert(Product.__table__), [{"product_id": "P003", "product_name": "Tea", "unit_price": 2.0}])
+        if bump:
+            conn.execute(text("INSERT INTO cache_version (id, version) VALUES (1, 1) "
+                              "ON CONFLICT (id) DO UPDATE SET version = version + 1"))
+
+
+def test_another_workers_product_change_reloads_the_catalog(client, products):
+    assert client.get("/api/scan/P001").status_code == 200
+
+    change_products_from_another_worker()
+
+    response = client.get("/api/scan/P003")
+    assert response.status_code == 200 and response.get_json()["name"] == "Tea"
+
+
+def test_unversioned_writes_stay_cached(client, products):
+    assert client.get("/api/scan/P001").status_code == 200
+
+    change_products_from_another_worker(bump=False)
+
+    assert client.get("/api/scan/P003").status_code == 404
+
+
+def test_admin_changes_bump_the_version(client, products):
+    client.post("/admin/add_product", data={"product_id": "P009", "product_name": "Juice", "unit_price": "3"})
+    with get_engine().connect() as conn:
+        version = conn.execute(text("SELECT version FROM cache_version")).scalar()
+
+    assert version == 1
+    assert client.get("/api/scan/P009").status_code == 200
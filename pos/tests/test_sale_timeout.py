@@ -0,0 +1,102 @@
+# test_sale_timeout.py
+# ---------------------------------------------------------
+# A checkout that times out waiting for the group-commit writer must
+# never leave a sale that can be charged twice.
+
+import threading
+
+import pytest
+
+import sales
+from carts import CartStore
+from catalog import get_catalog
+from databases import Transaction
+
+
+@pytest.fixture
+def writer(app, monkeypatch):
+    """A group-commit writer whose save_sales waits for ``release`` (``entered`` is set once it does)."""
+    monkeypatch.setattr(sales, "GROUP_COMMIT_MS", 1)
+    monkeypatch.setattr(sales, "COMMIT_TIMEOUT", 0.2)
+    entered, release = threading.Event(), threading.Event()
+    save_sales = sales.save_sales
+    failures = []
+
+    def slow_save(session, batch):
+        entered.set()
+        release.wait(5)
+        if failures:
+            raise failures.pop()
+        return save_sales(session, batch)
+
+    monkeypatch.setattr(sales, "save_sales", slow_save)
+    writer = sales._get_writer()
+    writer.entered, writer.release, writer.failures = entered, release, failures
+    return writer
+
+
+def cart_with_coffee(terminal="T1"):
+    store = CartStore()
+    store.add(terminal, "P001", "Coffee", 2.5, 2)
+    return store
+
+
+def wait_for(future):
+    done = threading.Event()
+    future.add_done_callback(lambda _: done.set())     # runs after checkout_cart's own callback
+    assert done.wait(5)
+
+
+def test_timeout_while_queued_cancels_the_sale(session, products, writer):
+    blocker = writer.submit("T0", sales.build_transaction([], "Cash"))
+    assert writer.entered.wait(5)
+    store = cart_with_coffee()
+
+    with pytest.raises(TimeoutError):
+        sales.checkout_cart(store, get_catalog(), "T1", "Cash")
+    assert [line.quantity for line in store.items("T1")] == [2]      # safe to charge again
+
+    writer.release.set()
+    blocker.result(timeout=5)
+    writer.submit("T2", sales.build_transaction([], "Cash")).result(timeout=5)   # queued behind the cancelled sale
+    assert session.query(Transaction).count() == 2
+
+
+def test_timeout_while_committing_reports_pending(session, products, writer):
+    store = cart_with_coffee()
+
+    with pytest.raises(sales.SalePending) as pending:
+        sales.checkout_cart(store, get_catalog(), "T1", "Cash")
+    assert store.items("T1") == []                                      # not put back: it may still commit
+
+    writer.release.set()
+    wait_for(pending.value.future)
+    assert pending.value.future.result() == session.query(Transaction.id).scalar()
+    assert store.items("T1") == []
+
+
+def test_pending_sale_that_fails_puts_the_cart_back(products, writer):
+    writer.failures.append(RuntimeError("disk full"))
+    store = cart_with_coffee()
+
+    with pytest.raises(sales.SalePending) as pending:
+        sales.checkout_cart(store, get_catalog(), "T1", "Cash")
+
+    writer.release.set()
+    wait_for(pending.value.future)
+    assert [line.quantity for line in store.items("T1")] == [2]
+
+
+def test_api_checkout_reports_a_pending_sale(client, products, monkeypatch):
+    def pending(terminal, transaction):
+        raise sales.SalePending(sales.Future())
+
+    monkeypatch.setattr(sales, "commit_sale", pending)
+    headers = {"X-Terminal-Id": "T1"}
+    assert client.post("/api/cart/add", json={"items": [{"product_id": "P001"}]}, headers=headers).status_code == 200
+
+    response = client.post("/api/checkout", json={}, headers=headers)
+
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "pending"
+    assert client.get("/api/cart", headers=headers).get_json()["lines"] == []
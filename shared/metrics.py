@@ -0,0 +1,311 @@
+# metrics.py
+# ---------------------------------------------------------
+# Request, SQL and template instrumentation shared by the MRP and POS
+# apps, exposed in Prometheus text format on /metrics.
+#
+#   init_metrics(app, [engine], service="pos")
+#
+# Per route: a latency histogram, request counts by status, and the SQL
+# statement count/time spent inside those requests. Per template: a
+# render-time histogram. Statements slower than SLOW_QUERY_MS are logged.
+#
+# With METRICS_PROFILING=1, adding ?profile=1 to any URL samples that
+# request's stack every PROFILE_INTERVAL_MS and returns the hottest
+# frames instead of the page.
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs
+
+from flask import Response, request, before_render_template, template_rendered
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+PROFILING = os.environ.get("METRICS_PROFILING") == "1"
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 1))
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_log = logging.getLogger("metrics.slow_query")
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    inner = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+class Metrics:
+    """Process-wide registry; every method is thread-safe."""
+
+    def __init__(self, service):
+        self.service = service
+        self._lock = threading.Lock()
+        self.latency = defaultdict(Histogram)       # (endpoint, method) -> Histogram
+        self.requests = Counter()                   # (endpoint, method, status) -> n
+        self.sql_count = Counter()                  # endpoint -> statements
+        self.sql_seconds = Counter()                # endpoint -> seconds
+        self.slow_queries = Counter()               # endpoint -> statements over the threshold
+        self.render = defaultdict(Histogram)        # template -> Histogram
+
+    def record_request(self, endpoint, method, status, seconds, sql_count, sql_seconds):
+        with self._lock:
+            self.latency[(endpoint, method)].observe(seconds)
+            self.requests[(endpoint, method, status)] += 1
+            self.sql_count[endpoint] += sql_count
+            self.sql_seconds[endpoint] += sql_seconds
+
+    def record_background_sql(self, seconds):
+        with self._lock:
+            self.sql_count["(background)"] += 1
+            self.sql_seconds["(background)"] += seconds
+
+    def record_slow(self, endpoint):
+        with self._lock:
+            self.slow_queries[endpoint] += 1
+
+    def record_render(self, template, seconds):
+        with self._lock:
+            self.render[template].observe(seconds)
+
+    def exposition(self):
+        """Prometheus text exposition format 0.0.4."""
+        svc = self.service
+        out = []
+        with self._lock:
+            out.append("# HELP http_request_duration_seconds Request latency by route.")
+            out.append("# TYPE http_request_duration_seconds histogram")
+            for (endpoint, method), h in sorted(self.latency.items()):
+                _histogram(out, "http_request_duration_seconds", h, service=svc, endpoint=endpoint, method=method)
+
+            out.append("# HELP http_requests_total Requests by route and status.")
+            out.append("# TYPE http_requests_total counter")
+            for (endpoint, method, status), n in sorted(self.requests.items()):
+                out.append(f"http_requests_total{_labels(service=svc, endpoint=endpoint, method=method, status=status)} {n}")
+
+            out.append("# HELP db_statements_total SQL statements executed, by route.")
+            out.append("# TYPE db_statements_total counter")
+            for endpoint, n in sorted(self.sql_count.items()):
+                out.append(f"db_statements_total{_labels(service=svc, endpoint=endpoint)} {n}")
+
+            out.append("# HELP db_statement_seconds_total Time spent executing SQL, by route.")
+            out.append("# TYPE db_statement_seconds_total counter")
+            for endpoint, s in sorted(self.sql_seconds.items()):
+                out.append(f"db_statement_seconds_total{_labels(service=svc, endpoint=endpoint)} {s:.6f}")
+
+            out.append(f"# HELP db_slow_statements_total SQL statements slower than {SLOW_QUERY_MS:g} ms.")
+            out.append("# TYPE db_slow_statements_total counter")
+            for endpoint, n in sorted(self.slow_queries.items()):
+                out.append(f"db_slow_statements_total{_labels(service=svc, endpoint=endpoint)} {n}")
+
+            out.append("# HELP template_render_seconds Jinja render time by template.")
+            out.append("# TYPE template_render_seconds histogram")
+            for template, h in sorted(self.render.items()):
+                _histogram(out, "template_render_seconds", h, service=svc, template=template)
+        return "\n".join(out) + "\n"
+
+
+def _histogram(out, name, h, **labels):
+    cumulative = 0
+    for bound, n in zip(BUCKETS, h.counts):
+        cumulative += n
+        out.append(f"{name}_bucket{_labels(**labels, le=repr(bound))} {cumulative}")
+    out.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {h.count}")
+    out.append(f"{name}_sum{_labels(**labels)} {h.sum:.6f}")
+    out.append(f"{name}_count{_labels(**labels)} {h.count}")
+
+
+# ---------------- per-request state ----------------
+# Thread-local rather than flask.g so SQL run while a streamed response
+# is being generated is still charged to the request that started it.
+_local = threading.local()
+
+
+class _RequestStats:
+    __slots__ = ("endpoint", "started", "status", "sql_count", "sql_seconds", "renders")
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.status = None
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.renders = []               # start times of templates being rendered
+
+
+def _instrument_engine(engine, metrics):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = getattr(_local, "stats", None)
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += elapsed
+        else:
+            metrics.record_background_sql(elapsed)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            endpoint = stats.endpoint if stats else "(background)"
+            metrics.record_slow(endpoint)
+            slow_log.warning("%s: %.1f ms: %s", endpoint, elapsed * 1000, " ".join(statement.split())[:500])
+
+
+# ---------------- sampling profiler ----------------
+class _Sampler:
+    """Samples one thread's stack on a timer; cheap enough to leave running for a request."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.own = Counter()            # frame where the thread was executing
+        self.total = Counter()          # every frame on the stack
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+
+    def __enter__(self):
+        # The sampler needs the GIL to look; shorten the switch interval so it gets it on time
+        self._switch = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch, self.interval))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.own[_where(frame)] += 1
+            seen = set()
+            while frame is not None:
+                where = _where(frame)
+                if where not in seen:
+                    seen.add(where)
+                    self.total[where] += 1
+                frame = frame.f_back
+
+    def report(self, elapsed, limit=25):
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms over {elapsed * 1000:.1f} ms", ""]
+        for title, counts in (("Self (where the time is spent)", self.own),
+                              ("Cumulative (on the stack)", self.total)):
+            lines.append(title)
+            for where, n in counts.most_common(limit):
+                lines.append(f"  {100.0 * n / max(self.samples, 1):5.1f}%  {n:6d}  {where}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+def _where(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+# ---------------- Flask wiring ----------------
+def init_metrics(app, engines, service=None):
+    """Instrument ``app`` and ``engines`` and register GET /metrics. Returns the Metrics registry."""
+    metrics = Metrics(service or app.import_name)
+    for engine in engines:
+        _instrument_engine(engine, metrics)
+
+    def _start_request():
+        _local.stats = _RequestStats(request.endpoint or "(unmatched)")
+
+    # Ahead of the app's own hooks, so the SQL they run counts for the route
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+
+    @app.teardown_request
+    def _finish_request(exc=None):
+        stats = getattr(_local, "stats", None)
+        _local.stats = None
+        if stats is None or stats.endpoint == "metrics":
+            return
+        status = stats.status or (500 if exc else 200)
+        metrics.record_request(stats.endpoint, request.method, status,
+                               time.perf_counter() - stats.started, stats.sql_count, stats.sql_seconds)
+
+    @app.after_request
+    def _remember_status(response):
+        stats = getattr(_local, "stats", None)
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    @before_render_template.connect_via(app)
+    def _render_started(sender, template, context, **extra):
+        stats = getattr(_local, "stats", None)
+        if stats is not None:
+            stats.renders.append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def _render_finished(sender, template, context, **extra):
+        stats = getattr(_local, "stats", None)
+        if stats is not None and stats.renders:
+            metrics.record_render(template.name or "(string)", time.perf_counter() - stats.renders.pop())
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(metrics.exposition(), mimetype="text/plain; version=0.0.4")
+
+    if PROFILING:
+        _enable_profiling(app)
+
+    app.extensions["metrics"] = metrics
+    return metrics
+
+
+def _enable_profiling(app):
+    """Wrap the WSGI app so ?profile=1 returns a sampled profile of the request."""
+    wsgi_app = app.wsgi_app
+
+    def profiled(environ, start_response):
+        if parse_qs(environ.get("QUERY_STRING", "")).get("profile") != ["1"]:
+            return wsgi_app(environ, start_response)
+
+        def swallow(status, headers, exc_info=None):
+            return lambda data: None
+
+        started = time.perf_counter()
+        with _Sampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0) as sampler:
+            body = wsgi_app(environ, swallow)
+            try:
+                for _ in body:              # run the whole response, streamed ones included
+                    pass
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+        report = sampler.report(time.perf_counter() - started).encode("utf-8")
+        start_response("200 OK", [("Content-Type", "text/plain; charset=utf-8"),
+                                  ("Content-Length", str(len(report)))])
+        return [report]
+
+    app.wsgi_app = profiled